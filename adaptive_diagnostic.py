@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import math
+import sqlite3
+import datetime
+import numpy as np
+from notebook_adapter import route_specialty
+from challenge_provider import DEFAULT_USER
+
+DB_PATH = 'temario.db'
+
+# Test adaptativo (CAT) con modelo de Rasch: P(acierto) = 1 / (1 + exp(-(theta - b)))
+SE_TARGET = float(os.getenv("CAT_SE_TARGET", "0.5"))  # stop once the pooled ability's SE is below this...
+MIN_SPECIALTY_ITEMS = int(os.getenv("CAT_MIN_SPECIALTY_ITEMS", "2")) # ...and every specialty got this many items
+MAX_ITEMS = int(os.getenv("CAT_MAX_ITEMS", "20"))     # never longer than the fixed simulacro
+MIN_PRIORITY = 80
+GRID = np.linspace(-4.0, 4.0, 161)
+SPECIALTY_PRIOR_SD = 0.7  # specialties shrink towards the pooled ability
+PRIOR_PASS_RATE = 0.6     # item difficulty prior (topics without review history)
+PRIOR_WEIGHT = 3.0        # pseudo-reviews behind that prior
+
+def item_difficulty(passes, fails):
+    """Rasch b from review history, smoothed towards PRIOR_PASS_RATE."""
+    p = (passes + PRIOR_PASS_RATE * PRIOR_WEIGHT) / (passes + fails + PRIOR_WEIGHT)
+    return -math.log(p / (1 - p))
+
+def load_items(db_path=DB_PATH, min_priority=MIN_PRIORITY):
+    """Candidate topics (priority index range scan) with specialty and difficulty.
+
+    Difficulty comes from review_log (rating 1 = fail) in one grouped query.
+    idx_topics_priority is created by agent_srs.setup_db.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    c = conn.cursor()
+    rows = c.execute('SELECT id, title, priority FROM topics WHERE priority >= ? ORDER BY priority DESC, id',
+                     (min_priority,)).fetchall()
+    history = {}
+    if c.execute("SELECT 1 FROM sqlite_master WHERE name = 'review_log'").fetchone():
+        history = {r[0]: (r[1], r[2]) for r in c.execute('''
+            SELECT topic_id, SUM(rating > 1), SUM(rating = 1) FROM review_log
+            WHERE topic_id IS NOT NULL GROUP BY topic_id
+        ''')}
+    conn.close()
+    return [{
+        "id": topic_id,
+        "title": title,
+        "priority": priority,
+        "specialty": route_specialty(title),
+        "b": item_difficulty(*history.get(topic_id, (0, 0)))
+    } for topic_id, title, priority in rows]
+
+def eap(responses, prior_mean=0.0, prior_sd=1.0):
+    """Expected-a-posteriori ability and its SE (posterior SD) on GRID.
+
+    responses: list of (b, correct).
+    """
+    log_post = -0.5 * ((GRID - prior_mean) / prior_sd) ** 2
+    for b, correct in responses:
+        p = 1.0 / (1.0 + np.exp(-(GRID - b)))
+        log_post += np.log(p if correct else 1.0 - p)
+    w = np.exp(log_post - log_post.max())
+    w /= w.sum()
+    theta = float((GRID * w).sum())
+    return theta, float(math.sqrt(((GRID - theta) ** 2 * w).sum()))
+
+class AdaptiveSession:
+    """Computerized-adaptive diagnostic over specialties.
+
+    Each specialty keeps its own ability estimate (EAP, prior centred on the
+    pooled ability of all answers). next_item() picks the specialty with the
+    fewest items (until each has min_specialty_items), then the one with the
+    largest SE and, inside it, the topic with maximum Fisher information
+    p(1-p) at the current estimate (b closest to theta; ties -> priority).
+    The test stops when the pooled SE is below se_target and every specialty
+    has its minimum, or at max_items. (A per-specialty SE target can't be met
+    in 20 items: with the 0.7 prior SD each specialty needs ~5 answers.)
+    """
+
+    def __init__(self, items, se_target=SE_TARGET, max_items=MAX_ITEMS, specialties=None,
+                 min_specialty_items=MIN_SPECIALTY_ITEMS):
+        self.items = [i for i in items if not specialties or i['specialty'] in specialties]
+        self.se_target = se_target
+        self.max_items = max_items
+        self.min_specialty_items = min_specialty_items
+        self.responses = [] # (item, correct)
+        self.excluded = set()
+
+    def pooled(self, responses=None):
+        """(theta, se) over every answer, ignoring specialties."""
+        responses = self.responses if responses is None else responses
+        return eap([(item['b'], ok) for item, ok in responses])
+
+    def estimates(self, responses=None):
+        responses = self.responses if responses is None else responses
+        pooled, _ = self.pooled(responses)
+        out = {}
+        for spec in sorted({i['specialty'] for i in self.items}):
+            answered = [(item['b'], ok) for item, ok in responses if item['specialty'] == spec]
+            theta, se = eap(answered, pooled, SPECIALTY_PRIOR_SD)
+            out[spec] = {"theta": round(theta, 3), "se": round(se, 3), "items": len(answered)}
+        return out
+
+    def next_item(self, responses=None):
+        """Best next topic, or None when the stop rule is met."""
+        responses = self.responses if responses is None else responses
+        if len(responses) >= self.max_items:
+            return None
+        used = {item['id'] for item, _ in responses} | self.excluded
+        available = [i for i in self.items if i['id'] not in used]
+        estimates = self.estimates(responses)
+        open_specs = [s for s in estimates if any(i['specialty'] == s for i in available)]
+        short = [s for s in open_specs if estimates[s]['items'] < self.min_specialty_items]
+        if not short and (not open_specs or self.pooled(responses)[1] < self.se_target):
+            return None
+        if short:
+            spec = min(short, key=lambda s: (estimates[s]['items'], -estimates[s]['se']))
+        else:
+            spec = max(open_specs, key=lambda s: (estimates[s]['se'], -estimates[s]['items']))
+        theta = estimates[spec]['theta']
+        return min((i for i in available if i['specialty'] == spec),
+                   key=lambda i: (abs(i['b'] - theta), -i['priority'], i['id']))
+
+    def next_item_if(self, item, correct):
+        """next_item() after a hypothetical answer (used to pre-generate both branches)."""
+        return self.next_item(self.responses + [(item, correct)])
+
+    def record(self, item, correct):
+        self.responses.append((item, bool(correct)))
+
+    def exclude(self, item):
+        """Topic that could not be turned into a question (generation failed)."""
+        self.excluded.add(item['id'])
+
+    @property
+    def done(self):
+        return self.next_item() is None
+
+def save_estimates(estimates, db_path=DB_PATH, user_id=DEFAULT_USER):
+    """Latest per-specialty ability of one student (ability_estimates, keyed by user + specialty)."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute('BEGIN IMMEDIATE')
+    columns = [r[1] for r in conn.execute('PRAGMA table_info(ability_estimates)')]
+    if columns and 'user_id' not in columns: # single-user table: its rows belong to the default user
+        conn.execute('ALTER TABLE ability_estimates RENAME TO ability_estimates_old')
+    conn.execute('''CREATE TABLE IF NOT EXISTS ability_estimates (
+        user_id TEXT NOT NULL,
+        specialty TEXT NOT NULL,
+        theta REAL,
+        se REAL,
+        items INTEGER,
+        updated_at TEXT,
+        PRIMARY KEY (user_id, specialty)
+    )''')
+    if columns and 'user_id' not in columns:
+        conn.execute('INSERT INTO ability_estimates SELECT ?, specialty, theta, se, items, updated_at '
+                     'FROM ability_estimates_old', (DEFAULT_USER,))
+        conn.execute('DROP TABLE ability_estimates_old')
+    now = datetime.datetime.now().isoformat()
+    conn.executemany('INSERT OR REPLACE INTO ability_estimates VALUES (?, ?, ?, ?, ?, ?)',
+                     [(user_id, spec, e['theta'], e['se'], e['items'], now) for spec, e in estimates.items()])
+    conn.commit()
+    conn.close()
+
+def simulate(items, true_theta, se_target=SE_TARGET, max_items=MAX_ITEMS, seed=0):
+    """Runs a CAT against a simulated student ({specialty: theta}). Returns (n_items, estimates)."""
+    rng = np.random.default_rng(seed)
+    session = AdaptiveSession(items, se_target, max_items)
+    while (item := session.next_item()) is not None:
+        p = 1.0 / (1.0 + math.exp(-(true_theta.get(item['specialty'], 0.0) - item['b'])))
+        session.record(item, rng.random() < p)
+    return len(session.responses), session.estimates()
+
+if __name__ == "__main__":
+    # Usage:
+    #   python adaptive_diagnostic.py items            (candidate topics per specialty)
+    #   python adaptive_diagnostic.py simulate [runs]  (items needed vs. the fixed 20)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'items'
+    items = load_items()
+    if command == 'simulate':
+        runs = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+        rng = np.random.default_rng(1)
+        specs = sorted({i['specialty'] for i in items})
+        lengths = [simulate(items, {s: float(rng.normal()) for s in specs}, seed=k)[0] for k in range(runs)]
+        mean_items = float(np.mean(lengths)) if lengths else 0.0
+        print(json.dumps({"runs": runs, "mean_items": round(mean_items, 1),
+                          "p90_items": int(np.percentile(lengths, 90)) if lengths else 0,
+                          "max_items": int(max(lengths)) if lengths else 0, "fixed_items": MAX_ITEMS,
+                          "items_saved_pct": round(100 * (1 - mean_items / MAX_ITEMS), 1),
+                          "se_target": SE_TARGET, "min_specialty_items": MIN_SPECIALTY_ITEMS}, indent=2))
+    else:
+        counts = {}
+        for i in items:
+            counts[i['specialty']] = counts.get(i['specialty'], 0) + 1
+        print(json.dumps(counts, indent=2))
@@ -2,6 +2,8 @@ import sqlite3
 import datetime
 import sys
 import json
+import question_bank
+import topic_index
 
 DB_PATH = 'temario.db'
 
@@ -17,9 +19,8 @@ def log_question_db(topic_title, question_data):
     conn = get_conn()
     c = conn.cursor()
     
-    # 1. Find Topic ID
-    c.execute('SELECT id FROM topics WHERE title = ?', (topic_title,))
-    topic_row = c.fetchone()
+    # 1. Find Topic ID (normalized / fuzzy title resolution)
+    topic_row = topic_index.resolve_topic(topic_title, conn)
     
     if not topic_row:
         print(f"Error: Topic '{topic_title}' not found.")
@@ -39,17 +40,16 @@ def log_question_db(topic_title, question_data):
         c.execute("INSERT INTO angles (topic_id, angle_name, variant) VALUES (?, 'Journal', 'Socratic')", (topic_id,))
         angle_id = c.lastrowid
         
-    # 3. Insert Question
-    # Ensure json is valid
-    json_content = json.dumps(question_data, ensure_ascii=False)
-    created_at = datetime.datetime.now().isoformat()
-    
-    c.execute('INSERT INTO questions (angle_id, content_json, created_at) VALUES (?, ?, ?)', 
-              (angle_id, json_content, created_at))
-    
     conn.commit()
     conn.close()
-    print(f"✅ Question saved for '{topic_title}' (Angle ID: {angle_id})")
+
+    # 3. Insert Question through the bank (normalized + deduplicated by content hash)
+    question_id = question_bank.get_bank(DB_PATH).add(question_data, topic_row['title'], 'Journal', 'mcq',
+                                                       'journal', angle_id=angle_id)
+    if question_id is None:
+        print(f"♻️ Question already in bank for '{topic_title}' (Angle ID: {angle_id})")
+    else:
+        print(f"✅ Question saved for '{topic_title}' (Angle ID: {angle_id})")
 
 if __name__ == "__main__":
     # Usage: python agent_journal.py "Topic Name" '{"question": "...", ...}'
@@ -1,13 +1,14 @@
 import sqlite3
 import datetime
+import os
 import sys
 import json
-import math
+import scheduler
 
 DB_PATH = 'temario.db'
 
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -26,129 +27,469 @@ def setup_db():
         last_reviewed TEXT,
         FOREIGN KEY(angle_id) REFERENCES angles(id)
     )''')
+    add_memory_columns(c)
+    create_user_progress(c)
+    create_review_log(c)
+    create_queue_indexes(c)
     conn.commit()
     conn.close()
 
-def get_next_topic():
-    conn = get_conn()
-    c = conn.cursor()
-    now = datetime.datetime.now().isoformat()
-    
-    # 1. Check for DUE REVIEWS (status='review' and next_review <= now)
-    # We join angles and topics to get the title
+def create_user_progress(c):
+    """Per-student SRS state (bot users). `progress` stays the default user's table,
+    so the dashboard and the existing reports read it unchanged."""
+    c.execute('''CREATE TABLE IF NOT EXISTS user_progress (
+        user_id TEXT NOT NULL,
+        angle_id INTEGER NOT NULL,
+        status TEXT DEFAULT 'pending',
+        interval INTEGER DEFAULT 0,
+        ease_factor REAL DEFAULT 2.5,
+        next_review TEXT,
+        last_reviewed TEXT,
+        stability REAL,
+        difficulty REAL,
+        PRIMARY KEY (user_id, angle_id)
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_user_progress_status_next ON user_progress(user_id, status, next_review)')
+    _user_progress_ready.add(DB_PATH)
+
+def _progress_source(c, user_id):
+    """(FROM-clause source, params) of the progress rows of one user; None = default user.
+
+    The source always comes before any other placeholder of the queries that use it.
+    """
+    if user_id is None:
+        return 'progress', []
+    if DB_PATH not in _user_progress_ready:
+        create_user_progress(c)
+    return '(SELECT * FROM user_progress WHERE user_id = ?)', [user_id]
+
+_review_log_ready = set()
+_queue_ready = set()
+_memory_ready = set()
+_user_progress_ready = set()
+
+def add_memory_columns(c):
+    """progress.stability / progress.difficulty for the FSRS scheduler (NULL under SM-2)."""
+    columns = [r[1] for r in c.execute('PRAGMA table_info(progress)')]
+    if not columns:
+        return # progress not created yet (setup_db adds the columns)
+    for column in ('stability', 'difficulty'):
+        if column not in columns:
+            c.execute(f'ALTER TABLE progress ADD COLUMN {column} REAL')
+    _memory_ready.add(DB_PATH)
+
+def create_queue_indexes(c):
+    """Indexes behind next_items(): each branch of the queue query is an index range scan."""
+    c.execute('CREATE INDEX IF NOT EXISTS idx_progress_status_next ON progress(status, next_review)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_angles_topic ON angles(topic_id, id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_topics_priority ON topics(priority DESC, id)')
+    _queue_ready.add(DB_PATH)
+
+def create_review_log(c):
+    """Append-only review history plus a per-day rollup for cheap metrics."""
+    c.execute('''CREATE TABLE IF NOT EXISTS review_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        reviewed_at TEXT NOT NULL,
+        topic_id INTEGER,
+        angle_id INTEGER,
+        rating INTEGER NOT NULL, -- 1 (Fail) .. 4 (Easy)
+        latency_ms INTEGER,
+        client TEXT -- cli, web, dashboard, telegram
+    )''')
+    if 'user_id' not in [r[1] for r in c.execute('PRAGMA table_info(review_log)')]:
+        c.execute('ALTER TABLE review_log ADD COLUMN user_id TEXT') # NULL = default user
+    c.execute('CREATE INDEX IF NOT EXISTS idx_review_log_reviewed_at ON review_log(reviewed_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_review_log_user ON review_log(user_id, reviewed_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_review_log_topic ON review_log(topic_id, reviewed_at)')
+    c.execute('''CREATE TABLE IF NOT EXISTS review_daily (
+        day TEXT PRIMARY KEY, -- YYYY-MM-DD
+        reviews INTEGER NOT NULL DEFAULT 0,
+        correct INTEGER NOT NULL DEFAULT 0
+    )''')
+    _review_log_ready.add(DB_PATH)
+
+def log_reviews(c, rows, user_id=None):
+    """Batch log_review(): rows are (reviewed_at, topic_id, angle_id, rating, latency_ms, client)."""
+    if DB_PATH not in _review_log_ready:
+        create_review_log(c)
+    c.executemany('''
+        INSERT INTO review_log (reviewed_at, topic_id, angle_id, rating, latency_ms, client, user_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(*row, user_id) for row in rows])
+    if user_id is not None:
+        return # review_daily is the default user's rollup
+    daily = {}
+    for reviewed_at, _, _, rating, _, _ in rows:
+        reviews, correct = daily.get(reviewed_at[:10], (0, 0))
+        daily[reviewed_at[:10]] = (reviews + 1, correct + (1 if rating > 1 else 0))
+    c.executemany('''
+        INSERT INTO review_daily (day, reviews, correct) VALUES (?, ?, ?)
+        ON CONFLICT(day) DO UPDATE SET reviews = reviews + excluded.reviews, correct = correct + excluded.correct
+    ''', [(day, reviews, correct) for day, (reviews, correct) in daily.items()])
+
+def log_review(c, topic_id, angle_id, rating, latency_ms=None, client=None, reviewed_at=None, user_id=None):
+    """Appends one review (inside the caller's transaction) and bumps the daily rollup."""
+    if DB_PATH not in _review_log_ready:
+        create_review_log(c)
+    reviewed_at = reviewed_at or datetime.datetime.now().isoformat()
     c.execute('''
-        SELECT t.id, t.title, p.status, p.interval, p.ease_factor
-        FROM topics t
-        JOIN angles a ON t.id = a.topic_id
-        JOIN progress p ON a.id = p.angle_id
-        WHERE p.status = 'review' AND p.next_review <= ?
-        ORDER BY p.next_review ASC
-        LIMIT 1
-    ''', (now,))
-    due = c.fetchone()
-    
-    if due:
-        conn.close()
-        return dict(due) | {"type": "review"}
-        
-    # 2. If no reviews, get next NEW topic (status='pending' OR NULL)
-    # Left join to find topics that might not have a progress entry yet
+        INSERT INTO review_log (reviewed_at, topic_id, angle_id, rating, latency_ms, client, user_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (reviewed_at, topic_id, angle_id, rating, latency_ms, client, user_id))
+    if user_id is not None:
+        return
     c.execute('''
-        SELECT t.id, t.title, p.status, p.interval, p.ease_factor
-        FROM topics t
-        LEFT JOIN angles a ON t.id = a.topic_id 
-        LEFT JOIN progress p ON a.id = p.angle_id
-        WHERE p.status = 'pending' OR p.status IS NULL
-        ORDER BY t.priority DESC, t.id ASC
-        LIMIT 1
-    ''')
-    new_topic = c.fetchone()
+        INSERT INTO review_daily (day, reviews, correct) VALUES (?, 1, ?)
+        ON CONFLICT(day) DO UPDATE SET reviews = reviews + 1, correct = correct + excluded.correct
+    ''', (reviewed_at[:10], 1 if rating > 1 else 0))
+
+def get_review_metrics(today=None, user_id=None):
+    """Daily / 7-day / streak counters from review_log and review_daily (index range scans).
+
+    Other users have no rollup: their days come from review_log (user_id, reviewed_at) index.
+    """
+    today = today or datetime.date.today()
+    tomorrow = today + datetime.timedelta(days=1)
+    week_start = today - datetime.timedelta(days=6)
+    conn = get_conn()
+    c = conn.cursor()
+    if DB_PATH not in _review_log_ready:
+        create_review_log(c)
+        conn.commit()
+
+    user_sql = 'user_id IS NULL' if user_id is None else 'user_id = ?'
+    user_params = [] if user_id is None else [user_id]
+    c.execute(f'''
+        SELECT COUNT(*) AS reviews, COUNT(DISTINCT topic_id) AS topics
+        FROM review_log WHERE {user_sql} AND reviewed_at >= ? AND reviewed_at < ?
+    ''', (*user_params, today.isoformat(), tomorrow.isoformat()))
+    day_row = c.fetchone()
+
+    daily = 'review_daily'
+    if user_id is not None:
+        daily = '''(SELECT substr(reviewed_at, 1, 10) AS day, COUNT(*) AS reviews, SUM(rating > 1) AS correct
+                    FROM review_log WHERE user_id = ? GROUP BY 1)'''
+    c.execute(f'''
+        SELECT COALESCE(SUM(reviews), 0), COALESCE(SUM(correct), 0)
+        FROM {daily} WHERE day >= ? AND day <= ?
+    ''', (*user_params, week_start.isoformat(), today.isoformat()))
+    week_reviews, week_correct = c.fetchone()
+
+    # Streak: consecutive days with reviews ending today (or yesterday if today is still empty)
+    c.execute(f'SELECT day FROM {daily} WHERE day <= ? AND reviews > 0 ORDER BY day DESC', (*user_params, today.isoformat()))
+    streak = 0
+    expected = today if day_row['reviews'] else today - datetime.timedelta(days=1)
+    for (day,) in c:
+        if day != expected.isoformat():
+            break
+        streak += 1
+        expected -= datetime.timedelta(days=1)
+    conn.close()
+
+    return {
+        "done_today": day_row['reviews'],
+        "topics_today": day_row['topics'],
+        "done_week": week_reviews,
+        "accuracy_week": round(week_correct / week_reviews, 3) if week_reviews else 0.0,
+        "streak_days": streak
+    }
+
+QUEUE_TYPES = ('review', 'learning', 'new')
+
+def next_items(n=20, filters=None, user_id=None):
+    """Next `n` items of the study queue in one query.
+
+    Order: due items (review/learning with next_review <= now, oldest first),
+    then learning items not yet due, then new topics by priority. Each topic
+    counts once, through its primary angle (the first one, which is the one
+    update_progress() schedules).
+
+    filters (all optional):
+      types        subset of QUEUE_TYPES ('review' = any due item)
+      min_priority only topics with priority >= this value
+      topic_ids    restrict to these topic ids
+      now          ISO timestamp used as "now" (default: current time)
+    user_id: student whose progress is used (None = default user, `progress` table).
+    """
+    filters = filters or {}
+    types = set(filters.get('types') or QUEUE_TYPES)
+    now = filters.get('now') or datetime.datetime.now().isoformat()
+
+    extra, extra_params = '', []
+    if filters.get('min_priority') is not None:
+        extra += ' AND t.priority >= ?'
+        extra_params.append(filters['min_priority'])
+    if filters.get('topic_ids'):
+        ids = list(filters['topic_ids'])
+        extra += f" AND t.id IN ({', '.join('?' * len(ids))})"
+        extra_params += ids
+
+    if n <= 0 or not types & set(QUEUE_TYPES):
+        return []
+    conn = get_conn()
+    c = conn.cursor()
+    if DB_PATH not in _queue_ready:
+        create_queue_indexes(c)
+        conn.commit()
+    src, src_params = _progress_source(c, user_id)
+
+    columns = 't.id, t.title, t.priority, a.id AS angle_id, p.status, p.interval, p.ease_factor, p.next_review'
+    primary = 'a.id = (SELECT MIN(a2.id) FROM angles a2 WHERE a2.topic_id = t.id)'
+    branches, params = [], []
+    if 'review' in types:
+        branches.append(f'''SELECT * FROM (
+            SELECT 0 AS bucket, 'review' AS type, {columns}
+            FROM {src} p JOIN angles a ON a.id = p.angle_id JOIN topics t ON t.id = a.topic_id
+            WHERE p.status IN ('review', 'learning') AND p.next_review <= ? AND {primary}{extra}
+            ORDER BY p.next_review LIMIT ?)''')
+        params += [*src_params, now, *extra_params, n]
+    if 'learning' in types:
+        branches.append(f'''SELECT * FROM (
+            SELECT 1 AS bucket, 'learning' AS type, {columns}
+            FROM {src} p JOIN angles a ON a.id = p.angle_id JOIN topics t ON t.id = a.topic_id
+            WHERE p.status = 'learning' AND p.next_review > ? AND {primary}{extra}
+            ORDER BY p.next_review LIMIT ?)''')
+        params += [*src_params, now, *extra_params, n]
+    if 'new' in types:
+        branches.append(f'''SELECT * FROM (
+            SELECT 2 AS bucket, 'new' AS type, {columns}
+            FROM topics t
+            LEFT JOIN angles a ON {primary}
+            LEFT JOIN {src} p ON p.angle_id = a.id
+            WHERE (p.status IS NULL OR p.status = 'pending'){extra}
+            ORDER BY t.priority DESC, t.id LIMIT ?)''')
+        params += [*src_params, *extra_params, n]
+
+    c.execute(' UNION ALL '.join(branches) + ' ORDER BY bucket, next_review, priority DESC, id LIMIT ?', (*params, n))
+    rows = c.fetchall()
     conn.close()
-    
-    if new_topic:
-         # If it was NULL, it means we need to init the angle/progress row first?
-         # Actually, for this lightweight script, we just return the topic info.
-         # The 'update' function will need to handle inserting if missing.
-         return {
-             "id": new_topic["id"], 
-             "title": new_topic["title"], 
-             "type": "new", 
-             "status": "pending", 
-             "interval": 0, 
-             "ease_factor": 2.5
-         }
-    
-    return None
 
-def update_progress(topic_id, rating):
+    items = []
+    for r in rows:
+        item = dict(r)
+        del item['bucket']
+        if item['type'] == 'new':
+            item.update(status='pending', interval=0, ease_factor=2.5, next_review=None)
+        items.append(item)
+    return items
+
+def get_next_topic():
+    items = next_items(1)
+    if not items:
+        return None
+    item = items[0]
+    return {k: item[k] for k in ('id', 'title', 'status', 'interval', 'ease_factor', 'type')}
+
+def _progress_key(user_id):
+    """(table, key columns, key values before angle_id) for writes of one user's progress."""
+    if user_id is None:
+        return 'progress', ('angle_id',), ()
+    return 'user_progress', ('user_id', 'angle_id'), (user_id,)
+
+def update_progress(topic_id, rating, latency_ms=None, client='cli', user_id=None):
     # Rating: 1 (Fail), 2 (Hard), 3 (Good), 4 (Easy)
     conn = get_conn()
     c = conn.cursor()
+    if DB_PATH not in _memory_ready:
+        add_memory_columns(c)
+        conn.commit()
+    src, src_params = _progress_source(c, user_id)
+    table, key, key_prefix = _progress_key(user_id)
+    if conn.in_transaction:
+        conn.commit()
+    # Read-modify-write under the write lock: concurrent reviews from the bot
+    # and the dashboard must not overwrite each other's interval/ease.
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        # 1. Get the angle_id for this topic (assuming 1 angle per topic for now, or take the first V1)
+        c.execute('SELECT id FROM angles WHERE topic_id = ? ORDER BY id LIMIT 1', (topic_id,))
+        angle_row = c.fetchone()
     
-    # 1. Get the angle_id for this topic (assuming 1 angle per topic for now, or take the first V1)
-    c.execute('SELECT id FROM angles WHERE topic_id = ? ORDER BY id LIMIT 1', (topic_id,))
-    angle_row = c.fetchone()
-    
-    if not angle_row:
-        # If no angle exists, create default 'General' angle
-        c.execute('INSERT INTO angles (topic_id, angle_name, variant) VALUES (?, ?, ?)', (topic_id, 'General', 'V1'))
-        angle_id = c.lastrowid
-    else:
-        angle_id = angle_row['id']
-    
-    # 2. Get current state
-    c.execute('SELECT * FROM progress WHERE angle_id = ?', (angle_id,))
-    row = c.fetchone()
-    
-    current_interval = row['interval'] if row else 0
-    current_ease = row['ease_factor'] if row else 2.5
+        if not angle_row:
+            # If no angle exists, create default 'General' angle
+            c.execute('INSERT INTO angles (topic_id, angle_name, variant) VALUES (?, ?, ?)', (topic_id, 'General', 'V1'))
+            angle_id = c.lastrowid
+        else:
+            angle_id = angle_row['id']
     
-    # SM-2 Logic
-    new_interval = 0
-    new_ease = current_ease
-    next_status = 'review'
+        # 2. Get current state
+        c.execute(f'SELECT * FROM {src} WHERE angle_id = ?', (*src_params, angle_id))
+        row = c.fetchone()
     
-    if rating == 1: # Again
-        new_interval = 0 
-        new_ease = max(1.3, current_ease - 0.2)
-        next_status = 'learning'
-    elif rating == 2: # Hard
-        new_interval = 1 if current_interval == 0 else math.floor(current_interval * 1.2)
-        new_ease = max(1.3, current_ease - 0.15)
-        next_status = 'review'
-    elif rating == 3: # Good
-        if current_interval == 0: new_interval = 1
-        elif current_interval == 1: new_interval = 3
-        else: new_interval = math.floor(current_interval * current_ease)
-        next_status = 'review'
-    elif rating == 4: # Easy
-        if current_interval == 0: new_interval = 2
-        elif current_interval == 1: new_interval = 4
-        else: new_interval = math.floor(current_interval * current_ease * 1.3)
-        new_ease = min(3.0, current_ease + 0.15)
-        next_status = 'review'
-
-    days_delta = 1 if new_interval == 0 else new_interval
-    next_date = (datetime.datetime.now() + datetime.timedelta(days=days_delta)).isoformat()
-    now_str = datetime.datetime.now().isoformat()
+        # SM-2 or FSRS depending on SRS_SCHEDULER (scheduler.py)
+        now = datetime.datetime.now()
+        state = scheduler.review(dict(row) if row else None, rating, now)
+        new_interval, next_date = state['interval'], state['next_review']
+        now_str = now.isoformat()
     
-    if row:
-        c.execute('''
-            UPDATE progress
-            SET status = ?, interval = ?, ease_factor = ?, next_review = ?, last_reviewed = ?
-            WHERE angle_id = ?
-        ''', (next_status, new_interval, new_ease, next_date, now_str, angle_id))
-    else:
-        c.execute('''
-            INSERT INTO progress (angle_id, status, interval, ease_factor, next_review, last_reviewed)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (angle_id, next_status, new_interval, new_ease, next_date, now_str))
+        if row:
+            c.execute(f'''
+                UPDATE {table}
+                SET status = ?, interval = ?, ease_factor = ?, next_review = ?, last_reviewed = ?,
+                    stability = ?, difficulty = ?
+                WHERE {' AND '.join(k + ' = ?' for k in key)}
+            ''', (state['status'], new_interval, state['ease_factor'], next_date, now_str,
+                  state['stability'], state['difficulty'], *key_prefix, angle_id))
+        else:
+            c.execute(f'''
+                INSERT INTO {table} ({', '.join(key)}, status, interval, ease_factor, next_review, last_reviewed,
+                                      stability, difficulty)
+                VALUES ({', '.join('?' * len(key))}, ?, ?, ?, ?, ?, ?, ?)
+            ''', (*key_prefix, angle_id, state['status'], new_interval, state['ease_factor'], next_date, now_str,
+                  state['stability'], state['difficulty']))
     
-    conn.commit()
-    conn.close()
+        log_review(c, topic_id, angle_id, rating, latency_ms, client, reviewed_at=now_str, user_id=user_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
     
     return {"topic_id": topic_id, "new_interval": new_interval, "next_review": next_date}
 
+def _in_chunks(values, size=500):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def update_progress_many(ratings, client='cli', user_id=None):
+    """Applies many ratings in a single transaction.
+
+    ratings: iterable of dicts {topic_id, rating, latency_ms?, client?, reviewed_at?}
+    or (topic_id, rating) tuples, in the order they happened. Current states
+    are read with one query per 500 topics, new states are computed in bulk
+    (scheduler.review_many, one round per repeated topic) and written with
+    executemany. Returns one result per rating, like update_progress().
+    user_id: student whose progress is updated (None = default user).
+    """
+    items = []
+    for r in ratings:
+        item = dict(r) if isinstance(r, dict) else {"topic_id": r[0], "rating": r[1]}
+        item['rating'] = int(item['rating'])
+        if item['rating'] not in scheduler.RATINGS:
+            raise ValueError(f"rating must be one of {scheduler.RATINGS}, got {item['rating']}")
+        items.append(item)
+    if not items:
+        return []
+    now = datetime.datetime.now()
+    topic_ids = list(dict.fromkeys(item['topic_id'] for item in items))
+
+    conn = get_conn()
+    c = conn.cursor()
+    if DB_PATH not in _memory_ready:
+        add_memory_columns(c)
+        conn.commit()
+    src, src_params = _progress_source(c, user_id)
+    table, key, key_prefix = _progress_key(user_id)
+    if conn.in_transaction:
+        conn.commit()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        # 1. Primary angle per topic (create 'General' where missing)
+        angle_of = {}
+        for chunk in _in_chunks(topic_ids):
+            c.execute(f'''
+                SELECT topic_id, MIN(id) FROM angles WHERE topic_id IN ({', '.join('?' * len(chunk))})
+                GROUP BY topic_id
+            ''', chunk)
+            angle_of.update(c.fetchall())
+        missing = [t for t in topic_ids if t not in angle_of]
+        for topic_id in missing:
+            c.execute('INSERT INTO angles (topic_id, angle_name, variant) VALUES (?, ?, ?)', (topic_id, 'General', 'V1'))
+            angle_of[topic_id] = c.lastrowid
+
+        # 2. Current states in one pass
+        states = {}
+        for chunk in _in_chunks(angle_of.values()):
+            c.execute(f"SELECT * FROM {src} WHERE angle_id IN ({', '.join('?' * len(chunk))})", (*src_params, *chunk))
+            states.update((row['angle_id'], dict(row)) for row in c.fetchall())
+        existing = set(states)
+
+        # 3. New states in bulk: round k applies the k-th rating of every topic
+        rounds = []
+        seen = {}
+        for item in items:
+            k = seen.get(item['topic_id'], 0)
+            seen[item['topic_id']] = k + 1
+            if k == len(rounds):
+                rounds.append([])
+            rounds[k].append(item)
+        results = {}
+        log_rows = []
+        for batch in rounds:
+            angles = [angle_of[item['topic_id']] for item in batch]
+            when = [datetime.datetime.fromisoformat(item['reviewed_at']) if item.get('reviewed_at') else now
+                    for item in batch]
+            new_states = scheduler.review_many([states.get(a) for a in angles],
+                                               [item['rating'] for item in batch], when)
+            for item, angle_id, at, state in zip(batch, angles, when, new_states):
+                states[angle_id] = dict(state, angle_id=angle_id, last_reviewed=at.isoformat())
+                results[id(item)] = {"topic_id": item['topic_id'], "new_interval": state['interval'],
+                                     "next_review": state['next_review']}
+                log_rows.append((at.isoformat(), item['topic_id'], angle_id, item['rating'],
+                                 item.get('latency_ms'), item.get('client', client)))
+
+        # 4. Write final states + log in the same transaction
+        columns = ('status', 'interval', 'ease_factor', 'next_review', 'last_reviewed', 'stability', 'difficulty')
+        touched = list(dict.fromkeys(angle_of[t] for t in topic_ids))
+        where = ' AND '.join(k + ' = ?' for k in key)
+        c.executemany(f"UPDATE {table} SET {', '.join(col + ' = ?' for col in columns)} WHERE {where}",
+                      [(*(states[a][col] for col in columns), *key_prefix, a) for a in touched if a in existing])
+        c.executemany(f"INSERT INTO {table} ({', '.join(key + columns)}) VALUES ({', '.join('?' * (len(key) + len(columns)))})",
+                      [(*key_prefix, a, *(states[a][col] for col in columns)) for a in touched if a not in existing])
+        log_reviews(c, log_rows, user_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return [results[id(item)] for item in items]
+
+def benchmark_many(sizes=(1000, 10000), single_sample=300):
+    """Per-review cost: update_progress() loop vs update_progress_many(), on a temp DB."""
+    global DB_PATH
+    import random
+    import tempfile
+    import time
+    original = DB_PATH
+    report = []
+    try:
+        for n in sizes:
+            with tempfile.TemporaryDirectory() as tmp:
+                DB_PATH = os.path.join(tmp, 'bench.db')
+                conn = sqlite3.connect(DB_PATH)
+                conn.execute('CREATE TABLE topics (id INTEGER PRIMARY KEY, title TEXT UNIQUE, priority INTEGER)')
+                conn.execute('CREATE TABLE angles (id INTEGER PRIMARY KEY, topic_id INTEGER, angle_name TEXT, variant TEXT)')
+                conn.executemany('INSERT INTO topics (id, title, priority) VALUES (?, ?, 50)', [(i, f"T{i}") for i in range(1, n + 1)])
+                conn.commit()
+                conn.close()
+                setup_db()
+                rng = random.Random(n)
+                ratings = [(rng.randint(1, n), rng.randint(1, 4)) for _ in range(n)]
+
+                sample = ratings[:single_sample]
+                start = time.perf_counter()
+                for topic_id, rating in sample:
+                    update_progress(topic_id, rating)
+                single_us = (time.perf_counter() - start) / len(sample) * 1e6
+
+                start = time.perf_counter()
+                update_progress_many(ratings)
+                batch_s = time.perf_counter() - start
+                report.append({
+                    "ratings": n,
+                    "single_us_per_review": round(single_us, 1),
+                    "batch_ms_total": round(batch_s * 1000, 1),
+                    "batch_us_per_review": round(batch_s / n * 1e6, 1),
+                    "speedup": round(single_us / (batch_s / n * 1e6), 1)
+                })
+    finally:
+        DB_PATH = original
+    return report
+
 if __name__ == '__main__':
     command = sys.argv[1] if len(sys.argv) > 1 else 'next'
     
@@ -163,6 +504,31 @@ if __name__ == '__main__':
         else:
             print(json.dumps({"message": "No topics pending!"}))
             
+    elif command == 'queue':
+        # Usage: python agent_srs.py queue [n]
+        n = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+        print(json.dumps(next_items(n), ensure_ascii=False, indent=2))
+            
+    elif command == 'metrics':
+        print(json.dumps(get_review_metrics()))
+            
+    elif command == 'update-many':
+        # Usage: python agent_srs.py update-many <topic_id>:<rating> [...]
+        #        python agent_srs.py update-many --file reviews.json   (list of {topic_id, rating, ...}; '-' = stdin)
+        try:
+            if len(sys.argv) > 3 and sys.argv[2] == '--file':
+                source = sys.stdin if sys.argv[3] == '-' else open(sys.argv[3], 'r')
+                ratings = json.load(source)
+            else:
+                ratings = [tuple(int(x) for x in arg.split(':')) for arg in sys.argv[2:]]
+            res = update_progress_many(ratings)
+            print(json.dumps({"updated": len(res), "results": res}))
+        except Exception as e:
+            print(json.dumps({"error": str(e)}))
+            
+    elif command == 'bench-many':
+        print(json.dumps(benchmark_many(), indent=2))
+            
     elif command == 'update':
         # Usage: python agent_srs.py update <topic_id> <rating>
         try:
@@ -3,7 +3,8 @@ import datetime
 import glob
 import os
 import random
-from fastapi import FastAPI, HTTPException
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
@@ -12,16 +13,30 @@ app = FastAPI()
 DB_PATH = 'temario.db'
 CARDS_DIR = 'BattleCards'
 
+import agent_srs
+import question_bank
+import scheduler
+import topic_index
 from local_ai_adapter import LocalAIAdapter
 from notebook_adapter import NotebookAdapter
 
 ai_adapter = LocalAIAdapter()
 nb_adapter = NotebookAdapter()
 
+@app.on_event("startup")
+def ensure_srs_schema():
+    # progress/review_log columns and indexes used by the shared scheduler and queue
+    agent_srs.setup_db()
+
 # --- DATA MODELS ---
 class Review(BaseModel):
     card_filename: str
     rating: int  # 1=Again, 2=Hard, 3=Good, 4=Easy
+    latency_ms: Optional[int] = None
+
+class MockAnswer(BaseModel):
+    position: int
+    answer: str
 
 # --- DATABASE HELPERS ---
 def get_db_connection():
@@ -122,62 +137,21 @@ def parse_card(filepath):
         "mcq": mcq_data
     }
 
-# --- ALGORITHM (Simplified SM-2) ---
-def calculate_next_review(rating, current_interval, ease_factor):
-    # Rating: 1=Fail, 2=Hard, 3=Good, 4=Easy
-    
-    if rating == 1:
-        new_interval = 0 # 10 min (today)
-        new_ease = max(1.3, ease_factor - 0.2)
-    elif rating == 2:
-        new_interval = 1 # 1 day
-        new_ease = max(1.3, ease_factor - 0.15)
-    elif rating == 3:
-        if current_interval == 0: new_interval = 1
-        elif current_interval == 1: new_interval = 3
-        else: new_interval = round(current_interval * ease_factor)
-        new_ease = ease_factor
-    elif rating == 4:
-        if current_interval == 0: new_interval = 2
-        elif current_interval == 1: new_interval = 4
-        else: new_interval = round(current_interval * ease_factor * 1.3)
-        new_ease = min(3.0, ease_factor + 0.15)
-        
-    return new_interval, new_ease
-
 # --- API ENDPOINTS ---
 
 @app.get("/api/card")
 async def get_next_card(topic: str = None):
-    conn = get_db_connection()
-    now = datetime.datetime.now().isoformat()
-    
     row = None
-    cursor = conn.cursor() # Define cursor here to be available for both branches
     if topic:
-        cursor.execute("SELECT title FROM topics WHERE title = ?", (topic,))
-        row = cursor.fetchone()
-        if not row:
-            # Try fuzzy match if exact not found
-            cursor.execute("SELECT title FROM topics WHERE title LIKE ? LIMIT 1", (f"%{topic}%",))
-            row = cursor.fetchone()
+        # Normalized exact match, then FTS trigram match (see topic_index)
+        conn = get_db_connection()
+        row = topic_index.resolve_topic(topic, conn)
+        conn.close()
     
     if not row:
-        # SRS selection logic (backup if no topic requested or found)
-        cursor.execute('''
-            SELECT t.title, p.next_review, p.status
-            FROM topics t
-            LEFT JOIN angles a ON t.id = a.topic_id
-            LEFT JOIN progress p ON a.id = p.angle_id
-            GROUP BY t.title
-            ORDER BY 
-                CASE WHEN p.next_review <= ? THEN 0 ELSE 1 END,
-                CASE WHEN p.status = 'learning' THEN 1 ELSE 2 END,
-                CASE WHEN p.status = 'pending' OR p.status IS NULL THEN 3 ELSE 4 END,
-                p.next_review ASC
-            LIMIT 1
-        ''', (now,))
-        row = cursor.fetchone()
+        # SRS selection logic (backup if no topic requested or found): shared queue
+        queue = agent_srs.next_items(1)
+        row = queue[0] if queue else None
     
     # Map files to topics to see if we already have it
     files = glob.glob(os.path.join(CARDS_DIR, "*.md"))
@@ -229,8 +203,59 @@ async def get_next_card(topic: str = None):
         selected_file = random.choice(files)
     
     card_data = parse_card(selected_file)
+    if card_data["mcq"]:
+        question_bank.record_question(card_data["mcq"], card_data["topic"], 'BattleCard', 'mcq', 'battlecard')
     return card_data
 
+@app.get("/api/queue")
+async def get_queue(n: int = 20, types: str = None, min_priority: int = None):
+    """Next n study items (due reviews, learning, new) so a client can load a whole session."""
+    filters = {"min_priority": min_priority}
+    if types:
+        filters["types"] = [t.strip() for t in types.split(",") if t.strip()]
+    return {"items": agent_srs.next_items(min(n, 200), filters)}
+
+@app.get("/api/forecast")
+async def get_forecast(days: Optional[int] = Query(None, ge=1, le=3650), runs: int = Query(32, ge=1, le=500),
+                       new_per_day: int = Query(0, ge=0)):
+    """Monte Carlo projection of reviews per day (until EXAM_DATE unless `days` is given)."""
+    import srs_forecast
+    return srs_forecast.forecast(days, runs, new_per_day)
+
+@app.post("/api/mock-exam")
+async def create_mock_exam(n: int = 100):
+    """Assembles a timed mock exam from stored questions (no LLM calls)."""
+    import mock_exam
+    return mock_exam.MockExams().build(min(n, 300))
+
+@app.post("/api/mock-exam/{exam_id}/start")
+async def start_mock_exam(exam_id: int):
+    import mock_exam
+    try:
+        return mock_exam.MockExams().start(exam_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/api/mock-exam/{exam_id}/answer")
+async def answer_mock_exam(exam_id: int, body: MockAnswer):
+    import mock_exam
+    try:
+        res = mock_exam.MockExams().answer(exam_id, body.position, body.answer)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not res["accepted"]:
+        raise HTTPException(status_code=409, detail=res["reason"])
+    return res
+
+@app.post("/api/mock-exam/{exam_id}/finish")
+async def finish_mock_exam(exam_id: int):
+    """Closes the exam and returns overall and per-specialty scores."""
+    import mock_exam
+    try:
+        return mock_exam.MockExams().finish(exam_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 @app.get("/api/stats")
 async def get_stats():
     conn = get_db_connection()
@@ -316,6 +341,9 @@ async def get_roadmap():
 
 @app.post("/api/review")
 async def submit_review(review: Review):
+    if review.rating not in scheduler.RATINGS:
+        raise HTTPException(status_code=400, detail=f"rating must be one of {scheduler.RATINGS}")
+    
     # Parse card to get topic
     filepath = os.path.join(CARDS_DIR, review.card_filename)
     card_data = parse_card(filepath)
@@ -325,50 +353,57 @@ async def submit_review(review: Review):
     cursor = conn.cursor()
     
     # Get current SRS stats
-    cursor.execute('''
-        SELECT p.angle_id, p.interval, p.ease_factor
-        FROM progress p
-        JOIN angles a ON p.angle_id = a.id
-        JOIN topics t ON a.topic_id = t.id
-        WHERE t.title = ?
-        LIMIT 1
-    ''', (topic_title,))
-    
-    row = cursor.fetchone()
+    topic = topic_index.resolve_topic(topic_title, conn)
+    row = None
+    if topic:
+        cursor.execute('''
+            SELECT a.topic_id, p.*
+            FROM progress p
+            JOIN angles a ON p.angle_id = a.id
+            WHERE a.topic_id = ?
+            LIMIT 1
+        ''', (topic["id"],))
+        row = cursor.fetchone()
     if not row:
         conn.close()
         return {"status": "error", "message": "Topic not found in progress"}
     
-    # Calculate next review
-    new_interval, new_ease = calculate_next_review(
-        review.rating, 
-        row["interval"] or 0, 
-        row["ease_factor"] or 2.5
-    )
-    
-    next_review_date = (datetime.datetime.now() + datetime.timedelta(days=new_interval)).isoformat()
+    # Calculate next review (SM-2 or FSRS per SRS_SCHEDULER, see scheduler.py)
+    now = datetime.datetime.now()
+    state = scheduler.review(dict(row), review.rating, now)
+    next_review_date = state["next_review"]
     
     # Update all angles for this topic (to sync SRS for the whole topic)
     cursor.execute('''
         UPDATE progress 
-        SET status = 'review',
+        SET status = ?,
             interval = ?,
             ease_factor = ?,
             next_review = ?,
-            last_reviewed = ?
-        WHERE angle_id IN (
-            SELECT a.id FROM angles a
-            JOIN topics t ON a.topic_id = t.id
-            WHERE t.title = ?
-        )
-    ''', (new_interval, new_ease, next_review_date, datetime.datetime.now().isoformat(), topic_title))
+            last_reviewed = ?,
+            stability = ?,
+            difficulty = ?
+        WHERE angle_id IN (SELECT id FROM angles WHERE topic_id = ?)
+    ''', (state["status"], state["interval"], state["ease_factor"], next_review_date, now.isoformat(),
+          state["stability"], state["difficulty"], row["topic_id"]))
     
+    agent_srs.log_review(cursor, row["topic_id"], row["angle_id"], review.rating,
+                         latency_ms=review.latency_ms, client='web')
     conn.commit()
     conn.close()
     
-    print(f"✅ SRS Update for {topic_title}: Int={new_interval}, Ease={new_ease}, Next={next_review_date}")
+    print(f"✅ SRS Update for {topic_title}: Int={state['interval']}, Ease={state['ease_factor']}, Next={next_review_date}")
     return {"status": "success", "next_review": next_review_date}
 
+# --- TELEGRAM WEBHOOK (opcional, mismo proceso) ---
+# Registrado antes del mount estático, que captura todas las rutas
+if os.getenv("TELEGRAM_WEBHOOK_URL") and os.getenv("TELEGRAM_BOT_TOKEN"):
+    import telegram_bot
+    import telegram_webhook
+    import study_core
+    study_core.setup_storage()
+    telegram_webhook.attach(app, telegram_bot.build_application())
+
 # --- FRONTEND SERVING ---
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
 
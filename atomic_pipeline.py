@@ -0,0 +1,147 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from notebook_adapter import NotebookAdapter, ATOMIC_NOTEBOOKS_DIR, route_specialty
+
+DB_PATH = 'temario.db'
+
+class AtomicPipeline:
+    """Distills every topic of temario.db into an Atomic Notebook.
+
+    Completion is checkpointed in atomic_notebooks together with the notebook
+    source revision used, so re-running only regenerates topics whose notebook
+    changed (e.g. after a research_import) or whose file is missing.
+    """
+
+    def __init__(self, db_path=DB_PATH, output_dir=ATOMIC_NOTEBOOKS_DIR, nb=None, workers=3, current_date=None):
+        self.db_path = db_path
+        self.output_dir = output_dir
+        self.nb = nb or NotebookAdapter()
+        self.workers = workers
+        self.current_date = current_date
+        self._notebook_ids = {}
+        self._lock = threading.Lock()
+        self.setup_db()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def setup_db(self):
+        conn = self._get_conn()
+        conn.execute('''CREATE TABLE IF NOT EXISTS atomic_notebooks (
+            topic_id INTEGER PRIMARY KEY,
+            notebook_id TEXT,
+            source_revision INTEGER,
+            file_path TEXT,
+            completed_at TEXT,
+            duration REAL,
+            FOREIGN KEY(topic_id) REFERENCES topics(id)
+        )''')
+        conn.commit()
+        conn.close()
+
+    def _notebook_for(self, title):
+        """ensure_notebook lists every notebook, so resolve it once per specialty."""
+        spec_key = route_specialty(title)
+        with self._lock:
+            if spec_key not in self._notebook_ids:
+                self._notebook_ids[spec_key] = self.nb.ensure_notebook(title)
+            return self._notebook_ids[spec_key]
+
+    def plan(self, force=False, limit=None):
+        """Returns [(topic, notebook_id, revision)] that need (re)distillation and the skipped count."""
+        conn = self._get_conn()
+        rows = conn.execute('''
+            SELECT t.id, t.title, a.source_revision, a.file_path
+            FROM topics t
+            LEFT JOIN atomic_notebooks a ON a.topic_id = t.id
+            ORDER BY t.priority DESC, t.id ASC
+        ''').fetchall()
+        conn.close()
+
+        pending, skipped = [], 0
+        for row in rows:
+            notebook_id = self._notebook_for(row['title'])
+            revision = self.nb.get_source_revision(notebook_id)
+            up_to_date = (row['source_revision'] == revision and row['file_path']
+                          and os.path.exists(row['file_path']))
+            if up_to_date and not force:
+                skipped += 1
+                continue
+            pending.append((dict(row), notebook_id, revision))
+            if limit and len(pending) >= limit:
+                break
+        return pending, skipped
+
+    def _distill(self, topic, notebook_id, revision, force=False):
+        start = time.time()
+        # force: regenerate even when the answer for this revision is cached
+        file_path = self.nb.distill_topic_to_atomic(notebook_id, topic['title'],
+                                                    current_date=self.current_date,
+                                                    output_dir=self.output_dir,
+                                                    use_cache=not force)
+        duration = time.time() - start
+        if not file_path:
+            return False, duration
+
+        conn = self._get_conn()
+        conn.execute('''
+            INSERT OR REPLACE INTO atomic_notebooks
+                (topic_id, notebook_id, source_revision, file_path, completed_at, duration)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (topic['id'], notebook_id, revision, file_path, datetime.now().isoformat(), duration))
+        conn.commit()
+        conn.close()
+        return True, duration
+
+    def run(self, force=False, limit=None):
+        start = time.time()
+        pending, skipped = self.plan(force=force, limit=limit)
+        print(f"🧪 [Atomic] {len(pending)} temas por destilar, {skipped} al día (workers={self.workers})")
+
+        done, failed = 0, 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self._distill, *job, force): job[0]['title'] for job in pending}
+            for future in as_completed(futures):
+                title = futures[future]
+                try:
+                    ok, duration = future.result()
+                except Exception as e:
+                    ok, duration = False, 0
+                    print(f"  ❌ {title}: {e}")
+                if ok:
+                    done += 1
+                    print(f"  ✅ [{done + failed}/{len(pending)}] {title} ({duration:.1f}s)")
+                else:
+                    failed += 1
+                    print(f"  ⚠️ [{done + failed}/{len(pending)}] {title} sin contenido")
+
+        elapsed = time.time() - start
+        report = {
+            "distilled": done,
+            "failed": failed,
+            "skipped": skipped,
+            "elapsed_s": round(elapsed, 1),
+            "topics_per_min": round(done / elapsed * 60, 2) if elapsed > 0 else 0.0
+        }
+        print(f"🏁 [Atomic] {report}")
+        return report
+
+if __name__ == "__main__":
+    # Usage: python atomic_pipeline.py [--out DIR] [--workers 3] [--date "marzo 2026"] [--force] [--limit N]
+    parser = argparse.ArgumentParser(description="Destila todo el temario en Atomic Notebooks.")
+    parser.add_argument("--out", default=ATOMIC_NOTEBOOKS_DIR, help="Directorio de salida")
+    parser.add_argument("--workers", type=int, default=3, help="Consultas concurrentes a NotebookLM")
+    parser.add_argument("--date", default=None, help="Fecha de corte de las guías (ej. 'marzo 2026')")
+    parser.add_argument("--force", action="store_true", help="Regenera aunque la revisión no haya cambiado")
+    parser.add_argument("--limit", type=int, default=None, help="Máximo de temas en esta corrida")
+    args = parser.parse_args()
+
+    pipeline = AtomicPipeline(output_dir=args.out, workers=args.workers, current_date=args.date)
+    pipeline.run(force=args.force, limit=args.limit)
@@ -1,23 +1,32 @@
 import json
 import os
+import time
 import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from local_ai_adapter import LocalAIAdapter
+from graph_store import GraphStore
+import topic_similarity
+
+BRANCH_WORKERS = int(os.getenv("BRANCH_WORKERS", "4")) # concurrent local-model calls per level
+SUBTOPIC_PRIORITY = 40
 
 class BranchingEngine:
     def __init__(self, db_path='temario.db', graph_path='study_dashboard/graph_data.json'):
         self.db_path = db_path
         self.graph_path = graph_path
         self.ai = LocalAIAdapter()
+        self.graph = GraphStore(db_path, graph_path)
 
     def _get_conn(self):
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
 
-    def suggest_subtopics(self, parent_title):
+    def suggest_subtopics(self, parent_title, nb=None):
         """Calls local AI to suggest 2-3 subtopics, grounded with NotebookLM/Glossary."""
         from notebook_adapter import NotebookAdapter
-        nb = NotebookAdapter()
+        nb = nb or NotebookAdapter()
         resolution = nb.resolve_topic_acronym(parent_title)
         
         prompt = f"""Actúa como un Diseñador de Examen Médico de Élite.
@@ -68,7 +77,7 @@ REGLAS:
                 if not any(word in clean_name.lower() for word in prohibited) and len(clean_name) > 4:
                     # Evitar duplicados exactos en la lista temporal
                     if clean_name not in subtopics:
-                        subtopics.append(clean_name[:25]) # Un poco más de margen
+                        subtopics.append(self._shorten(clean_name))
             
             if subtopics:
                 print(f"DEBUG: Extracted & Cleaned subtopics: {subtopics}")
@@ -79,63 +88,117 @@ REGLAS:
         
         return []
 
+    @staticmethod
+    def _shorten(name, limit=60):
+        """Caps a subtopic name at a word boundary (a hard 25-char cut produced half words)."""
+        if len(name) <= limit:
+            return name
+        words = name[:limit].rsplit(' ', 1)[0].split()
+        while len(words) > 1 and words[-1].lower() in topic_similarity.STOPWORDS:
+            words.pop()
+        return ' '.join(words)
+
     def expand_graph(self, parent_node_label):
         """Expands the graph with new subtopics from the parent."""
         print(f"🌲 Expandiendo grafo desde: {parent_node_label}")
-        subtopics = self.suggest_subtopics(parent_node_label)
-        if not subtopics:
+        parent = self.graph.find_node(parent_node_label)
+        if parent is None:
             return False
+        return self.expand_frontier([parent])["new_nodes"] > 0
 
-        conn = self._get_conn()
-        c = conn.cursor()
-        
-        try:
-            with open(self.graph_path, 'r') as f:
-                graph = json.load(f)
-            
-            # Find parent ID
-            parent_id = None
-            for node in graph['nodes']:
-                if node['label'].replace('\n', ' ') == parent_node_label:
-                    parent_id = node['id']
+    def expand_frontier(self, parents=None, depth=1, workers=BRANCH_WORKERS, limit=None):
+        """Breadth-first batch expansion.
+
+        parents: nodes (dicts with id/label) or labels; default: the graph's
+        leaves (GraphStore.leaves, up to `limit`). Each level asks the local
+        model for every parent concurrently (bounded pool), then writes all
+        new topics in one executemany and all nodes + edges in one graph
+        transaction; the new nodes are the next level's frontier.
+        Every suggestion is checked against the syllabus (and its siblings) with
+        topic_similarity: near-duplicates above TOPIC_DUP_THRESHOLD are merged
+        into the existing topic instead of becoming a new one; merges and
+        borderline matches go to topic_dedup_audit.
+        Returns throughput stats.
+        """
+        from notebook_adapter import NotebookAdapter
+        nb = NotebookAdapter()
+        if parents is None:
+            frontier = self.graph.leaves(limit)
+        else:
+            frontier = [p if isinstance(p, dict) else self.graph.find_node(p) for p in parents]
+            frontier = [p for p in frontier if p]
+
+        index = topic_similarity.load_index(self.db_path)
+        stats = {"levels": 0, "parents": 0, "suggested": 0, "new_nodes": 0, "skipped": 0, "merged": 0, "near": 0,
+                 "llm_s": 0.0, "apply_ms": 0.0, "ids": []}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="branch") as pool:
+            for _ in range(depth):
+                if not frontier:
                     break
-            
-            if parent_id is None:
-                return False
+                t0 = time.perf_counter()
+                labels = [' '.join(p['label'].split()) for p in frontier]
+                suggestions = list(pool.map(lambda label: self.suggest_subtopics(label, nb) or [], labels))
+                stats["llm_s"] += time.perf_counter() - t0
 
-            new_node_id = max([n['id'] for n in graph['nodes']] + [0]) + 1
-            
-            for sub in subtopics:
-                # 1. Insert into DB if not exists
-                try:
-                    c.execute("INSERT OR IGNORE INTO topics (title, priority) VALUES (?, ?)", (sub, 40))
-                except: pass
-                
-                # 2. Add to graph_data.json
-                graph['nodes'].append({
-                    "id": new_node_id,
-                    "label": sub,
-                    "group": "locked",
-                    "title": f"Subtema de {parent_node_label}"
-                })
-                
-                # 3. Add edge from parent to sub
-                graph['edges'].append({
-                    "from": parent_id,
-                    "to": new_node_id,
-                    "dashes": True,
-                    "label": "Derivación"
-                })
-                
-                new_node_id += 1
-            
-            with open(self.graph_path, 'w') as f:
-                json.dump(graph, f, indent=4)
-            
-            conn.commit()
-            return True
-        except Exception as e:
-            print(f"⚠️ Error expandiendo grafo: {e}")
-            return False
-        finally:
-            conn.close()
+                expansions, decisions = [], []
+                for parent, label, subs in zip(frontier, labels, suggestions):
+                    subs = [str(sub).strip() for sub in subs if str(sub).strip()]
+                    stats["suggested"] += len(subs)
+                    kept = []
+                    for sub in subs:
+                        action, match = index.check(sub)
+                        decisions.append({"suggested": sub, "parent": label, "action": action, "match": match})
+                        if action == 'merged':
+                            stats["merged"] += 1
+                            print(f"🔁 [Branching] '{sub}' ≈ '{match[1]}' ({match[2]:.2f}), no se duplica")
+                            continue
+                        stats["near"] += action == 'near'
+                        index.add(f"new:{sub}", sub) # siblings in this batch dedupe against it too
+                        kept.append(sub)
+                    expansions.append((parent['id'], [
+                        {"label": sub, "group": "locked", "title": f"Subtema de {label}"} for sub in kept
+                    ]))
+                topic_similarity.log_decisions(decisions, self.db_path)
+
+                t0 = time.perf_counter()
+                new_titles = [ch['label'] for _, children in expansions for ch in children]
+                conn = self._get_conn()
+                conn.executemany("INSERT OR IGNORE INTO topics (title, priority) VALUES (?, ?)",
+                                 [(t, SUBTOPIC_PRIORITY) for t in dict.fromkeys(new_titles)])
+                conn.commit()
+                conn.close()
+                applied = self.graph.add_children_many(expansions)
+                stats["apply_ms"] += (time.perf_counter() - t0) * 1000
+
+                new_ids = [i for ids in applied["ids"].values() for i in ids]
+                stats["levels"] += 1
+                stats["parents"] += len(frontier)
+                stats["new_nodes"] += len(new_ids)
+                stats["skipped"] += applied["skipped"]
+                stats["ids"] += new_ids
+                frontier = [self.graph.get_node(i) for i in new_ids]
+
+        elapsed = time.perf_counter() - start
+        stats.update(llm_s=round(stats["llm_s"], 2), apply_ms=round(stats["apply_ms"], 1), elapsed_s=round(elapsed, 2),
+                     parents_per_s=round(stats["parents"] / elapsed, 2) if elapsed else 0.0)
+        print(f"🌲 [Branching] {stats['new_nodes']} nodos nuevos desde {stats['parents']} padres "
+              f"en {stats['elapsed_s']}s ({stats['parents_per_s']} padres/s, {stats['merged']} fusionados por similitud, "
+              f"{stats['skipped']} duplicados exactos)")
+        return stats
+
+if __name__ == "__main__":
+    # Usage:
+    #   python branching_engine.py "Asma" "Dengue" [--depth 2] [--workers 4]
+    #   python branching_engine.py --leaves 10 [--depth 1]
+    parser = argparse.ArgumentParser(description="Expansión del grafo de estudio con subtemas (IA local)")
+    parser.add_argument("labels", nargs="*")
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=BRANCH_WORKERS)
+    parser.add_argument("--leaves", type=int, default=None, help="expandir las primeras N hojas del grafo")
+    args = parser.parse_args()
+    if not args.labels and args.leaves is None:
+        parser.error("indica etiquetas o --leaves N")
+    engine = BranchingEngine()
+    result = engine.expand_frontier(args.labels or None, depth=args.depth, workers=args.workers, limit=args.leaves)
+    print(json.dumps({k: v for k, v in result.items() if k != "ids"}, indent=2))
@@ -0,0 +1,206 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+DB_PATH = 'temario.db'
+MASTERY_GOAL = 3
+CLAIM_TTL_MINUTES = 10 # a 'generating' claim older than this is considered abandoned
+
+def target_topic_of(node):
+    """Topic string used for sessions/challenges (same cleaning as study_core)."""
+    return node['label'].replace('\n', ' ').strip()
+
+class ChallengePool:
+    """Ready-made challenges keyed by (target_topic, m_level).
+
+    Shared through temario.db so the bot and the dashboard pop from the same
+    pool. A slot is claimed ('generating') before calling the LLM so two
+    workers never generate the same challenge.
+    """
+
+    def __init__(self, db_path=DB_PATH, lookahead=3):
+        self.db_path = db_path
+        self.lookahead = lookahead
+        self.setup_db()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def setup_db(self):
+        conn = self._get_conn()
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS challenge_pool (
+            target_topic TEXT NOT NULL,
+            m_level INTEGER NOT NULL,
+            status TEXT NOT NULL, -- generating, ready
+            payload_json TEXT,
+            created_at TEXT,
+            PRIMARY KEY (target_topic, m_level)
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS challenge_pool_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0,
+            generated INTEGER NOT NULL DEFAULT 0
+        )''')
+        c.execute('INSERT OR IGNORE INTO challenge_pool_stats (id) VALUES (1)')
+        conn.commit()
+        conn.close()
+
+    def pop(self, target_topic, m_level, accept=None):
+        """Removes and returns a ready challenge, or None (counted as a miss).
+
+        accept(payload) -> bool filters per student (e.g. a question they already
+        saw); a rejected challenge stays in the pool for the others.
+        """
+        conn = self._get_conn()
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            row = c.execute('''
+                SELECT payload_json FROM challenge_pool
+                WHERE target_topic = ? AND m_level = ? AND status = 'ready'
+            ''', (target_topic, m_level)).fetchone()
+            if row and accept and not accept(json.loads(row['payload_json'])):
+                row = None
+            if row:
+                c.execute('DELETE FROM challenge_pool WHERE target_topic = ? AND m_level = ?', (target_topic, m_level))
+            c.execute(f"UPDATE challenge_pool_stats SET {'hits = hits' if row else 'misses = misses'} + 1 WHERE id = 1")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return json.loads(row['payload_json']) if row else None
+
+    def claim(self, target_topic, m_level):
+        """Reserves a slot for generation. False if it is ready or being generated."""
+        now = datetime.now()
+        stale = (now - timedelta(minutes=CLAIM_TTL_MINUTES)).isoformat()
+        conn = self._get_conn()
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            c.execute('''
+                DELETE FROM challenge_pool
+                WHERE target_topic = ? AND m_level = ? AND status = 'generating' AND created_at < ?
+            ''', (target_topic, m_level, stale))
+            c.execute('''
+                INSERT OR IGNORE INTO challenge_pool (target_topic, m_level, status, created_at)
+                VALUES (?, ?, 'generating', ?)
+            ''', (target_topic, m_level, now.isoformat()))
+            claimed = c.rowcount == 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return claimed
+
+    def fulfil(self, target_topic, m_level, payload):
+        conn = self._get_conn()
+        c = conn.cursor()
+        if payload:
+            c.execute('''
+                UPDATE challenge_pool SET status = 'ready', payload_json = ?, created_at = ?
+                WHERE target_topic = ? AND m_level = ?
+            ''', (json.dumps(payload, ensure_ascii=False), datetime.now().isoformat(), target_topic, m_level))
+            c.execute('UPDATE challenge_pool_stats SET generated = generated + 1 WHERE id = 1')
+        else:
+            c.execute("DELETE FROM challenge_pool WHERE target_topic = ? AND m_level = ? AND status = 'generating'",
+                      (target_topic, m_level))
+        conn.commit()
+        conn.close()
+
+    def wanted_slots(self, active_node, upcoming_nodes):
+        """Slots worth having ready: the active node's remaining mastery levels
+        plus level 0 of the next `lookahead` locked nodes."""
+        slots = []
+        if active_node:
+            topic = target_topic_of(active_node)
+            slots += [(topic, level) for level in range(active_node.get('mastery_level', 0), MASTERY_GOAL)]
+        for node in upcoming_nodes[:self.lookahead]:
+            slots.append((target_topic_of(node), 0))
+        return slots
+
+    def prune(self, keep_slots):
+        """Drops ready challenges for nodes that are no longer active/upcoming."""
+        conn = self._get_conn()
+        c = conn.cursor()
+        keep = set(keep_slots)
+        rows = c.execute("SELECT target_topic, m_level FROM challenge_pool WHERE status = 'ready'").fetchall()
+        stale = [(r['target_topic'], r['m_level']) for r in rows if (r['target_topic'], r['m_level']) not in keep]
+        c.executemany('DELETE FROM challenge_pool WHERE target_topic = ? AND m_level = ?', stale)
+        conn.commit()
+        conn.close()
+        return len(stale)
+
+    def refill(self, slots, generate_fn):
+        """Generates every missing slot (in order). Returns how many were added."""
+        added = 0
+        for target_topic, m_level in slots:
+            if not self.claim(target_topic, m_level):
+                continue
+            payload = None
+            try:
+                payload = generate_fn(target_topic, m_level)
+            except Exception as e:
+                print(f"⚠️ [Pool] Error generando {target_topic} L{m_level}: {e}")
+            self.fulfil(target_topic, m_level, payload)
+            added += 1 if payload else 0
+        return added
+
+    def stats(self):
+        conn = self._get_conn()
+        c = conn.cursor()
+        row = c.execute('SELECT hits, misses, generated FROM challenge_pool_stats WHERE id = 1').fetchone()
+        ready = c.execute("SELECT COUNT(*) FROM challenge_pool WHERE status = 'ready'").fetchone()[0]
+        conn.close()
+        lookups = row['hits'] + row['misses']
+        return {
+            "ready": ready,
+            "hits": row['hits'],
+            "misses": row['misses'],
+            "generated": row['generated'],
+            "hit_rate": round(row['hits'] / lookups, 3) if lookups else 0.0
+        }
+
+class ChallengePoolWorker(threading.Thread):
+    """Background refill loop. kick() wakes it up right after a pop/review."""
+
+    def __init__(self, pool, slots_fn, generate_fn, interval=120):
+        super().__init__(daemon=True, name="challenge-pool")
+        self.pool = pool
+        self.slots_fn = slots_fn
+        self.generate_fn = generate_fn
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def kick(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        print("🧰 [Pool] Worker de pre-generación iniciado")
+        while not self._stopping.is_set():
+            try:
+                slots = self.slots_fn()
+                self.pool.prune(slots)
+                start = time.time()
+                added = self.pool.refill(slots, self.generate_fn)
+                if added:
+                    print(f"🧰 [Pool] +{added} retos listos en {time.time() - start:.1f}s | {self.pool.stats()}")
+            except Exception as e:
+                print(f"⚠️ [Pool] Error en worker: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import sqlite3
+import datetime
+import topic_index
+import question_bank
+
+DB_PATH = 'temario.db'
+DEFAULT_USER = os.getenv("STUDY_USER", "default")
+# A question the user already saw is served again only after this many days;
+# before that the topic/angle counts as a miss and a new one is generated.
+REUSE_AFTER_DAYS = int(os.getenv("CHALLENGE_REUSE_DAYS", "14"))
+
+def to_challenge(doc, question_id):
+    """Stored bank document -> challenge dict in the Gemini shape the front ends render."""
+    raw = doc.get('raw') or {}
+    challenge = dict(raw) if 'content' in raw and 'correct_answer' in raw else {
+        "type": "selection",
+        "content": doc.get('stem', ''),
+        "options": doc.get('options') or [],
+        "correct_answer": str(doc.get('answer') or '').strip()[:1].upper(),
+        "explanation": doc.get('explanation') or ''
+    }
+    challenge['angle'] = doc.get('angle') or challenge.get('angle')
+    challenge['question_id'] = question_id
+    challenge['source'] = 'bank'
+    return challenge
+
+class ChallengeProvider:
+    """Retrieval-first challenges: a stored question the user hasn't seen
+    (or hasn't seen in REUSE_AFTER_DAYS) before any LLM call.
+
+    Exposures are tracked per user in `question_exposures` (same temario.db
+    as the bank), so the bot, the dashboard and the diagnostic share history.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.bank = question_bank.get_bank(db_path)
+        self.setup_db()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def setup_db(self):
+        conn = self._get_conn()
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS question_exposures (
+            user_id TEXT NOT NULL,
+            question_id INTEGER NOT NULL,
+            seen_count INTEGER NOT NULL DEFAULT 0,
+            first_seen TEXT,
+            last_seen TEXT,
+            PRIMARY KEY (user_id, question_id)
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS challenge_provider_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            bank_hits INTEGER NOT NULL DEFAULT 0,
+            generated INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0
+        )''')
+        c.execute('INSERT OR IGNORE INTO challenge_provider_stats (id) VALUES (1)')
+        conn.commit()
+        conn.close()
+
+    def lookup(self, topic, angle=None, user_id=DEFAULT_USER, now=None):
+        """Best stored question for (topic, angle): unseen first (oldest first), then the
+        least recently seen one older than REUSE_AFTER_DAYS. None on a miss."""
+        now = now or datetime.datetime.now()
+        cutoff = (now - datetime.timedelta(days=REUSE_AFTER_DAYS)).isoformat()
+        sql = '''
+            SELECT q.id, q.content_json FROM questions q
+            LEFT JOIN question_exposures e ON e.question_id = q.id AND e.user_id = ?
+            WHERE q.topic_key = ? AND q.format = 'mcq'
+        '''
+        params = [user_id, topic_index.normalize_key(topic)]
+        if angle:
+            sql += ' AND q.angle = ?'
+            params.append(angle)
+        sql += ' AND (e.last_seen IS NULL OR e.last_seen < ?) ORDER BY e.last_seen IS NOT NULL, e.last_seen, q.id LIMIT 1'
+        conn = self._get_conn()
+        row = conn.execute(sql, (*params, cutoff)).fetchone()
+        conn.close()
+        if not row:
+            return None
+        doc = json.loads(row['content_json'])
+        if not doc.get('stem') or not doc.get('options'):
+            return None
+        return to_challenge(doc, row['id'])
+
+    def seen_recently(self, question_id, user_id=DEFAULT_USER, now=None):
+        """True if the user saw the question less than REUSE_AFTER_DAYS ago (the rule lookup applies)."""
+        if question_id is None:
+            return False
+        cutoff = ((now or datetime.datetime.now()) - datetime.timedelta(days=REUSE_AFTER_DAYS)).isoformat()
+        conn = self._get_conn()
+        row = conn.execute('SELECT 1 FROM question_exposures WHERE user_id = ? AND question_id = ? AND last_seen >= ?',
+                           (user_id, question_id, cutoff)).fetchone()
+        conn.close()
+        return row is not None
+
+    def mark_seen(self, question_id, user_id=DEFAULT_USER, now=None):
+        if question_id is None:
+            return
+        now = (now or datetime.datetime.now()).isoformat()
+        conn = self._get_conn()
+        conn.execute('''
+            INSERT INTO question_exposures (user_id, question_id, seen_count, first_seen, last_seen)
+            VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT(user_id, question_id) DO UPDATE SET seen_count = seen_count + 1, last_seen = excluded.last_seen
+        ''', (user_id, question_id, now, now))
+        conn.commit()
+        conn.close()
+
+    def _count(self, column):
+        conn = self._get_conn()
+        conn.execute(f'UPDATE challenge_provider_stats SET {column} = {column} + 1 WHERE id = 1')
+        conn.commit()
+        conn.close()
+
+    def get_challenge(self, topic, angle=None, generate_fn=None, user_id=DEFAULT_USER, mark=True):
+        """Stored question if one is eligible, else generate_fn() (Gemini / local model).
+
+        Generated challenges are already written to the bank by the adapters; the
+        returned dict carries its question_id so the exposure can be recorded.
+        mark=False leaves the exposure to the caller (e.g. pre-generated pool slots
+        are marked when actually served).
+        """
+        challenge = self.lookup(topic, angle, user_id)
+        if challenge:
+            print(f"📚 [Banco] Reto reutilizado (#{challenge['question_id']}) para: {topic} ({angle})")
+            self._count('bank_hits')
+        elif generate_fn:
+            challenge = generate_fn()
+            if not challenge:
+                self._count('failed')
+                return None
+            self._count('generated')
+            challenge['question_id'] = self.bank.find_id(challenge, topic)
+            challenge['source'] = 'generated'
+        if challenge and mark:
+            self.mark_seen(challenge['question_id'], user_id)
+        return challenge
+
+    def stats(self, user_id=DEFAULT_USER):
+        conn = self._get_conn()
+        c = conn.cursor()
+        row = c.execute('SELECT bank_hits, generated, failed FROM challenge_provider_stats WHERE id = 1').fetchone()
+        seen = c.execute('SELECT COUNT(*) FROM question_exposures WHERE user_id = ?', (user_id,)).fetchone()[0]
+        total = c.execute("SELECT COUNT(*) FROM questions WHERE format = 'mcq'").fetchone()[0]
+        conn.close()
+        served = row['bank_hits'] + row['generated']
+        return {
+            "bank_hits": row['bank_hits'],
+            "generated": row['generated'],
+            "failed": row['failed'],
+            "reuse_rate": round(row['bank_hits'] / served, 3) if served else 0.0,
+            "bank_size": total,
+            "seen_by_user": seen
+        }
+
+_providers = {}
+
+def get_provider(db_path=None):
+    db_path = db_path or DB_PATH
+    if db_path not in _providers:
+        _providers[db_path] = ChallengeProvider(db_path)
+    return _providers[db_path]
+
+if __name__ == "__main__":
+    # Usage:
+    #   python challenge_provider.py stats [user_id]
+    #   python challenge_provider.py peek <topic> [angle] [user_id]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    provider = get_provider()
+    if command == 'peek' and len(sys.argv) > 2:
+        angle = sys.argv[3] if len(sys.argv) > 3 else None
+        user = sys.argv[4] if len(sys.argv) > 4 else DEFAULT_USER
+        print(json.dumps(provider.lookup(sys.argv[2], angle, user), ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(provider.stats(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_USER), indent=2))
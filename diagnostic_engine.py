@@ -1,106 +1,363 @@
 import sqlite3
+import argparse
+import datetime
 import json
 import random
 import time
 import sys
 import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import adaptive_diagnostic
+import agent_srs
+import challenge_provider
+import scheduler
+import topic_index
 from gemini_adapter import GeminiAdapter
 from notebook_adapter import NotebookAdapter
 
+GEN_WORKERS = int(os.getenv("DIAGNOSTIC_GEN_WORKERS", "4"))
+SPARE_TOPICS = 5 # alternates that replace topics whose generation fails
+
+class ChallengePrefetcher:
+    """Generates every challenge of a simulacro in the background, delivered in order.
+
+    One task per slot on a bounded thread pool; a slot whose generation fails
+    takes the next alternate topic inside the same task, so the user only
+    waits for the first question and failures don't shorten the test.
+    """
+
+    def __init__(self, generate_fn, topics, alternates=(), workers=GEN_WORKERS):
+        self.generate_fn = generate_fn
+        self._alternates = deque(alternates)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="simulacro")
+        self._futures = [self._executor.submit(self._fill, topic) for topic in topics]
+
+    def _next_alternate(self):
+        with self._lock:
+            return self._alternates.popleft() if self._alternates else None
+
+    def _fill(self, topic):
+        while topic is not None:
+            title = topic[0]
+            try:
+                challenge = self.generate_fn(title)
+                if challenge:
+                    return topic, challenge
+                print(f"  ⚠️ Falló la generación para {title}, usando tema alterno...")
+            except Exception as e:
+                print(f"  ⚠️ Error generando {title}: {e}. Usando tema alterno...")
+            topic = self._next_alternate()
+        return None
+
+    def __iter__(self):
+        """Yields (topic_row, challenge) in selection order; slots with no usable topic are skipped."""
+        try:
+            for future in self._futures:
+                result = future.result()
+                if result:
+                    yield result
+        finally:
+            self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class DiagnosticSession:
+    """Headless diagnostic: start() -> next_item() -> submit()/skip() ... -> finish().
+
+    No input()/print() of its own, so the terminal, the web app, the bot or a
+    load test can drive it. Fixed mode prefetches every question concurrently
+    (ChallengePrefetcher); adaptive mode uses AdaptiveSession and pre-generates
+    the next item for both outcomes. Every item records how long generation
+    took, how long the caller waited for it and the response latency.
+    """
+
+    def __init__(self, engine, count=20, adaptive=False, se_target=adaptive_diagnostic.SE_TARGET,
+                 specialties=None, save=True):
+        self.engine = engine
+        self.count = count
+        self.adaptive = adaptive
+        self.se_target = se_target
+        self.specialties = specialties
+        self.save = save
+        self.items = []    # one entry per delivered item (answered or skipped)
+        self.results = []  # answered items, in the format save_baseline expects
+        self.current = None
+        self.summary = None
+        self._started_at = None
+
+    def _generate(self, title):
+        start = time.perf_counter()
+        challenge = self.engine.get_challenge(title, mark=False)
+        if challenge:
+            challenge['generation_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        return challenge
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        if self.adaptive:
+            self.cat = adaptive_diagnostic.AdaptiveSession(adaptive_diagnostic.load_items(self.engine.db_path),
+                                                           self.se_target, self.count, self.specialties)
+            self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cat")
+            self._pending = {} # topic id -> future
+        else:
+            selected = self.engine.get_diagnostic_topics(self.count + SPARE_TOPICS)
+            topics, alternates = selected[:self.count], selected[self.count:]
+            self._prefetcher = ChallengePrefetcher(self._generate, topics, alternates)
+            self._stream = iter(self._prefetcher)
+        return self
+
+    def _next_fixed(self):
+        nxt = next(self._stream, None)
+        if nxt is None:
+            return None
+        (title, priority), challenge = nxt
+        return {"topic": title, "priority": priority}, challenge
+
+    def _next_adaptive(self):
+        while (item := self.cat.next_item()) is not None:
+            future = self._pending.pop(item['id'], None) or self._executor.submit(self._generate, item['title'])
+            try:
+                challenge = future.result()
+            except Exception as e:
+                print(f"  ⚠️ Error generando {item['title']}: {e}")
+                challenge = None
+            if not challenge:
+                self.cat.exclude(item)
+                continue
+            for correct in (True, False):
+                upcoming = self.cat.next_item_if(item, correct)
+                if upcoming and upcoming['id'] not in self._pending:
+                    self._pending[upcoming['id']] = self._executor.submit(self._generate, upcoming['title'])
+            est = self.cat.estimates()[item['specialty']]
+            return {"topic": item['title'], "priority": item['priority'], "specialty": item['specialty'],
+                    "theta": est['theta'], "se": est['se'], "_cat_item": item}, challenge
+        return None
+
+    def next_item(self):
+        """Next question (without its answer), or None when the diagnostic is over.
+        Returns the same unanswered item again if called twice."""
+        if self.current:
+            return self.current['public']
+        if self.summary is not None:
+            return None
+        start = time.perf_counter()
+        nxt = self._next_adaptive() if self.adaptive else self._next_fixed()
+        if nxt is None:
+            return None
+        meta, challenge = nxt
+        self.engine.provider.mark_seen(challenge.get('question_id'), self.engine.user_id)
+        public = {k: v for k, v in meta.items() if not k.startswith('_')}
+        public.update({
+            "index": len(self.items) + 1,
+            "content": challenge['content'],
+            "options": challenge['options'],
+            "question_id": challenge.get('question_id'),
+            "source": challenge.get('source')
+        })
+        self.current = {
+            "public": public,
+            "meta": meta,
+            "challenge": challenge,
+            "wait_ms": round((time.perf_counter() - start) * 1000, 1),
+            "shown_at": time.perf_counter()
+        }
+        return public
+
+    def _close_item(self, answer, response_ms):
+        cur = self.current
+        self.current = None
+        if response_ms is None:
+            response_ms = round((time.perf_counter() - cur['shown_at']) * 1000, 1)
+        record = {
+            "index": cur['public']['index'],
+            "topic": cur['meta']['topic'],
+            "question_id": cur['challenge'].get('question_id'),
+            "source": cur['challenge'].get('source'),
+            "generation_ms": cur['challenge'].get('generation_ms'),
+            "wait_ms": cur['wait_ms'],
+            "response_ms": response_ms,
+            "answer": answer,
+            "correct_answer": cur['challenge']['correct_answer'],
+            "is_correct": None if answer is None else answer == cur['challenge']['correct_answer']
+        }
+        self.items.append(record)
+        return cur, record
+
+    def submit(self, answer, response_ms=None):
+        """Grades the current item. response_ms defaults to the time since next_item()."""
+        if not self.current:
+            raise RuntimeError("no item pending: call next_item() first")
+        cur, record = self._close_item(str(answer).strip().upper()[:1], response_ms)
+        if self.adaptive:
+            self.cat.record(cur['meta']['_cat_item'], record['is_correct'])
+        self.results.append({
+            "title": record['topic'],
+            "is_correct": record['is_correct'],
+            "duration": record['response_ms'] / 1000,
+            "reviewed_at": datetime.datetime.now().isoformat()
+        })
+        return {
+            "is_correct": record['is_correct'],
+            "correct_answer": record['correct_answer'],
+            "explanation": cur['challenge'].get('explanation', '')
+        }
+
+    def skip(self, response_ms=None):
+        if not self.current:
+            raise RuntimeError("no item pending: call next_item() first")
+        cur, _ = self._close_item(None, response_ms)
+        if self.adaptive:
+            self.cat.exclude(cur['meta']['_cat_item'])
+
+    def finish(self):
+        """Stops generation, writes the baseline (once) and returns the JSON summary."""
+        if self.summary is not None:
+            return self.summary
+        if self.adaptive:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            self._prefetcher.close()
+        abilities = self.cat.estimates() if self.adaptive else {}
+        if self.save:
+            if abilities:
+                adaptive_diagnostic.save_estimates(abilities, self.engine.db_path, self.engine.user_id)
+            self.engine.save_baseline(self.results)
+
+        answered = [r for r in self.items if r['answer'] is not None]
+        waits = sorted(r['wait_ms'] for r in self.items)
+        self.summary = {
+            "mode": "adaptive" if self.adaptive else "fixed",
+            "items": self.items,
+            "answered": len(answered),
+            "correct": sum(1 for r in answered if r['is_correct']),
+            "accuracy": round(sum(1 for r in answered if r['is_correct']) / len(answered), 3) if answered else None,
+            "first_item_wait_ms": self.items[0]['wait_ms'] if self.items else None,
+            "max_wait_ms": waits[-1] if waits else None,
+            "mean_response_ms": round(sum(r['response_ms'] for r in answered) / len(answered), 1) if answered else None,
+            "from_bank": sum(1 for r in self.items if r['source'] == 'bank'),
+            "elapsed_s": round(time.perf_counter() - self._started_at, 2),
+            "abilities": abilities
+        }
+        return self.summary
+
 class DiagnosticEngine:
-    def __init__(self, db_path='temario.db'):
+    def __init__(self, db_path='temario.db', user_id=challenge_provider.DEFAULT_USER):
         self.db_path = db_path
+        self.user_id = user_id
         self.gemini = GeminiAdapter()
         self.nb = NotebookAdapter()
+        self.provider = challenge_provider.get_provider(db_path)
+
+    def get_challenge(self, title, angle="Diagnosis", mark=True):
+        """Stored unseen question for the topic, or a new Gemini challenge on a miss."""
+        def generate():
+            res = self.nb.resolve_topic_acronym(title)
+            full_title = res.get('full_title', title)
+            context = res.get('context', f'Guía clínica sobre {title}')
+            return self.gemini.generate_clinical_challenge(title, full_title, context, angle=angle)
+        return self.provider.get_challenge(title, angle, generate, self.user_id, mark=mark)
 
     def get_diagnostic_topics(self, n=20):
         """Selects n high-priority or unknown topics for the baseline test."""
         conn = sqlite3.connect(self.db_path)
         c = conn.cursor()
-        # Prioritize topics with priority 90+ that haven't been reviewed much
-        c.execute("SELECT title, priority FROM topics WHERE priority >= 80 ORDER BY RANDOM() LIMIT ?", (n,))
-        topics = c.fetchall()
+        # Random sample over the priority index (idx_topics_priority, created by agent_srs.setup_db)
+        ids = [r[0] for r in c.execute("SELECT id FROM topics WHERE priority >= ?", (adaptive_diagnostic.MIN_PRIORITY,))]
+        sample = random.sample(ids, min(n, len(ids)))
+        if not sample:
+            conn.close()
+            return []
+        rows = dict((r[0], (r[1], r[2])) for r in c.execute(
+            f"SELECT id, title, priority FROM topics WHERE id IN ({','.join('?' * len(sample))})", sample))
         conn.close()
-        return topics
+        return [rows[i] for i in sample]
+
+    def start_session(self, count=20, adaptive=False, **options):
+        """Non-interactive diagnostic (see DiagnosticSession); generation starts now."""
+        return DiagnosticSession(self, count, adaptive, **options).start()
 
     def run_simulacro(self, count=20):
         print("="*60)
         print(f"🚀 INICIANDO SIMULACRO DE DIAGNÓSTICO CORTEX ({count} TEMAS)")
         print("="*60)
-        
-        topics = self.get_diagnostic_topics(count)
-        results = []
+        self.run_interactive(self.start_session(count))
 
-        for i, (title, prio) in enumerate(topics):
-            print(f"\n[{i+1}/{count}] TEMA: {title} (Prioridad: {prio})")
-            
-            # 1. Resolve context
-            res = self.nb.resolve_topic_acronym(title)
-            full_title = res.get('full_title', title)
-            context = res.get('context', f'Guía clínica sobre {title}')
-            
-            # 2. Generate Challenge (Angle: Diagnosis)
-            try:
-                challenge = self.gemini.generate_clinical_challenge(title, full_title, context)
-                if not challenge:
-                    print("  ⚠️ Falló Gemini, saltando tema...")
-                    continue
-                
-                print(f"\n{challenge['content']}")
-                for opt in challenge['options']:
-                    print(f"  {opt}")
-                
-                start_time = time.time()
-                ans = input("\n👉 Tu respuesta (A, B, C, D) o Enter para saltar: ").strip().upper()
-                duration = time.time() - start_time
-                
-                if not ans:
-                    continue
-                
-                is_correct = ans == challenge['correct_answer']
-                if is_correct:
-                    print("  ✅ ¡CORRECTO!")
-                else:
-                    print(f"  ❌ INCORRECTO. La correcta era {challenge['correct_answer']}")
-                
-                print(f"  💡 EXPLICACIÓN: {challenge['explanation'][:200]}...")
-                
-                results.append({
-                    "title": title,
-                    "is_correct": is_correct,
-                    "duration": duration
-                })
-                
-                # Update DB baseline
-                self.update_topic_baseline(title, is_correct)
-                
-            except Exception as e:
-                print(f"  ❌ Error en reto: {e}")
+    def run_adaptive(self, max_items=adaptive_diagnostic.MAX_ITEMS, se_target=adaptive_diagnostic.SE_TARGET,
+                     specialties=None):
+        """Computerized-adaptive diagnostic (adaptive_diagnostic.AdaptiveSession)."""
+        print("="*60)
+        print(f"🎯 DIAGNÓSTICO ADAPTATIVO CORTEX (máx {max_items} ítems, SE global < {se_target})")
+        print("="*60)
+        summary = self.run_interactive(self.start_session(max_items, adaptive=True, se_target=se_target,
+                                                          specialties=specialties))
+        for spec, e in summary['abilities'].items():
+            print(f"  {spec:<14} θ={e['theta']:+.2f}  SE={e['se']:.2f}  ({e['items']} ítems)")
+        return summary['abilities']
 
-        self.print_summary(results)
+    def run_interactive(self, session):
+        """Terminal front end (print/input) over a DiagnosticSession.
 
-    def update_topic_baseline(self, title, is_correct):
-        """Sets the initial SRS parameters in the database."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
-        # SM-2 inspired baseline
-        # Ease factor: 2.5 (avg), Interval: 1 day if correct, 0 if wrong
-        if is_correct:
-            ef = 2.5
-            interval = 1
-        else:
-            ef = 1.3
-            interval = 0
-            
-        c.execute("""
-            UPDATE topics 
-            SET ease_factor = ?, interval = ?, next_review = date('now', '+' || ? || ' days')
-            WHERE title = ?
-        """, (ef, interval, interval, title))
-        
-        conn.commit()
+        Ctrl+C / EOF ends the session early: the answers given so far are still
+        saved (finish() runs in the finally).
+        """
+        try:
+            self._ask_items(session)
+        except (KeyboardInterrupt, EOFError):
+            print(f"\n⏹️ Diagnóstico interrumpido: se guardan {len(session.results)} respuestas.")
+        finally:
+            summary = session.finish()
+        self.print_summary(session.results)
+        return summary
+
+    def _ask_items(self, session):
+        while (item := session.next_item()) is not None:
+            header = f"\n[{item['index']}/{session.count}]"
+            if 'theta' in item:
+                header += f" {item['specialty']} | TEMA: {item['topic']} (θ={item['theta']:+.2f} ± {item['se']:.2f})"
+            else:
+                header += f" TEMA: {item['topic']} (Prioridad: {item['priority']})"
+            print(header)
+            print(f"\n{item['content']}")
+            for opt in item['options']:
+                print(f"  {opt}")
+
+            ans = input("\n👉 Tu respuesta (A, B, C, D) o Enter para saltar: ").strip().upper()
+            if not ans:
+                session.skip()
+                continue
+            res = session.submit(ans)
+            if res['is_correct']:
+                print("  ✅ ¡CORRECTO!")
+            else:
+                print(f"  ❌ INCORRECTO. La correcta era {res['correct_answer']}")
+            print(f"  💡 EXPLICACIÓN: {res['explanation'][:200]}...")
+
+    def save_baseline(self, results):
+        """Feeds the diagnostic answers into the SRS (progress + review_log) in one batch.
+
+        A correct answer counts as Good and a miss as Again, scheduled by the
+        same scheduler as every other review (agent_srs.update_progress_many).
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        ratings = []
+        for r in results:
+            topic_id = topic_index.resolve_topic_id(r['title'], conn)
+            if topic_id is None:
+                print(f"  ⚠️ Tema no encontrado en temario.db: {r['title']}")
+                continue
+            ratings.append({
+                "topic_id": topic_id,
+                "rating": scheduler.GOOD if r['is_correct'] else scheduler.AGAIN,
+                "latency_ms": int(r['duration'] * 1000),
+                "reviewed_at": r['reviewed_at']
+            })
         conn.close()
+        if ratings:
+            agent_srs.update_progress_many(ratings, client='diagnostic')
 
     def print_summary(self, results):
         if not results:
@@ -119,8 +376,54 @@ class DiagnosticEngine:
         print("  Los intervalos de repaso han sido actualizados en temario.db")
         print("="*60)
 
+def replay(session, answers):
+    """Drives a session from recorded answers (answers-file CLI / load tests).
+
+    Each entry is a letter, null (skip), "correct"/"wrong" (graded against the
+    item's key) or {"answer": ..., "response_ms": ...}. Items beyond the list
+    end the session.
+    """
+    for entry in answers:
+        if session.next_item() is None:
+            break
+        response_ms = None
+        if isinstance(entry, dict):
+            response_ms = entry.get('response_ms')
+            entry = entry.get('answer')
+        if entry is None:
+            session.skip(response_ms)
+            continue
+        key = session.current['challenge']['correct_answer']
+        if entry == 'correct':
+            entry = key
+        elif entry == 'wrong':
+            entry = next(l for l in "ABCDE" if l != key)
+        session.submit(entry, response_ms)
+    return session.finish()
+
 if __name__ == "__main__":
+    # Usage:
+    #   python diagnostic_engine.py [--test] [--adaptive]                 (interactivo)
+    #   python diagnostic_engine.py --answers respuestas.json [--adaptive] [--count 20] [--no-save]
+    #       -> JSON con latencias de generación/espera/respuesta por ítem
+    parser = argparse.ArgumentParser(description="Diagnóstico CORTEX (simulacro fijo o adaptativo)")
+    parser.add_argument("--test", action="store_true", help="solo 3 temas")
+    parser.add_argument("--adaptive", action="store_true")
+    parser.add_argument("--count", type=int, default=None)
+    parser.add_argument("--answers", help="archivo JSON con las respuestas (- = stdin); modo no interactivo")
+    parser.add_argument("--no-save", action="store_true", help="no escribir progress/review_log")
+    args = parser.parse_args()
+
+    agent_srs.setup_db() # schema + indexes once, not inside the item reads
     engine = DiagnosticEngine()
     # If called with --test, only run 3 topics
-    count = 3 if "--test" in sys.argv else 20
-    engine.run_simulacro(count)
+    count = args.count or (3 if args.test else 20)
+    if args.answers:
+        with (sys.stdin if args.answers == '-' else open(args.answers)) as f:
+            answers = json.load(f)
+        session = engine.start_session(count, adaptive=args.adaptive, save=not args.no_save)
+        print(json.dumps(replay(session, answers), ensure_ascii=False, indent=2))
+    elif args.adaptive:
+        engine.run_adaptive(max_items=count)
+    else:
+        engine.run_simulacro(count)
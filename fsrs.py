@@ -0,0 +1,373 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import datetime
+import numpy as np
+import scheduler
+
+# Modelo de memoria estilo FSRS (v4.5): cada ángulo tiene stability (días hasta
+# que la probabilidad de recuerdo cae a 90%) y difficulty (1..10). Se activa con
+# SRS_SCHEDULER=fsrs; los parámetros se ajustan con el historial de review_log.
+
+DB_PATH = 'temario.db'
+PARAMS_PATH = os.getenv("FSRS_PARAMS_PATH", "fsrs_params.json")
+DESIRED_RETENTION = float(os.getenv("FSRS_RETENTION", "0.9"))
+
+DECAY = -0.5
+FACTOR = 19 / 81 # R(t = S) = 0.9
+MAX_HISTORY = 64 # reviews por ángulo que se usan al ajustar
+
+DEFAULT_W = np.array([
+    0.4872, 1.4003, 3.7145, 13.8206,  # stability inicial por rating
+    5.1618, 1.2298,                   # difficulty inicial
+    0.8975, 0.0310,                   # cambio de difficulty, reversión a la media
+    1.6474, 0.1367, 1.0461,           # stability tras recordar
+    2.1072, 0.0793, 0.3246, 1.5870,   # stability tras olvidar
+    0.2272, 2.8755                    # penalización Hard, bonus Easy
+])
+W_LOWER = np.array([0.01, 0.01, 0.01, 0.01, 1.0, 0.01, 0.01, 0.0, 0.0, 0.0, 0.01, 0.01, 0.01, 0.01, 0.01, 0.0, 1.0])
+W_UPPER = np.array([100.0, 100.0, 100.0, 100.0, 10.0, 4.0, 4.0, 0.75, 4.5, 0.8, 3.5, 5.0, 0.25, 0.9, 4.0, 1.0, 6.0])
+
+# --- MODELO (escalares o arrays de NumPy) ---
+
+def retrievability(elapsed_days, stability):
+    return (1 + FACTOR * elapsed_days / stability) ** DECAY
+
+def init_stability(w, rating):
+    return w[np.asarray(rating) - 1]
+
+def init_difficulty(w, rating):
+    return np.clip(w[4] - (np.asarray(rating) - 3) * w[5], 1, 10)
+
+def next_difficulty(w, difficulty, rating):
+    shifted = difficulty - w[6] * (np.asarray(rating) - 3)
+    return np.clip(w[7] * init_difficulty(w, 3) + (1 - w[7]) * shifted, 1, 10)
+
+def next_stability(w, difficulty, stability, r, rating):
+    rating = np.asarray(rating)
+    hard_penalty = np.where(rating == scheduler.HARD, w[15], 1.0)
+    easy_bonus = np.where(rating == scheduler.EASY, w[16], 1.0)
+    recalled = stability * (1 + np.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+                            * (np.exp(w[10] * (1 - r)) - 1) * hard_penalty * easy_bonus)
+    forgot = w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1) * np.exp(w[14] * (1 - r))
+    return np.maximum(np.where(rating == scheduler.AGAIN, np.minimum(forgot, stability), recalled), 0.01)
+
+def interval_for(stability, retention=None):
+    """Days until recall probability drops to the desired retention."""
+    retention = retention or DESIRED_RETENTION
+    days = stability / FACTOR * (retention ** (1 / DECAY) - 1)
+    return np.clip(np.round(days), 1, scheduler.MAX_INTERVAL).astype(np.int64)
+
+_params_cache = {}
+
+def load_params(path=None):
+    """Fitted weights from PARAMS_PATH (written by `python fsrs.py fit`), else DEFAULT_W."""
+    path = path or PARAMS_PATH
+    if path not in _params_cache:
+        w = DEFAULT_W
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                w = np.clip(np.array(json.load(f)["w"], dtype=np.float64), W_LOWER, W_UPPER)
+        _params_cache[path] = w
+    return _params_cache[path]
+
+def review(state, rating, now=None, w=None):
+    """New progress columns after one review (same shape as scheduler.review).
+
+    state: progress row as a dict (stability, difficulty, last_reviewed,
+    ease_factor may be missing/None). Rows never scheduled by FSRS start
+    from the initial stability/difficulty of this rating.
+    """
+    w = load_params() if w is None else w
+    now = now or datetime.datetime.now()
+    stability = state.get('stability')
+    difficulty = state.get('difficulty')
+    if stability is None or difficulty is None:
+        new_s = float(init_stability(w, rating))
+        new_d = float(init_difficulty(w, rating))
+    else:
+        last = state.get('last_reviewed')
+        elapsed = (now - datetime.datetime.fromisoformat(last)).total_seconds() / 86400 if last else 0.0
+        r = retrievability(max(elapsed, 0.0), stability)
+        new_d = float(next_difficulty(w, difficulty, rating))
+        new_s = float(next_stability(w, difficulty, stability, r, rating))
+    interval = int(interval_for(new_s))
+    return {
+        "status": scheduler.STATUS[rating],
+        "interval": interval,
+        "ease_factor": state.get('ease_factor') or scheduler.DEFAULT_EASE,
+        "stability": new_s,
+        "difficulty": new_d,
+        "next_review": (now + datetime.timedelta(days=interval)).isoformat()
+    }
+
+# --- HISTORIAL Y AJUSTE ---
+
+def load_histories(conn, max_len=MAX_HISTORY):
+    """review_log as padded arrays: one row per (student, angle), one column per review.
+
+    Returns (ratings, elapsed_days, mask, keys) with keys = (user_id, angle_id)
+    (user_id None = default user); elapsed_days[:, k] is the time since review
+    k-1 (0 for the first review). Each student's reviews of an angle are a
+    separate memory history, never merged.
+    """
+    has_user = 'user_id' in [r[1] for r in conn.execute('PRAGMA table_info(review_log)')]
+    rows = conn.execute(f'''
+        SELECT {'user_id' if has_user else 'NULL'}, angle_id, reviewed_at, rating FROM review_log
+        WHERE angle_id IS NOT NULL AND rating BETWEEN 1 AND 4
+        ORDER BY {'user_id, ' if has_user else ''}angle_id, reviewed_at
+    ''').fetchall()
+    sequences = {}
+    for user_id, angle_id, reviewed_at, rating in rows:
+        seq = sequences.setdefault((user_id, angle_id), [])
+        if len(seq) < max_len:
+            seq.append((datetime.datetime.fromisoformat(reviewed_at), rating))
+    return _pad([(key, seq) for key, seq in sequences.items() if len(seq) >= 2])
+
+def _pad(sequences):
+    n = len(sequences)
+    length = max((len(seq) for _, seq in sequences), default=0)
+    ratings = np.full((n, length), scheduler.GOOD, dtype=np.int64)
+    elapsed = np.zeros((n, length))
+    mask = np.zeros((n, length), dtype=bool)
+    for row, (_, seq) in enumerate(sequences):
+        ratings[row, :len(seq)] = [r for _, r in seq]
+        elapsed[row, 1:len(seq)] = [(b[0] - a[0]).total_seconds() / 86400 for a, b in zip(seq, seq[1:])]
+        mask[row, :len(seq)] = True
+    return ratings, elapsed, mask, [key for key, _ in sequences]
+
+def predict(w, ratings, elapsed, mask):
+    """Predicted recall probability before every review after the first (vectorized over angles)."""
+    n, length = ratings.shape
+    pred = np.full((n, length), np.nan)
+    if not length:
+        return pred
+    s = init_stability(w, ratings[:, 0])
+    d = init_difficulty(w, ratings[:, 0])
+    for k in range(1, length):
+        active = mask[:, k]
+        r = retrievability(elapsed[:, k], s)
+        pred[:, k] = np.where(active, r, np.nan)
+        new_s = next_stability(w, d, s, r, ratings[:, k])
+        new_d = next_difficulty(w, d, ratings[:, k])
+        s = np.where(active, new_s, s)
+        d = np.where(active, new_d, d)
+    return pred
+
+def log_loss(w, data):
+    ratings, elapsed, mask, _ = data
+    pred = predict(w, ratings, elapsed, mask)
+    valid = mask.copy()
+    valid[:, 0] = False
+    p = np.clip(pred[valid], 1e-6, 1 - 1e-6)
+    y = ratings[valid] > scheduler.AGAIN
+    return float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))) if len(p) else 0.0
+
+def fit(data, w0=None, steps=150, lr=0.05, eps=1e-4, verbose=False):
+    """Adam over central finite-difference gradients of the log-loss.
+
+    Every loss evaluation is one vectorized pass over all angles, so a step
+    costs 2 x len(w) passes regardless of how many reviews there are.
+    """
+    w = np.array(DEFAULT_W if w0 is None else w0, dtype=np.float64)
+    scale = W_UPPER - W_LOWER
+    m = np.zeros_like(w)
+    v = np.zeros_like(w)
+    best_w, best_loss = w.copy(), log_loss(w, data)
+    for step in range(1, steps + 1):
+        grad = np.zeros_like(w)
+        for k in range(len(w)):
+            h = eps * scale[k]
+            up, down = w.copy(), w.copy()
+            up[k] = min(w[k] + h, W_UPPER[k])
+            down[k] = max(w[k] - h, W_LOWER[k])
+            grad[k] = (log_loss(up, data) - log_loss(down, data)) / (up[k] - down[k])
+        # Adam en el espacio normalizado por el rango de cada parámetro
+        grad *= scale
+        m = 0.9 * m + 0.1 * grad
+        v = 0.999 * v + 0.001 * grad ** 2
+        m_hat = m / (1 - 0.9 ** step)
+        v_hat = v / (1 - 0.999 ** step)
+        w = np.clip(w - lr * scale * 0.1 * m_hat / (np.sqrt(v_hat) + 1e-8), W_LOWER, W_UPPER)
+        loss = log_loss(w, data)
+        if loss < best_loss:
+            best_w, best_loss = w.copy(), loss
+        if verbose and step % 10 == 0:
+            print(f"  step {step:4d}  log_loss={loss:.5f}")
+    return best_w, best_loss
+
+def save_params(w, meta, path=None):
+    path = path or PARAMS_PATH
+    with open(path, 'w') as f:
+        json.dump({"w": [round(float(x), 6) for x in w], **meta}, f, indent=2)
+    _params_cache.pop(path, None)
+    return path
+
+# --- EVALUACIÓN OFFLINE ---
+
+def _subset(data, rows):
+    ratings, elapsed, mask, ids = data
+    return ratings[rows], elapsed[rows], mask[rows], [ids[i] for i in rows]
+
+def sm2_predict(ratings, elapsed, mask):
+    """SM-2 has no memory model; assume recall = 0.9 ** (elapsed / scheduled interval)."""
+    n, length = ratings.shape
+    pred = np.full((n, length), np.nan)
+    interval = np.zeros(n, dtype=np.int64)
+    ease = np.full(n, scheduler.DEFAULT_EASE)
+    if not length:
+        return pred
+    interval, ease = scheduler.schedule_many(interval, ease, ratings[:, 0])
+    for k in range(1, length):
+        active = mask[:, k]
+        pred[:, k] = np.where(active, 0.9 ** (elapsed[:, k] / np.maximum(interval, 1)), np.nan)
+        new_i, new_e = scheduler.schedule_many(interval, ease, ratings[:, k])
+        interval = np.where(active, new_i, interval)
+        ease = np.where(active, new_e, ease)
+    return pred
+
+def recall_metrics(pred, ratings, mask, bins=10):
+    valid = mask.copy()
+    valid[:, 0] = False
+    p = np.clip(pred[valid], 1e-6, 1 - 1e-6)
+    y = (ratings[valid] > scheduler.AGAIN).astype(np.float64)
+    if not len(p):
+        return {"reviews": 0}
+    # RMSE de calibración: |predicho - observado| por decil de probabilidad predicha
+    edges = np.quantile(p, np.linspace(0, 1, bins + 1))
+    which = np.clip(np.searchsorted(edges, p, side='right') - 1, 0, bins - 1)
+    counts = np.bincount(which, minlength=bins)
+    used = counts > 0
+    gap = (np.bincount(which, p, bins)[used] - np.bincount(which, y, bins)[used]) / counts[used]
+    return {
+        "reviews": int(len(p)),
+        "log_loss": round(float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))), 4),
+        "rmse_bins": round(float(np.sqrt(np.sum(counts[used] * gap ** 2) / counts.sum())), 4),
+        "mean_predicted": round(float(p.mean()), 4),
+        "mean_actual": round(float(y.mean()), 4)
+    }
+
+def simulate_workload(w_true, policy, n_cards=1000, days=120, seed=0, success_probs=(0.15, 0.7, 0.15)):
+    """Reviews needed until `days` when memory follows w_true and `policy` ('sm2'|'fsrs') schedules.
+
+    New cards enter evenly over the first half of the horizon. When recalled,
+    the rating is Hard/Good/Easy with `success_probs`. Returns total reviews and the
+    mean recall probability on the last day (the exam).
+    """
+    rng = np.random.default_rng(seed)
+    start = (np.arange(n_cards) * (days // 2) // max(n_cards, 1)).astype(np.int64)
+    due = start.copy()
+    last = np.full(n_cards, -1, dtype=np.int64)
+    s = np.ones(n_cards)
+    d = np.full(n_cards, 5.0)
+    interval = np.zeros(n_cards, dtype=np.int64)
+    ease = np.full(n_cards, scheduler.DEFAULT_EASE)
+    success_cdf = np.cumsum(success_probs)
+    total = 0
+    for day in range(days):
+        idx = np.flatnonzero(due == day)
+        if not len(idx):
+            continue
+        total += len(idx)
+        first = last[idx] < 0
+        r = np.where(first, 0.0, retrievability(np.maximum(day - last[idx], 0), s[idx]))
+        recalled = (rng.random(len(idx)) < r) & ~first
+        success = np.searchsorted(success_cdf, rng.random(len(idx)), side='right').clip(0, 2) + 2
+        # Primera vez: se estudia la tarjeta (Good); luego Again si no se recuerda
+        rating = np.where(first, scheduler.GOOD, np.where(recalled, success, scheduler.AGAIN))
+        new_s = np.where(first, init_stability(w_true, rating), next_stability(w_true, d[idx], s[idx], r, rating))
+        new_d = np.where(first, init_difficulty(w_true, rating), next_difficulty(w_true, d[idx], rating))
+        s[idx], d[idx], last[idx] = new_s, new_d, day
+        if policy == 'fsrs':
+            due[idx] = day + interval_for(new_s)
+        else:
+            interval[idx], ease[idx] = scheduler.schedule_many(interval[idx], ease[idx], rating)
+            due[idx] = day + np.maximum(interval[idx], 1)
+    seen = last >= 0
+    exam_recall = retrievability(days - last[seen], s[seen]).mean() if seen.any() else 0.0
+    return {"policy": policy, "total_reviews": int(total), "exam_recall": round(float(exam_recall), 4)}
+
+def synthetic_history(n_cards=500, days=180, seed=0):
+    """Review history generated from a perturbed FSRS model (for demos/benchmarks without real data)."""
+    rng = np.random.default_rng(seed)
+    w_true = np.clip(DEFAULT_W * rng.uniform(0.7, 1.3, len(DEFAULT_W)), W_LOWER, W_UPPER)
+    sequences = []
+    t0 = datetime.datetime(2025, 1, 1)
+    for card in range(n_cards):
+        t, seq = float(rng.integers(0, 30)), []
+        s = d = None
+        while t < days and len(seq) < MAX_HISTORY:
+            if s is None:
+                rating = int(rng.choice([1, 2, 3, 4], p=[0.2, 0.2, 0.5, 0.1]))
+                s, d = init_stability(w_true, rating), init_difficulty(w_true, rating)
+            else:
+                r = retrievability(t - seq[-1][2], s)
+                rating = int(rng.choice([2, 3, 4], p=[0.15, 0.7, 0.15])) if rng.random() < r else 1
+                s, d = next_stability(w_true, d, s, r, rating), next_difficulty(w_true, d, rating)
+            seq.append((t0 + datetime.timedelta(days=t), rating, t))
+            # intervalos algo desordenados (no siempre se repasa el día exacto)
+            t += float(interval_for(s)) * rng.uniform(0.5, 1.8) + rng.uniform(0, 1)
+        if len(seq) >= 2:
+            sequences.append((card, [(when, rating) for when, rating, _ in seq]))
+    return _pad(sequences), w_true
+
+def evaluate(data, test_fraction=0.2, steps=150, seed=0, n_cards=1000, days=120):
+    """Fits on a train split of angles and compares FSRS vs SM-2 on the held-out angles."""
+    start = time.perf_counter()
+    n = len(data[3])
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(n)
+    n_test = max(1, int(n * test_fraction)) if n > 1 else 0
+    test, train = _subset(data, order[:n_test]), _subset(data, order[n_test:])
+    w_fit, train_loss = fit(train, steps=steps)
+
+    ratings, elapsed, mask, _ = test
+    report = {
+        "angles": {"train": n - n_test, "test": n_test},
+        "train_log_loss": round(train_loss, 4),
+        "recall": {
+            "fsrs_fitted": recall_metrics(predict(w_fit, ratings, elapsed, mask), ratings, mask),
+            "fsrs_default": recall_metrics(predict(DEFAULT_W, ratings, elapsed, mask), ratings, mask),
+            "sm2": recall_metrics(sm2_predict(ratings, elapsed, mask), ratings, mask)
+        },
+        # Carga de trabajo simulada tomando el modelo ajustado como "verdad"
+        "workload": [simulate_workload(w_fit, policy, n_cards, days, seed) for policy in ('sm2', 'fsrs')],
+    }
+    report["elapsed_s"] = round(time.perf_counter() - start, 2)
+    return report, w_fit
+
+if __name__ == "__main__":
+    # Usage:
+    #   python fsrs.py fit [--steps 150]                 -> escribe fsrs_params.json
+    #   python fsrs.py evaluate [--synthetic 500]        -> FSRS vs SM-2 (recall + carga)
+    parser = argparse.ArgumentParser(description="FSRS: ajuste de parámetros y evaluación offline")
+    parser.add_argument("command", choices=["fit", "evaluate"])
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--steps", type=int, default=150)
+    parser.add_argument("--synthetic", type=int, default=0, help="usar N tarjetas sintéticas en vez de review_log")
+    parser.add_argument("--days", type=int, default=120, help="horizonte de la simulación de carga")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        data, _ = synthetic_history(args.synthetic)
+    else:
+        conn = sqlite3.connect(args.db, timeout=30)
+        data = load_histories(conn)
+        conn.close()
+    print(f"📚 {len(data[3])} historiales (estudiante, ángulo) con >= 2 reviews")
+    if not len(data[3]):
+        sys.exit("No hay historial suficiente en review_log.")
+
+    if args.command == "fit":
+        start = time.perf_counter()
+        w, loss = fit(data, steps=args.steps, verbose=True)
+        meta = {"fitted_at": datetime.datetime.now().isoformat(), "angles": len(data[3]),
+                "log_loss": round(loss, 5), "default_log_loss": round(log_loss(DEFAULT_W, data), 5)}
+        path = save_params(w, meta)
+        print(f"✅ Parámetros guardados en {path} ({time.perf_counter() - start:.1f}s) {meta}")
+    else:
+        report, _ = evaluate(data, steps=args.steps, days=args.days)
+        print(json.dumps(report, indent=2))
@@ -2,15 +2,17 @@ import google.generativeai as genai
 import json
 import os
 from dotenv import load_dotenv
+import question_bank
 
 # Cargar variables de entorno
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+MODEL_NAME = "gemini-2.5-flash"
 
 class GeminiAdapter:
     def __init__(self):
         genai.configure(api_key=GEMINI_API_KEY)
-        self.model = genai.GenerativeModel("gemini-2.5-flash")
+        self.model = genai.GenerativeModel(MODEL_NAME)
 
     def _robust_json_extract(self, raw_text):
         """Extrae y limpia JSON de forma extrema con auto-recuperación de MCQs (V3.11)."""
@@ -133,6 +135,7 @@ IMPORTANTE: Retorna ÚNICAMENTE el JSON.
                 required = ["content", "options", "correct_answer", "explanation"]
                 if all(k in data for k in required):
                     print(f"✅ [Gemini] Desafío estructurado correctamente.")
+                    question_bank.record_question(data, topic, angle, 'mcq', MODEL_NAME)
                     return data
                 else:
                     print(f"⚠️ [Gemini] JSON incompleto tras extracción. Faltan campos: {[k for k in required if k not in data]}")
@@ -0,0 +1,241 @@
+import sys
+import json
+import time
+import heapq
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+
+DB_PATH = 'temario.db'
+
+BRANCH_EDGE_LABEL = "Derivación" # parent -> subtopic edges written by BranchingEngine
+
+def is_prerequisite(dashes, label):
+    """Solid edges (calendar chain) and branching edges are prerequisites;
+    other dashed edges ('SRS', 'Ley Estatutaria', ...) are associative links."""
+    return not dashes or label == BRANCH_EDGE_LABEL
+
+class GraphIndex:
+    """In-memory adjacency index of the study graph for unlock ordering.
+
+    A locked node is eligible once every prerequisite parent is mastered.
+    Eligible nodes sit in a heap keyed by (-priority, position, id), so
+    "what to unlock next" is a heap peek (O(log n) with lazy deletion) and
+    mastering a node only touches its children. Prerequisite edges that close
+    a cycle are ignored (listed in ignored_edges) so nothing stays blocked forever.
+    """
+
+    def __init__(self, nodes, edges, version=None):
+        self.version = version
+        self.lock = threading.RLock() # heap/pending are shared by the bot's threads
+        self.group = {}
+        self.key = {}
+        self.children = {}
+        self.parents = {}
+        for n in nodes:
+            self.group[n['id']] = n['grp']
+            self.key[n['id']] = (-(n['priority'] or 0), n['position'], n['id'])
+            self.children[n['id']] = []
+            self.parents[n['id']] = []
+        prereq = [(e['from_id'], e['to_id']) for e in edges
+                  if is_prerequisite(e['dashes'], e['label']) and e['from_id'] in self.group and e['to_id'] in self.group]
+        self.ignored_edges = self._break_cycles(prereq)
+        ignored = set(self.ignored_edges)
+        for a, b in prereq:
+            if (a, b) not in ignored:
+                self.children[a].append(b)
+                self.parents[b].append(a)
+        self.pending = {i: sum(1 for p in self.parents[i] if self.group[p] != 'mastered') for i in self.group}
+        self.heap = [self.key[i] for i in self.group if self._eligible(i)]
+        heapq.heapify(self.heap)
+
+    def _break_cycles(self, edges):
+        """Edges inside a cycle (both ends in the same strongly connected component).
+
+        Iterative Tarjan: nodes merely downstream of a cycle keep their edges.
+        """
+        out = {i: [] for i in self.group}
+        for a, b in edges:
+            out[a].append(b)
+        index, low, component = {}, {}, {}
+        stack, on_stack = [], set()
+        for root in out:
+            if root in index:
+                continue
+            work = [(root, iter(out[root]))]
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, children = work[-1]
+                child = next(children, None)
+                if child is not None:
+                    if child not in index:
+                        index[child] = low[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(out[child])))
+                    elif child in on_stack:
+                        low[node] = min(low[node], index[child])
+                    continue
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                if low[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component[member] = node
+                        if member == node:
+                            break
+        return [(a, b) for a, b in edges if component[a] == component[b]]
+
+    @classmethod
+    def load(cls, conn, user_id=None):
+        """Index of one user's graph (user_id=None: the groups stored in graph_nodes)."""
+        conn.row_factory = sqlite3.Row
+        version = version_of(conn, user_id)
+        if user_id is None:
+            nodes = conn.execute('SELECT id, grp, priority, position FROM graph_nodes').fetchall()
+        else:
+            nodes = conn.execute('''
+                SELECT n.id, COALESCE(s.grp, 'locked') AS grp, n.priority, n.position
+                FROM graph_nodes n LEFT JOIN user_graph_nodes s ON s.node_id = n.id AND s.user_id = ?
+            ''', (user_id,)).fetchall()
+        edges = conn.execute('SELECT from_id, to_id, dashes, label FROM graph_edges').fetchall()
+        return cls(nodes, edges, version)
+
+    def _eligible(self, node_id):
+        return self.group.get(node_id) == 'locked' and self.pending.get(node_id, 1) == 0
+
+    # --- CONSULTAS ---
+
+    def next_unlock(self):
+        """Id of the best eligible locked node, or None."""
+        with self.lock:
+            while self.heap:
+                node_id = self.heap[0][2]
+                if self._eligible(node_id):
+                    return node_id
+                heapq.heappop(self.heap) # stale entry (activated, mastered or re-blocked)
+            return None
+
+    def upcoming(self, k=10):
+        """Unlock order for the next k nodes, assuming each one gets mastered in turn."""
+        with self.lock:
+            heap = list(self.heap)
+            active = [i for i, g in self.group.items() if g == 'active']
+        pending = {}
+        order, taken = [], set()
+        for node_id in active: # the active node will be mastered first
+            for child in self.children[node_id]:
+                pending[child] = pending.get(child, self.pending[child]) - 1
+                if pending[child] == 0 and self.group[child] == 'locked':
+                    heapq.heappush(heap, self.key[child])
+        while heap and len(order) < k:
+            node_id = heapq.heappop(heap)[2]
+            if node_id in taken or self.group[node_id] != 'locked' or pending.get(node_id, self.pending[node_id]) != 0:
+                continue
+            taken.add(node_id)
+            order.append(node_id)
+            for child in self.children[node_id]:
+                pending[child] = pending.get(child, self.pending[child]) - 1
+                if pending[child] == 0 and self.group[child] == 'locked':
+                    heapq.heappush(heap, self.key[child])
+        return order
+
+    def blocked_by(self, node_id):
+        """Prerequisite parents of a node that are not mastered yet."""
+        return [p for p in self.parents.get(node_id, []) if self.group[p] != 'mastered']
+
+    # --- ACTUALIZACIONES (mismo proceso) ---
+
+    def set_group(self, node_id, group):
+        """Applies a group change made by this process (mastering only touches the children)."""
+        with self.lock:
+            previous = self.group.get(node_id)
+            self.group[node_id] = group
+            if group == 'mastered' and previous != 'mastered':
+                for child in self.children[node_id]:
+                    self.pending[child] -= 1
+                    if self._eligible(child):
+                        heapq.heappush(self.heap, self.key[child])
+            elif previous == 'mastered' and group != 'mastered':
+                for child in self.children[node_id]:
+                    self.pending[child] += 1
+            if self._eligible(node_id):
+                heapq.heappush(self.heap, self.key[node_id])
+
+MAX_CACHED = 256 # indexes kept in memory (one per active student), least recently used dropped
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+def version_of(conn, user_id=None):
+    """(graph_meta.version, user_graph_meta.version): structure + the user's groups."""
+    row = conn.execute('SELECT version FROM graph_meta WHERE id = 1').fetchone()
+    user = None
+    if user_id is not None:
+        user = conn.execute('SELECT version FROM user_graph_meta WHERE user_id = ?', (user_id,)).fetchone()
+    return (row[0] if row else None, user[0] if user else 0)
+
+def get_index(conn, db_key, user_id=None):
+    """Cached index per (database, user), rebuilt only when its version moved
+    (another process or connection changed nodes, edges or that user's groups)."""
+    version = version_of(conn, user_id)
+    with _lock:
+        index = _indexes.get((db_key, user_id))
+        if index is None or index.version != version:
+            index = GraphIndex.load(conn, user_id)
+            _indexes[(db_key, user_id)] = index
+            _indexes.move_to_end((db_key, user_id))
+            while len(_indexes) > MAX_CACHED:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end((db_key, user_id))
+        return index
+
+def invalidate(db_key, user_id=None):
+    """Drops a cached index (e.g. after a rolled-back transaction already applied deltas)."""
+    with _lock:
+        _indexes.pop((db_key, user_id), None)
+
+def benchmark(n_nodes=20000, fanout=2, queries=10000):
+    """Build time and next_unlock()/set_group() latency on a synthetic derived-topic tree."""
+    rng = random.Random(0)
+    nodes = [{"id": i, "grp": 'mastered' if i <= n_nodes // 10 else 'locked', "priority": rng.randint(0, 100),
+              "position": i} for i in range(1, n_nodes + 1)]
+    edges = [{"from_id": max(1, (i - 1) // fanout), "to_id": i, "dashes": 1, "label": BRANCH_EDGE_LABEL}
+             for i in range(2, n_nodes + 1)]
+    start = time.perf_counter()
+    index = GraphIndex(nodes, edges)
+    build_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    done = 0
+    for _ in range(queries):
+        node_id = index.next_unlock()
+        if node_id is None:
+            break
+        index.set_group(node_id, 'mastered')
+        done += 1
+    step_us = (time.perf_counter() - start) / max(done, 1) * 1e6
+    return {"nodes": n_nodes, "build_ms": round(build_ms, 1), "unlock_and_master_us": round(step_us, 2),
+            "unlocked": done}
+
+if __name__ == "__main__":
+    # Usage:
+    #   python graph_index.py next [k]   (orden de desbloqueo de los próximos k nodos)
+    #   python graph_index.py bench [n_nodes]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'next'
+    if command == 'bench':
+        print(json.dumps(benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 20000), indent=2))
+    else:
+        from graph_store import GraphStore
+        store = GraphStore()
+        conn = sqlite3.connect(store.db_path)
+        index = get_index(conn, store.db_path)
+        conn.close()
+        k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+        print(json.dumps([store.get_node(i) for i in index.upcoming(k)], ensure_ascii=False, indent=2))
+        if index.ignored_edges:
+            print(f"⚠️ {len(index.ignored_edges)} aristas de prerrequisito ignoradas por ciclos")
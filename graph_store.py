@@ -0,0 +1,446 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import state_store
+import graph_index
+
+DB_PATH = 'temario.db'
+GRAPH_JSON_PATH = 'study_dashboard/graph_data.json'
+
+# Columnas de graph_nodes que se exportan con el mismo nombre que en el JSON
+NODE_COLUMNS = ('id', 'label', 'title', 'mastery_level', 'sprint_day', 'priority')
+
+def normalize_label(label):
+    """Lookup key for node labels: newlines/extra spaces collapsed, case-folded."""
+    return ' '.join((label or '').split()).lower()
+
+# Columnas de estado por estudiante (el resto del nodo es compartido)
+STATE_COLUMNS = ('grp', 'title', 'mastery_level')
+
+_ready = set() # databases whose schema/seed this process already checked
+_ready_lock = threading.Lock()
+
+class GraphStore:
+    """Study graph (nodes + edges) stored in temario.db.
+
+    Replaces the read-modify-write of the whole graph_data.json: lookups go
+    through indexes on the normalized label and the group, and updates touch a
+    single row. The first time it runs against an empty database the graph is
+    imported from graph_data.json; export_graph()/export_json() produce the
+    same JSON shape the dashboard has always read.
+
+    With a user_id (bot students) the nodes and edges are shared but group,
+    title and mastery come from user_graph_nodes; a node without a row there
+    is locked for that user. user_id=None is the original single-user graph.
+    """
+
+    def __init__(self, db_path=DB_PATH, json_path=GRAPH_JSON_PATH, user_id=None):
+        self.db_path = db_path
+        self.json_path = json_path
+        self.user_id = user_id
+        with _ready_lock: # once per database and process (get_graph_store runs on every request)
+            if os.path.abspath(db_path) not in _ready:
+                self.setup_db()
+                _ready.add(os.path.abspath(db_path))
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _write_conn(self):
+        """Connection already holding the write lock (BEGIN IMMEDIATE).
+
+        In WAL mode a deferred transaction that has to upgrade to a writer fails
+        with 'database is locked' without waiting; taking the lock up front makes
+        concurrent writers queue on the busy timeout instead.
+        """
+        conn = self._get_conn()
+        conn.execute('BEGIN IMMEDIATE')
+        return conn
+
+    def setup_db(self):
+        """Schema + first import from graph_data.json, safe against concurrent setups.
+
+        Everything runs under BEGIN IMMEDIATE and emptiness is checked inside
+        it, so two threads/processes can't both seed the graph.
+        """
+        conn = self._get_conn()
+        c = conn.cursor()
+        # WAL: the bot and the dashboard read while the other process writes.
+        # Switching needs an exclusive lock, so only when not already in WAL, and
+        # a busy database just stays in rollback mode until the next setup.
+        if c.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+            try:
+                c.execute('PRAGMA journal_mode=WAL')
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ [Graph] WAL pendiente ({e})")
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('''CREATE TABLE IF NOT EXISTS graph_nodes (
+            id INTEGER PRIMARY KEY,
+            label TEXT NOT NULL,
+            norm_label TEXT NOT NULL,
+            grp TEXT NOT NULL DEFAULT 'locked', -- locked, active, mastered
+            title TEXT,
+            mastery_level INTEGER,
+            sprint_day INTEGER,
+            priority INTEGER,
+            position INTEGER NOT NULL
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS graph_edges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_id INTEGER NOT NULL,
+            to_id INTEGER NOT NULL,
+            dashes INTEGER,
+            label TEXT,
+            FOREIGN KEY(from_id) REFERENCES graph_nodes(id),
+            FOREIGN KEY(to_id) REFERENCES graph_nodes(id)
+        )''')
+        # version: bumped on structural/group changes so GraphIndex knows when to rebuild
+        c.execute('''CREATE TABLE IF NOT EXISTS graph_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )''')
+        c.execute('INSERT OR IGNORE INTO graph_meta (id) VALUES (1)')
+        c.execute('''CREATE TABLE IF NOT EXISTS user_graph_nodes (
+            user_id TEXT NOT NULL,
+            node_id INTEGER NOT NULL,
+            grp TEXT NOT NULL DEFAULT 'locked',
+            title TEXT,
+            mastery_level INTEGER,
+            PRIMARY KEY (user_id, node_id)
+        )''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_user_graph_nodes_grp ON user_graph_nodes(user_id, grp)')
+        c.execute('''CREATE TABLE IF NOT EXISTS user_graph_meta (
+            user_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_graph_nodes_norm_label ON graph_nodes(norm_label)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_graph_nodes_grp ON graph_nodes(grp, position)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_graph_edges_from ON graph_edges(from_id)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_graph_edges_to ON graph_edges(to_id)')
+
+        graph = None
+        empty = c.execute('SELECT 1 FROM graph_nodes LIMIT 1').fetchone() is None
+        if empty and self.json_path and os.path.exists(self.json_path):
+            with open(self.json_path, 'r') as f:
+                graph = json.load(f)
+            self._import(c, graph)
+        conn.commit()
+        conn.close()
+        if graph is not None:
+            print(f"📥 [Graph] Migrado {self.json_path} -> {self.db_path} ({len(graph.get('nodes', []))} nodos)")
+
+    def _import(self, c, graph):
+        c.executemany('''
+            INSERT INTO graph_nodes (id, label, norm_label, grp, title, mastery_level, sprint_day, priority, position)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (n['id'], n['label'], normalize_label(n['label']), n.get('group', 'locked'), n.get('title'),
+             n.get('mastery_level'), n.get('sprint_day'), n.get('priority'), pos)
+            for pos, n in enumerate(graph.get('nodes', []))
+        ])
+        c.executemany('INSERT INTO graph_edges (from_id, to_id, dashes, label) VALUES (?, ?, ?, ?)', [
+            (e['from'], e['to'], e.get('dashes'), e.get('label')) for e in graph.get('edges', [])
+        ])
+
+    def _nodes(self, group=None):
+        """(FROM source, params) for this user's view of graph_nodes.
+
+        For a group other than 'locked' the user rows drive the join, so
+        'active'/'mastered' lookups stay index seeks on user_graph_nodes.
+        """
+        if self.user_id is None:
+            return 'graph_nodes', []
+        join = 'user_graph_nodes s JOIN graph_nodes n ON n.id = s.node_id' if group not in (None, 'locked') else \
+            'graph_nodes n LEFT JOIN user_graph_nodes s ON s.node_id = n.id AND s.user_id = ?'
+        src = f'''(SELECT n.id, n.label, n.norm_label, COALESCE(s.grp, 'locked') AS grp,
+                   COALESCE(s.title, CASE WHEN n.grp = 'locked' THEN n.title END) AS title,
+                   s.mastery_level, n.sprint_day, n.priority, n.position
+                   FROM {join}{' WHERE s.user_id = ?' if group not in (None, 'locked') else ''})'''
+        return src, [self.user_id]
+
+    def _set_state(self, c, node_id, **fields):
+        """Writes group/title/mastery of a node for this user."""
+        if self.user_id is None:
+            c.execute(f"UPDATE graph_nodes SET {', '.join(k + ' = ?' for k in fields)} WHERE id = ?",
+                      (*fields.values(), node_id))
+            return
+        c.execute(f'''
+            INSERT INTO user_graph_nodes (user_id, node_id, {', '.join(fields)}) VALUES (?, ?, {', '.join('?' * len(fields))})
+            ON CONFLICT(user_id, node_id) DO UPDATE SET {', '.join(f'{k} = excluded.{k}' for k in fields)}
+        ''', (self.user_id, node_id, *fields.values()))
+
+    def _bump(self, c, structure=False):
+        """New graph version (same transaction as the change); returns the index key
+        (graph version, user version) - see graph_index.get_index."""
+        if structure or self.user_id is None:
+            c.execute('UPDATE graph_meta SET version = version + 1 WHERE id = 1')
+        else:
+            c.execute('''INSERT INTO user_graph_meta (user_id, version) VALUES (?, 1)
+                         ON CONFLICT(user_id) DO UPDATE SET version = version + 1''', (self.user_id,))
+        return graph_index.version_of(c, self.user_id)
+
+    @staticmethod
+    def _node(row):
+        if row is None:
+            return None
+        node = {k: row[k] for k in NODE_COLUMNS if row[k] is not None}
+        node['group'] = row['grp']
+        return node
+
+    # --- LECTURAS ---
+
+    def get_node(self, node_id):
+        src, params = self._nodes()
+        conn = self._get_conn()
+        row = conn.execute(f'SELECT * FROM {src} WHERE id = ?', (*params, node_id)).fetchone()
+        conn.close()
+        return self._node(row)
+
+    def find_node(self, label, group=None):
+        """Node whose label matches `label` once newlines/spacing/case are normalized."""
+        src, params = self._nodes(group)
+        sql = f'SELECT * FROM {src} WHERE norm_label = ?'
+        params = [*params, normalize_label(label)]
+        if group:
+            sql += ' AND grp = ?'
+            params.append(group)
+        conn = self._get_conn()
+        row = conn.execute(sql + ' ORDER BY position LIMIT 1', params).fetchone()
+        conn.close()
+        return self._node(row)
+
+    def first_node(self, group):
+        """First node of a group in calendar (original array) order."""
+        src, params = self._nodes(group)
+        conn = self._get_conn()
+        row = conn.execute(f'SELECT * FROM {src} WHERE grp = ? ORDER BY position LIMIT 1', (*params, group)).fetchone()
+        conn.close()
+        return self._node(row)
+
+    def nodes_in_group(self, group, limit=None):
+        src, params = self._nodes(group)
+        conn = self._get_conn()
+        sql = f'SELECT * FROM {src} WHERE grp = ? ORDER BY position'
+        rows = conn.execute(sql + (' LIMIT ?' if limit else ''), (*params, group, limit) if limit else (*params, group)).fetchall()
+        conn.close()
+        return [self._node(r) for r in rows]
+
+    def leaves(self, limit=None, groups=('active', 'locked')):
+        """Not-yet-mastered nodes (for this user) without children, in calendar order
+        (default expansion frontier)."""
+        src, params = self._nodes()
+        sql = f'''
+            SELECT * FROM {src} n
+            WHERE n.grp IN ({','.join('?' * len(groups))})
+              AND NOT EXISTS (SELECT 1 FROM graph_edges e WHERE e.from_id = n.id)
+            ORDER BY n.position
+        '''
+        conn = self._get_conn()
+        rows = conn.execute(sql + (' LIMIT ?' if limit else ''),
+                            (*params, *groups, *([limit] if limit else []))).fetchall()
+        conn.close()
+        return [self._node(r) for r in rows]
+
+    def upcoming_nodes(self, limit=10):
+        """Locked nodes in unlock order (prerequisites first, then priority/calendar),
+        assuming the active node and each one after it get mastered."""
+        src, params = self._nodes()
+        conn = self._get_conn()
+        ids = graph_index.get_index(conn, self.db_path, self.user_id).upcoming(limit)
+        rows = {r['id']: r for r in conn.execute(
+            f"SELECT * FROM {src} WHERE id IN ({','.join('?' * len(ids))})", (*params, *ids))} if ids else {}
+        conn.close()
+        return [self._node(rows[i]) for i in ids if i in rows]
+
+    def count_nodes(self):
+        conn = self._get_conn()
+        n = conn.execute('SELECT COUNT(*) FROM graph_nodes').fetchone()[0]
+        conn.close()
+        return n
+
+    def total_mastery(self):
+        src, params = self._nodes()
+        conn = self._get_conn()
+        total = conn.execute(f'SELECT COALESCE(SUM(mastery_level), 0) FROM {src}', params).fetchone()[0]
+        conn.close()
+        return total
+
+    # --- ESCRITURAS (una fila por operación) ---
+
+    def update_node(self, node_id, **fields):
+        if 'group' in fields:
+            fields['grp'] = fields.pop('group')
+        if 'label' in fields:
+            fields['norm_label'] = normalize_label(fields['label'])
+        state = {k: fields.pop(k) for k in STATE_COLUMNS if k in fields}
+        conn = self._write_conn()
+        if fields:
+            cols = ', '.join(f"{k} = ?" for k in fields)
+            conn.execute(f'UPDATE graph_nodes SET {cols} WHERE id = ?', (*fields.values(), node_id))
+        if state:
+            self._set_state(conn, node_id, **state)
+        if 'grp' in state:
+            self._bump(conn)
+        conn.commit()
+        conn.close()
+
+    def increment_mastery(self, node_id, delta=1):
+        """Atomic in-place increment; returns the new mastery level."""
+        conn = self._write_conn()
+        c = conn.cursor()
+        if self.user_id is None:
+            c.execute('UPDATE graph_nodes SET mastery_level = COALESCE(mastery_level, 0) + ? WHERE id = ?', (delta, node_id))
+            row = c.execute('SELECT mastery_level FROM graph_nodes WHERE id = ?', (node_id,)).fetchone()
+        else:
+            c.execute('''
+                INSERT INTO user_graph_nodes (user_id, node_id, mastery_level) VALUES (?, ?, ?)
+                ON CONFLICT(user_id, node_id) DO UPDATE SET mastery_level = COALESCE(mastery_level, 0) + excluded.mastery_level
+            ''', (self.user_id, node_id, delta))
+            row = c.execute('SELECT mastery_level FROM user_graph_nodes WHERE user_id = ? AND node_id = ?',
+                            (self.user_id, node_id)).fetchone()
+        conn.commit()
+        conn.close()
+        return row[0] if row else None
+
+    def advance_active(self, mastery_goal=3):
+        """Returns the active node, promoting/activating under one write lock.
+
+        If the active node reached mastery_goal it is marked mastered and the
+        next node whose prerequisites are all mastered becomes active (highest
+        priority, then calendar order; see GraphIndex). BEGIN IMMEDIATE makes
+        concurrent callers (bot + dashboard) serialize here, so two processes
+        never activate different nodes.
+        """
+        active_src, active_params = self._nodes('active')
+        conn = self._write_conn()
+        c = conn.cursor()
+        try:
+            node = self._node(c.execute(f"SELECT * FROM {active_src} WHERE grp = 'active' ORDER BY position LIMIT 1",
+                                        active_params).fetchone())
+            changes = []
+            if node and node.get('mastery_level', 0) >= mastery_goal:
+                self._set_state(c, node['id'], grp='mastered', title="🏆 DOMINADO")
+                changes.append((node['id'], 'mastered'))
+                node = None
+            if not node:
+                # Index read inside the write lock: consistent with what this transaction sees
+                index = graph_index.get_index(conn, self.db_path, self.user_id)
+                for node_id, group in changes:
+                    index.set_group(node_id, group)
+                next_id = index.next_unlock()
+                src, params = self._nodes()
+                if next_id is not None:
+                    row = c.execute(f'SELECT * FROM {src} WHERE id = ?', (*params, next_id)).fetchone()
+                else: # only cycles/blocked nodes left: fall back to calendar order
+                    row = c.execute(f"SELECT * FROM {src} WHERE grp = 'locked' ORDER BY position LIMIT 1", params).fetchone()
+                node = self._node(row)
+                if node:
+                    self._set_state(c, node['id'], grp='active', title="⚠️ OBJETIVO ACTUAL", mastery_level=0)
+                    node.update(group='active', title="⚠️ OBJETIVO ACTUAL", mastery_level=0)
+                    changes.append((node['id'], 'active'))
+                    index.set_group(node['id'], 'active')
+            if changes:
+                index.version = self._bump(c) # deltas already applied, no rebuild needed
+            conn.commit()
+            return node
+        except Exception:
+            conn.rollback()
+            graph_index.invalidate(self.db_path, self.user_id)
+            raise
+        finally:
+            conn.close()
+
+    def add_children(self, parent_id, children, edge_label="Derivación"):
+        """Appends child nodes (dicts with label/title/...) linked from parent_id in one transaction.
+
+        Returns the new node ids.
+        """
+        return self.add_children_many([(parent_id, children)], edge_label, skip_existing=False)["ids"][parent_id]
+
+    def add_children_many(self, expansions, edge_label="Derivación", skip_existing=True):
+        """Applies many expansions [(parent_id, [child, ...]), ...] in a single transaction.
+
+        Ids and positions are allocated here from one MAX() read each (primary
+        key / index seek) and handed out sequentially, so a batch of any size
+        costs two lookups plus two executemany. With skip_existing, a child whose
+        normalized label is already in the graph (or earlier in the batch) is
+        not duplicated. Returns {"ids": {parent_id: [new ids]}, "skipped": n,
+        "first_id": first allocated id}.
+        """
+        conn = self._write_conn()
+        c = conn.cursor()
+        try:
+            next_id = c.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM graph_nodes').fetchone()[0]
+            position = c.execute('SELECT COALESCE(MAX(position), -1) FROM graph_nodes').fetchone()[0]
+            first_id = next_id
+            seen = set()
+            if skip_existing:
+                labels = {normalize_label(ch['label']) for _, children in expansions for ch in children}
+                for chunk in (list(labels)[i:i + 500] for i in range(0, len(labels), 500)):
+                    seen.update(r[0] for r in c.execute(
+                        f"SELECT norm_label FROM graph_nodes WHERE norm_label IN ({','.join('?' * len(chunk))})", chunk))
+            nodes, edges, ids, skipped = [], [], {}, 0
+            for parent_id, children in expansions:
+                ids.setdefault(parent_id, [])
+                for child in children:
+                    norm = normalize_label(child['label'])
+                    if skip_existing and norm in seen:
+                        skipped += 1
+                        continue
+                    seen.add(norm)
+                    position += 1
+                    nodes.append((next_id, child['label'], norm, child.get('group', 'locked'), child.get('title'),
+                                  child.get('mastery_level'), child.get('sprint_day'), child.get('priority'), position))
+                    edges.append((parent_id, next_id, 1, edge_label))
+                    ids[parent_id].append(next_id)
+                    next_id += 1
+            c.executemany('''
+                INSERT INTO graph_nodes (id, label, norm_label, grp, title, mastery_level, sprint_day, priority, position)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', nodes)
+            c.executemany('INSERT INTO graph_edges (from_id, to_id, dashes, label) VALUES (?, ?, ?, ?)', edges)
+            if nodes:
+                self._bump(c, structure=True)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return {"ids": ids, "skipped": skipped, "first_id": first_id}
+
+    # --- EXPORTACIÓN COMPATIBLE ---
+
+    def export_graph(self):
+        """Graph in the graph_data.json shape ({"nodes": [...], "edges": [...]})."""
+        src, params = self._nodes()
+        conn = self._get_conn()
+        nodes = [self._node(r) for r in conn.execute(f'SELECT * FROM {src} ORDER BY position', params)]
+        edges = []
+        for r in conn.execute('SELECT from_id, to_id, dashes, label FROM graph_edges ORDER BY id'):
+            edge = {"from": r['from_id'], "to": r['to_id']}
+            if r['dashes'] is not None:
+                edge['dashes'] = bool(r['dashes'])
+            if r['label'] is not None:
+                edge['label'] = r['label']
+            edges.append(edge)
+        conn.close()
+        return {"nodes": nodes, "edges": edges}
+
+    def export_json(self, path=None):
+        path = path or self.json_path
+        state_store.write_json(path, self.export_graph(), indent=4)
+        return path
+
+if __name__ == "__main__":
+    # Usage: python graph_store.py export [ruta.json]
+    store = GraphStore()
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        out = store.export_json(sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f"✅ Grafo exportado a {out}")
+    else:
+        print(json.dumps({"nodes": store.count_nodes(), "mastery": store.total_mastery()}))
@@ -0,0 +1,348 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import datetime
+import agent_srs
+import scheduler
+import question_bank
+import challenge_provider
+from notebook_adapter import route_specialty
+
+DB_PATH = 'temario.db'
+
+DEFAULT_ITEMS = 100
+SECONDS_PER_ITEM = int(os.getenv("MOCK_SECONDS_PER_ITEM", "72")) # ~2 h for 100 preguntas
+MAX_PER_TOPIC = 2          # a topic never fills more than this many seats
+SEEN_PENALTY = 0.25        # questions the user already saw are still eligible, just less likely
+NEW_TOPIC_WEAKNESS = 0.5   # topic never reviewed: halfway between mastered and failing
+
+def weakness(min_ease, learning):
+    """0 (mastered) .. 1 (failing) from the topic's progress rows."""
+    if learning:
+        return 1.0
+    if min_ease is None:
+        return NEW_TOPIC_WEAKNESS
+    return min(1.0, max(0.0, (scheduler.MAX_EASE - min_ease) / (scheduler.MAX_EASE - scheduler.MIN_EASE)))
+
+def allocate(n, weights, capacity):
+    """Seats per stratum: proportional to weight (largest remainder), capped by
+    capacity; seats a stratum can't fill are redistributed to the others."""
+    seats = {k: 0 for k in weights}
+    remaining = min(n, sum(capacity.values()))
+    open_keys = {k for k in weights if capacity.get(k, 0) > 0 and weights[k] > 0} or \
+                {k for k in weights if capacity.get(k, 0) > 0}
+    while remaining > 0 and open_keys:
+        total = sum(weights[k] for k in open_keys) or len(open_keys)
+        quota = {k: remaining * ((weights[k] / total) if total else 1 / len(open_keys)) for k in open_keys}
+        share = {k: min(int(quota[k]), capacity[k] - seats[k]) for k in open_keys}
+        leftover = remaining - sum(share.values())
+        for k in sorted(open_keys, key=lambda k: quota[k] - int(quota[k]), reverse=True):
+            if leftover <= 0:
+                break
+            if seats[k] + share[k] < capacity[k]:
+                share[k] += 1
+                leftover -= 1
+        if not any(share.values()):
+            break
+        for k, s in share.items():
+            seats[k] += s
+            remaining -= s
+        open_keys = {k for k in open_keys if seats[k] < capacity[k]}
+    return seats
+
+class MockExams:
+    """Full-length timed mock exams assembled from the question bank (no LLM calls).
+
+    build() stratifies seats by specialty (route_specialty, the same routing
+    ensure_notebook uses) in proportion to each specialty's weight, then picks
+    questions inside each stratum by weighted sampling without replacement:
+    topic priority x (1 + weakness from progress), split across the topic's
+    questions, with a penalty for questions the user already saw.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.bank = question_bank.get_bank(db_path)
+        self.provider = challenge_provider.get_provider(db_path)
+        self.setup_db()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def setup_db(self):
+        conn = self._get_conn()
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS mock_exams (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            status TEXT NOT NULL, -- ready, running, finished
+            n_items INTEGER NOT NULL,
+            duration_s INTEGER NOT NULL,
+            created_at TEXT,
+            started_at TEXT,
+            deadline TEXT,
+            finished_at TEXT,
+            blueprint_json TEXT
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS mock_exam_items (
+            exam_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            topic_id INTEGER,
+            specialty TEXT,
+            answer TEXT,
+            is_correct INTEGER,
+            answered_at TEXT,
+            PRIMARY KEY (exam_id, position)
+        )''')
+        conn.commit()
+        conn.close()
+
+    def load_candidates(self, user_id=challenge_provider.DEFAULT_USER):
+        """Every stored MCQ with its topic weight inputs, in one query."""
+        conn = self._get_conn()
+        c = conn.cursor()
+        has_progress = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'progress'").fetchone()
+        progress_join = '''
+            LEFT JOIN (SELECT a.topic_id, MIN(p.ease_factor) AS min_ease, MAX(p.status = 'learning') AS learning
+                       FROM progress p JOIN angles a ON a.id = p.angle_id GROUP BY a.topic_id) w
+                   ON w.topic_id = q.topic_id
+        ''' if has_progress else ''
+        rows = c.execute(f'''
+            SELECT q.id, q.topic_id, q.topic_key, json_extract(q.content_json, '$.topic') AS topic,
+                   t.priority, {'w.min_ease, w.learning' if has_progress else 'NULL AS min_ease, 0 AS learning'},
+                   e.last_seen IS NOT NULL AS seen
+            FROM questions q
+            LEFT JOIN topics t ON t.id = q.topic_id
+            {progress_join}
+            LEFT JOIN question_exposures e ON e.question_id = q.id AND e.user_id = ?
+            WHERE q.format = 'mcq' AND json_extract(q.content_json, '$.stem') != ''
+              AND json_array_length(q.content_json, '$.options') >= 2
+        ''', (user_id,)).fetchall()
+        conn.close()
+        return [dict(r) for r in rows]
+
+    def build(self, n=DEFAULT_ITEMS, user_id=challenge_provider.DEFAULT_USER, seed=None,
+              seconds_per_item=SECONDS_PER_ITEM):
+        """Assembles and stores an exam. Returns its id, blueprint and shortfall."""
+        rng = random.Random(seed)
+        candidates = self.load_candidates(user_id)
+        by_topic = {}
+        for q in candidates:
+            by_topic.setdefault(q['topic_id'] or q['topic_key'], []).append(q)
+
+        strata = {}
+        for topic_qs in by_topic.values():
+            first = topic_qs[0]
+            spec = route_specialty(first['topic'] or '')
+            topic_weight = (first['priority'] or 50) / 100 * (1 + weakness(first['min_ease'], first['learning']))
+            for q in topic_qs:
+                # Efraimidis-Spirakis key: top-k by u^(1/w) == weighted sampling without replacement
+                w = topic_weight / len(topic_qs) * (SEEN_PENALTY if q['seen'] else 1.0)
+                q['key'] = rng.random() ** (1.0 / w)
+                q['specialty'] = spec
+                q['topic_weight'] = topic_weight
+            strata.setdefault(spec, {"weight": 0.0, "topics": []})
+            strata[spec]["weight"] += topic_weight
+            strata[spec]["topics"].append(topic_qs)
+
+        capacity = {s: sum(min(len(t), MAX_PER_TOPIC) for t in v["topics"]) for s, v in strata.items()}
+        seats = allocate(n, {s: v["weight"] for s, v in strata.items()}, capacity)
+
+        chosen = []
+        for spec, k in seats.items():
+            if not k:
+                continue
+            per_topic = {}
+            pool = sorted((q for t in strata[spec]["topics"] for q in t), key=lambda q: q['key'], reverse=True)
+            picked = []
+            for q in pool:
+                topic = q['topic_id'] or q['topic_key']
+                if per_topic.get(topic, 0) < MAX_PER_TOPIC:
+                    per_topic[topic] = per_topic.get(topic, 0) + 1
+                    picked.append(q)
+                    if len(picked) == k:
+                        break
+            chosen += picked
+        rng.shuffle(chosen)
+
+        blueprint = {s: seats[s] for s in sorted(seats) if seats[s]}
+        now = datetime.datetime.now().isoformat()
+        conn = self._get_conn()
+        c = conn.cursor()
+        c.execute('''
+            INSERT INTO mock_exams (user_id, status, n_items, duration_s, created_at, blueprint_json)
+            VALUES (?, 'ready', ?, ?, ?, ?)
+        ''', (user_id, len(chosen), len(chosen) * seconds_per_item, now, json.dumps(blueprint)))
+        exam_id = c.lastrowid
+        c.executemany('''
+            INSERT INTO mock_exam_items (exam_id, position, question_id, topic_id, specialty)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(exam_id, pos, q['id'], q['topic_id'], q['specialty']) for pos, q in enumerate(chosen, 1)])
+        conn.commit()
+        conn.close()
+        return {"exam_id": exam_id, "items": len(chosen), "requested": n,
+                "short": max(0, n - len(chosen)), "blueprint": blueprint}
+
+    # --- SESIÓN CRONOMETRADA ---
+
+    def _exam(self, c, exam_id):
+        exam = c.execute('SELECT * FROM mock_exams WHERE id = ?', (exam_id,)).fetchone()
+        if not exam:
+            raise KeyError(f"mock exam {exam_id} not found")
+        return exam
+
+    def start(self, exam_id, now=None):
+        """Starts the clock (idempotent) and returns the questions without their keys."""
+        now = now or datetime.datetime.now()
+        conn = self._get_conn()
+        c = conn.cursor()
+        exam = self._exam(c, exam_id)
+        if exam['status'] == 'ready':
+            deadline = (now + datetime.timedelta(seconds=exam['duration_s'])).isoformat()
+            c.execute("UPDATE mock_exams SET status = 'running', started_at = ?, deadline = ? WHERE id = ?",
+                      (now.isoformat(), deadline, exam_id))
+            conn.commit()
+            exam = self._exam(c, exam_id)
+        rows = c.execute('''
+            SELECT i.position, i.specialty, i.answer, q.id, q.content_json FROM mock_exam_items i
+            JOIN questions q ON q.id = i.question_id
+            WHERE i.exam_id = ? ORDER BY i.position
+        ''', (exam_id,)).fetchall()
+        conn.close()
+        if exam['status'] == 'running':
+            for r in rows:
+                self.provider.mark_seen(r['id'], exam['user_id'], now)
+        questions = []
+        for r in rows:
+            challenge = challenge_provider.to_challenge(json.loads(r['content_json']), r['id'])
+            questions.append({"position": r['position'], "specialty": r['specialty'], "content": challenge['content'],
+                              "options": challenge['options'], "answer": r['answer']})
+        return {"exam_id": exam_id, "status": exam['status'], "started_at": exam['started_at'],
+                "deadline": exam['deadline'], "questions": questions}
+
+    def answer(self, exam_id, position, letter, now=None):
+        """Records (or changes) an answer while the clock runs."""
+        now = now or datetime.datetime.now()
+        conn = self._get_conn()
+        c = conn.cursor()
+        try:
+            exam = self._exam(c, exam_id)
+            if exam['status'] != 'running':
+                return {"accepted": False, "reason": exam['status']}
+            if now.isoformat() > exam['deadline']:
+                return {"accepted": False, "reason": "time_up"}
+            row = c.execute('''
+                SELECT q.content_json FROM mock_exam_items i JOIN questions q ON q.id = i.question_id
+                WHERE i.exam_id = ? AND i.position = ?
+            ''', (exam_id, position)).fetchone()
+            if not row:
+                return {"accepted": False, "reason": "no_such_item"}
+            key = challenge_provider.to_challenge(json.loads(row['content_json']), None)['correct_answer']
+            letter = str(letter).strip().upper()[:1]
+            c.execute('''
+                UPDATE mock_exam_items SET answer = ?, is_correct = ?, answered_at = ?
+                WHERE exam_id = ? AND position = ?
+            ''', (letter, int(letter == key), now.isoformat(), exam_id, position))
+            conn.commit()
+        finally:
+            conn.close()
+        return {"accepted": True}
+
+    def finish(self, exam_id, now=None, feed_srs=True):
+        """Closes the exam and scores it, overall and per specialty.
+
+        With feed_srs, each answered item is a review (correct -> Good,
+        wrong -> Again) written in one batch like the diagnostic baseline.
+        """
+        now = now or datetime.datetime.now()
+        conn = self._get_conn()
+        c = conn.cursor()
+        exam = self._exam(c, exam_id)
+        first_close = exam['status'] != 'finished'
+        if first_close:
+            c.execute("UPDATE mock_exams SET status = 'finished', finished_at = ? WHERE id = ?",
+                      (now.isoformat(), exam_id))
+            conn.commit()
+            exam = self._exam(c, exam_id)
+        items = c.execute('SELECT * FROM mock_exam_items WHERE exam_id = ? ORDER BY position', (exam_id,)).fetchall()
+        conn.close()
+
+        by_spec = {}
+        for it in items:
+            s = by_spec.setdefault(it['specialty'], {"items": 0, "answered": 0, "correct": 0})
+            s["items"] += 1
+            s["answered"] += it['answer'] is not None
+            s["correct"] += bool(it['is_correct'])
+        for s in by_spec.values():
+            s["score"] = round(s["correct"] / s["items"], 3) if s["items"] else 0.0
+        correct = sum(s["correct"] for s in by_spec.values())
+        used = None
+        if exam['started_at']:
+            end = min(exam['finished_at'], exam['deadline'])
+            used = round((datetime.datetime.fromisoformat(end) -
+                          datetime.datetime.fromisoformat(exam['started_at'])).total_seconds())
+
+        if feed_srs and first_close:
+            ratings = [{"topic_id": it['topic_id'],
+                        "rating": scheduler.GOOD if it['is_correct'] else scheduler.AGAIN,
+                        "reviewed_at": it['answered_at']}
+                       for it in items if it['answer'] is not None and it['topic_id'] is not None]
+            if ratings:
+                agent_srs.update_progress_many(ratings, client='mock_exam')
+
+        return {
+            "exam_id": exam_id,
+            "items": len(items),
+            "answered": sum(s["answered"] for s in by_spec.values()),
+            "correct": correct,
+            "score": round(correct / len(items), 3) if items else 0.0,
+            "time_used_s": used,
+            "duration_s": exam['duration_s'],
+            "by_specialty": dict(sorted(by_spec.items()))
+        }
+
+def benchmark(n_questions=20000, n_topics=2000, n=DEFAULT_ITEMS):
+    """Assembly time of an n-item exam from a synthetic bank (temporary database)."""
+    import tempfile
+    specs = ["asma", "dengue", "apendicitis", "preeclampsia", "lactante", "ley", "diabetes", "trauma"]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE topics (id INTEGER PRIMARY KEY, title TEXT UNIQUE, priority INTEGER)')
+        conn.executemany('INSERT INTO topics VALUES (?, ?, ?)',
+                         [(i, f"{specs[i % len(specs)]} tema {i}", 50 + i % 50) for i in range(1, n_topics + 1)])
+        conn.commit()
+        conn.close()
+        bank = question_bank.QuestionBank(path)
+        bank.add_many([{"payload": {"content": f"Caso {k}", "options": ["A) a", "B) b", "C) c", "D) d"],
+                                    "correct_answer": "A", "explanation": ""},
+                        "topic": f"{specs[(k % n_topics + 1) % len(specs)]} tema {k % n_topics + 1}",
+                        "angle": "Diagnosis", "source_model": "bench"} for k in range(n_questions)])
+        exams = MockExams(path)
+        start = time.perf_counter()
+        built = exams.build(n, seed=1)
+        build_ms = (time.perf_counter() - start) * 1000
+        return {"questions": n_questions, "items": built["items"], "build_ms": round(build_ms, 1),
+                "blueprint": built["blueprint"]}
+
+if __name__ == "__main__":
+    # Usage:
+    #   python mock_exam.py build [n]       -> arma y guarda un simulacro (sin LLM)
+    #   python mock_exam.py finish <exam_id>
+    #   python mock_exam.py bench [n_questions]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'build'
+    if command == 'bench':
+        print(json.dumps(benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 20000), indent=2))
+    elif command == 'finish' and len(sys.argv) > 2:
+        print(json.dumps(MockExams().finish(int(sys.argv[2])), indent=2))
+    else:
+        built = MockExams().build(int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ITEMS)
+        print(json.dumps(built, indent=2))
+        if built["short"]:
+            print(f"⚠️ Banco insuficiente: faltan {built['short']} preguntas para completar el simulacro.")
@@ -2,11 +2,229 @@ import subprocess
 import json
 import os
 import sys
+import sqlite3
+import hashlib
+from datetime import datetime
+import question_bank
+
+CACHE_DB_PATH = 'notebook_cache.db'
+ATOMIC_NOTEBOOKS_DIR = os.getenv("ATOMIC_NOTEBOOKS_DIR", "StudyData/AtomicNotebooks")
+
+SUPER_NOTEBOOKS = {
+    "MI_I": {"id": "d4737997-77d9-4f4f-9fe5-fc879d1d33c4", "name": "CORTEX: MEDICINA INTERNA (Super-Notebook)"},
+    "MI_II": {"id": "a295fb79-0d00-48be-bf9c-b97e01a82750", "name": "CORTEX: MEDICINA INTERNA II (Super-Notebook)"},
+    "PEDIATRIA": {"id": "0301217b-b6a3-41c1-8f74-c6bc24c41ca8", "name": "CORTEX: PEDIATRÍA (Super-Notebook)"},
+    "GINECO": {"id": "3dcbf908-81e1-415e-9a24-3d4b518346e7", "name": "CORTEX: GINECOBSTETRICIA (Super-Notebook)"},
+    "CIRUGIA": {"id": "014d7abd-6aa6-4200-a0e2-fc4d81053bb4", "name": "CORTEX: CIRUGÍA Y URGENCIAS (Super-Notebook)"},
+    "SALUD_PUBLICA": {"id": "37cac7fe-3458-405d-b352-4f27641ed555", "name": "CORTEX: SALUD PÚBLICA, ÉTICA Y LEGAL (Super-Notebook)"}
+}
+
+# Mapping of common keywords to specialties
+SPECIALTY_MAP = {
+    "card": "MI_I", "insuficiencia cardíaca": "MI_I", "hfrer": "MI_I", "hfpef": "MI_I", 
+    "neumo": "MI_I", "epoc": "MI_I", "asma": "MI_I", "tep": "MI_I",
+    "nefro": "MI_I", "aki": "MI_I", "erc": "MI_I",
+    "infec": "MI_II", "vih": "MI_II", "dengue": "MI_II", "malaria": "MI_II", "tuberculosis": "MI_II", "tb": "MI_II",
+    "neuro": "MI_II", "epileps": "MI_II", "guillain": "MI_II", "parkinson": "MI_II",
+    "endo": "MI_II", "diabetes": "MI_II", "ada": "MI_II", "tiroides": "MI_II", "addison": "MI_II",
+    "reuma": "MI_II", "lupus": "MI_II", "artritis": "MI_II", "hemat": "MI_II",
+    "pediat": "PEDIATRIA", "lactante": "PEDIATRIA", "neonat": "PEDIATRIA", "eda": "PEDIATRIA",
+    "gineco": "GINECO", "obstet": "GINECO", "preeclampsia": "GINECO", "parto": "GINECO",
+    "cirug": "CIRUGIA", "apendicitis": "CIRUGIA", "colecistitis": "CIRUGIA", "trauma": "CIRUGIA",
+    "ley": "SALUD_PUBLICA", "norma": "SALUD_PUBLICA", "bioétic": "SALUD_PUBLICA", "bioestad": "SALUD_PUBLICA"
+}
+
+def tool_succeeded(res):
+    """False for empty results and for application errors returned as data
+    ({"status": "error"}, an "error" key or an MCP isError result)."""
+    if not res:
+        return False
+    if isinstance(res, dict):
+        return not (res.get("isError") or res.get("error") or str(res.get("status", "")).lower() == "error")
+    return True
+
+def route_specialty(topic):
+    """Maps a topic title to its specialty key in SUPER_NOTEBOOKS (fallback MI_II)."""
+    topic_lower = topic.lower()
+    for key, spec in SPECIALTY_MAP.items():
+        if key in topic_lower:
+            return spec
+    return "MI_II"
+
+
+class QueryCache:
+    """Persistent cache of notebook_query responses.
+
+    Entries are keyed by (notebook_id, sha256(query), source revision). The
+    revision is a local counter per notebook that is bumped whenever sources are
+    added (add_url_source / research_import), so stale answers are never served
+    and only the affected notebook is invalidated.
+    """
+
+    def __init__(self, db_path=CACHE_DB_PATH, max_entries=2000, max_bytes=50 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._setup()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _setup(self):
+        conn = self._get_conn()
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS nb_query_cache (
+            notebook_id TEXT NOT NULL,
+            query_hash TEXT NOT NULL,
+            revision INTEGER NOT NULL,
+            response_json TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at TEXT,
+            last_hit TEXT,
+            hits INTEGER DEFAULT 0,
+            PRIMARY KEY (notebook_id, query_hash, revision)
+        )''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_nb_cache_last_hit ON nb_query_cache(last_hit)')
+        c.execute('''CREATE TABLE IF NOT EXISTS nb_source_revisions (
+            notebook_id TEXT PRIMARY KEY,
+            revision INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS nb_cache_stats (
+            notebook_id TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0
+        )''')
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def hash_query(query):
+        return hashlib.sha256(query.strip().encode('utf-8')).hexdigest()
+
+    def get_revision(self, notebook_id):
+        conn = self._get_conn()
+        row = conn.execute('SELECT revision FROM nb_source_revisions WHERE notebook_id = ?', (notebook_id,)).fetchone()
+        conn.close()
+        return row['revision'] if row else 0
+
+    def bump_revision(self, notebook_id):
+        """Marks the notebook sources as changed and drops its cached answers."""
+        now = datetime.now().isoformat()
+        conn = self._get_conn()
+        c = conn.cursor()
+        c.execute('''
+            INSERT INTO nb_source_revisions (notebook_id, revision, updated_at) VALUES (?, 1, ?)
+            ON CONFLICT(notebook_id) DO UPDATE SET revision = revision + 1, updated_at = excluded.updated_at
+        ''', (notebook_id, now))
+        c.execute('DELETE FROM nb_query_cache WHERE notebook_id = ?', (notebook_id,))
+        dropped = c.rowcount
+        conn.commit()
+        revision = c.execute('SELECT revision FROM nb_source_revisions WHERE notebook_id = ?', (notebook_id,)).fetchone()[0]
+        conn.close()
+        print(f"🧹 [Cache] Notebook {notebook_id} -> revisión {revision} ({dropped} respuestas invalidadas)")
+        return revision
+
+    def _record(self, c, notebook_id, hit):
+        column = 'hits' if hit else 'misses'
+        c.execute(f'''
+            INSERT INTO nb_cache_stats (notebook_id, {column}) VALUES (?, 1)
+            ON CONFLICT(notebook_id) DO UPDATE SET {column} = {column} + 1
+        ''', (notebook_id,))
+
+    def get(self, notebook_id, query):
+        """Returns the cached response or None (and counts the hit/miss)."""
+        q_hash = self.hash_query(query)
+        conn = self._get_conn()
+        c = conn.cursor()
+        c.execute('''
+            SELECT qc.response_json FROM nb_query_cache qc
+            LEFT JOIN nb_source_revisions r ON r.notebook_id = qc.notebook_id
+            WHERE qc.notebook_id = ? AND qc.query_hash = ? AND qc.revision = COALESCE(r.revision, 0)
+        ''', (notebook_id, q_hash))
+        row = c.fetchone()
+        if row:
+            c.execute('''
+                UPDATE nb_query_cache SET hits = hits + 1, last_hit = ?
+                WHERE notebook_id = ? AND query_hash = ?
+            ''', (datetime.now().isoformat(), notebook_id, q_hash))
+        self._record(c, notebook_id, bool(row))
+        conn.commit()
+        conn.close()
+        return json.loads(row['response_json']) if row else None
+
+    def put(self, notebook_id, query, response):
+        payload = json.dumps(response, ensure_ascii=False)
+        if len(payload) > self.max_bytes:
+            return
+        now = datetime.now().isoformat()
+        conn = self._get_conn()
+        c = conn.cursor()
+        revision_row = c.execute('SELECT revision FROM nb_source_revisions WHERE notebook_id = ?', (notebook_id,)).fetchone()
+        revision = revision_row['revision'] if revision_row else 0
+        c.execute('''
+            INSERT OR REPLACE INTO nb_query_cache
+                (notebook_id, query_hash, revision, response_json, size, created_at, last_hit, hits)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+        ''', (notebook_id, self.hash_query(query), revision, payload, len(payload), now, now))
+        self._evict(c)
+        conn.commit()
+        conn.close()
+
+    def _evict(self, c):
+        """Enforces max_entries / max_bytes by dropping least recently used entries."""
+        count, total = c.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM nb_query_cache').fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = c.execute('''
+            SELECT rowid, size FROM nb_query_cache ORDER BY last_hit ASC
+        ''').fetchall()
+        to_delete = []
+        for row in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            to_delete.append((row['rowid'],))
+            count -= 1
+            total -= row['size']
+        c.executemany('DELETE FROM nb_query_cache WHERE rowid = ?', to_delete)
+
+    def stats(self):
+        """Hit-rate report, globally and per notebook."""
+        conn = self._get_conn()
+        c = conn.cursor()
+        entries, size = c.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM nb_query_cache').fetchone()
+        per_notebook = []
+        hits_total = misses_total = 0
+        for row in c.execute('SELECT notebook_id, hits, misses FROM nb_cache_stats ORDER BY hits + misses DESC'):
+            lookups = row['hits'] + row['misses']
+            hits_total += row['hits']
+            misses_total += row['misses']
+            per_notebook.append({
+                "notebook_id": row['notebook_id'],
+                "hits": row['hits'],
+                "misses": row['misses'],
+                "hit_rate": round(row['hits'] / lookups, 3) if lookups else 0.0
+            })
+        conn.close()
+        lookups = hits_total + misses_total
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": hits_total,
+            "misses": misses_total,
+            "hit_rate": round(hits_total / lookups, 3) if lookups else 0.0,
+            "notebooks": per_notebook
+        }
 
 # Wrapper for notebooklm-mcp
 class NotebookAdapter:
-    def __init__(self, executable_path="~/.local/bin/notebooklm-mcp"):
+    def __init__(self, executable_path="~/.local/bin/notebooklm-mcp", cache_path=CACHE_DB_PATH):
         self.cmd = os.path.expanduser(executable_path)
+        self.cache = QueryCache(cache_path) if cache_path else None
 
     def _call_tool(self, tool_name, arguments={}):
         """Generic method to call an MCP tool."""
@@ -133,36 +351,7 @@ class NotebookAdapter:
 
     def ensure_notebook(self, topic):
         """Routes the topic to its corresponding Super-Notebook with overflow handling."""
-        SUPER_NOTEBOOKS = {
-            "MI_I": {"id": "d4737997-77d9-4f4f-9fe5-fc879d1d33c4", "name": "CORTEX: MEDICINA INTERNA (Super-Notebook)"},
-            "MI_II": {"id": "a295fb79-0d00-48be-bf9c-b97e01a82750", "name": "CORTEX: MEDICINA INTERNA II (Super-Notebook)"},
-            "PEDIATRIA": {"id": "0301217b-b6a3-41c1-8f74-c6bc24c41ca8", "name": "CORTEX: PEDIATRÍA (Super-Notebook)"},
-            "GINECO": {"id": "3dcbf908-81e1-415e-9a24-3d4b518346e7", "name": "CORTEX: GINECOBSTETRICIA (Super-Notebook)"},
-            "CIRUGIA": {"id": "014d7abd-6aa6-4200-a0e2-fc4d81053bb4", "name": "CORTEX: CIRUGÍA Y URGENCIAS (Super-Notebook)"},
-            "SALUD_PUBLICA": {"id": "37cac7fe-3458-405d-b352-4f27641ed555", "name": "CORTEX: SALUD PÚBLICA, ÉTICA Y LEGAL (Super-Notebook)"}
-        }
-
-        # Mapping of common keywords to specialties
-        SPECIALTY_MAP = {
-            "card": "MI_I", "insuficiencia cardíaca": "MI_I", "hfrer": "MI_I", "hfpef": "MI_I", 
-            "neumo": "MI_I", "epoc": "MI_I", "asma": "MI_I", "tep": "MI_I",
-            "nefro": "MI_I", "aki": "MI_I", "erc": "MI_I",
-            "infec": "MI_II", "vih": "MI_II", "dengue": "MI_II", "malaria": "MI_II", "tuberculosis": "MI_II", "tb": "MI_II",
-            "neuro": "MI_II", "epileps": "MI_II", "guillain": "MI_II", "parkinson": "MI_II",
-            "endo": "MI_II", "diabetes": "MI_II", "ada": "MI_II", "tiroides": "MI_II", "addison": "MI_II",
-            "reuma": "MI_II", "lupus": "MI_II", "artritis": "MI_II", "hemat": "MI_II",
-            "pediat": "PEDIATRIA", "lactante": "PEDIATRIA", "neonat": "PEDIATRIA", "eda": "PEDIATRIA",
-            "gineco": "GINECO", "obstet": "GINECO", "preeclampsia": "GINECO", "parto": "GINECO",
-            "cirug": "CIRUGIA", "apendicitis": "CIRUGIA", "colecistitis": "CIRUGIA", "trauma": "CIRUGIA",
-            "ley": "SALUD_PUBLICA", "norma": "SALUD_PUBLICA", "bioétic": "SALUD_PUBLICA", "bioestad": "SALUD_PUBLICA"
-        }
-
-        topic_lower = topic.lower()
-        spec_key = "MI_II" # Fallback
-        for key, spec in SPECIALTY_MAP.items():
-            if key in topic_lower:
-                spec_key = spec
-                break
+        spec_key = route_specialty(topic)
         
         target = SUPER_NOTEBOOKS[spec_key]
         primary_id = target["id"]
@@ -193,19 +382,38 @@ class NotebookAdapter:
     
     def add_url_source(self, notebook_id, url):
         """Adds a URL source to the notebook."""
-        return self._call_tool("notebook_add_url", {"notebook_id": notebook_id, "url": url})
+        res = self._call_tool("notebook_add_url", {"notebook_id": notebook_id, "url": url})
+        if tool_succeeded(res) and self.cache:
+            self.cache.bump_revision(notebook_id)
+        return res
         
-    def query_notebook(self, notebook_id, query):
-        """Queries the notebook."""
-        return self._call_tool("notebook_query", {"notebook_id": notebook_id, "query": query})
+    def get_source_revision(self, notebook_id):
+        """Local revision counter of the notebook sources (0 if never changed)."""
+        return self.cache.get_revision(notebook_id) if self.cache else 0
 
-    def research_latest_guidelines(self, notebook_id, topic, current_date=None):
-        """Triggers a deep research for recent guidelines and imports them."""
+    def cache_stats(self):
+        return self.cache.stats() if self.cache else {}
+
+    def query_notebook(self, notebook_id, query, use_cache=True):
+        """Queries the notebook (served from the persistent cache when possible)."""
+        if use_cache and self.cache and notebook_id:
+            cached = self.cache.get(notebook_id, query)
+            if cached is not None:
+                print(f"⚡ [Cache] HIT notebook_query ({notebook_id})")
+                return cached
+        res = self._call_tool("notebook_query", {"notebook_id": notebook_id, "query": query})
+        # Only real answers are cached: an error would be served until the sources change
+        answered = isinstance(res, dict) and (res.get("answer") or res.get("content"))
+        if answered and tool_succeeded(res) and self.cache and notebook_id:
+            self.cache.put(notebook_id, query, res)
+        return res
+
+    def start_research(self, notebook_id, topic, current_date=None):
+        """Starts a web research task for recent guidelines and returns its task_id."""
         date_context = current_date if current_date else "febrero 2026"
         query = f"Guías clínicas y consensos médicos publicados hasta {date_context} sobre: {topic}"
         print(f"🌐 Iniciando búsqueda profunda 'Just-In-Time' ({date_context}) para: {topic}...")
         
-        # Start Research
         res = self._call_tool("research_start", {
             "notebook_id": notebook_id,
             "query": query,
@@ -213,72 +421,83 @@ class NotebookAdapter:
             "source": "web"
         })
         
-        if not res: return False
+        if not res: return None
         
         # res is already unpacked or is the result dict
         task_id = None
         if isinstance(res, dict):
-            task_id = res.get("task_id")
+            task_id = res.get("task_id") or (res.get("research") or {}).get("task_id")
             if not task_id and "content" in res:
                 try:
                     data = json.loads(res["content"][0]["text"])
                     task_id = data.get("task_id")
                 except: pass
-                
+        return task_id
+
+    def research_latest_guidelines(self, notebook_id, topic, current_date=None):
+        """Triggers a deep research for recent guidelines and imports them."""
+        task_id = self.start_research(notebook_id, topic, current_date)
         if task_id:
             if self._poll_research_status(notebook_id, task_id):
                 return self._import_research_sources(notebook_id, task_id)
         
         return False
 
-    def _poll_research_status(self, notebook_id, task_id):
-        """Polls until research is completed."""
+    @staticmethod
+    def _parse_research_status(res):
+        """Maps a research_status response to 'completed', 'failed' or 'in_progress'.
+
+        Only the fields the MCP actually returns are inspected: the task status
+        (top level or under 'research'), 'error' and the discovered 'sources'.
+        """
+        if not isinstance(res, dict):
+            return "in_progress"
+        if res.get("error"):
+            return "failed"
+        research = res.get("research") if isinstance(res.get("research"), dict) else res
+        status = str(research.get("status") or res.get("status") or "").lower()
+        
+        if status in ("completed", "complete", "done"):
+            return "completed"
+        if status in ("failed", "error", "cancelled"):
+            return "failed"
+        # Some MCPs return status=success once the sources are present
+        if status == "success" and (research.get("sources") or research.get("sources_found")):
+            return "completed"
+        return "in_progress"
+
+    def check_research_status(self, notebook_id, task_id, max_wait=0):
+        """Single research_status call. Returns (status, raw_response)."""
+        res = self._call_tool("research_status", {
+            "notebook_id": notebook_id,
+            "task_id": task_id,
+            "max_wait": max_wait
+        })
+        if not res:
+            return "unknown", None
+        return self._parse_research_status(res), res
+
+    def _poll_research_status(self, notebook_id, task_id, timeout=900, initial_delay=5, max_delay=120):
+        """Polls until research is completed, with exponential backoff."""
         import time
         print(f"⌛ Polling research status for task {task_id}...")
-        for i in range(25): # Max ~15 mins
-            res = self._call_tool("research_status", {
-                "notebook_id": notebook_id,
-                "task_id": task_id,
-                "max_wait": 30
-            })
-            if not res: 
-                time.sleep(10)
-                continue
-                
-            # Deep search for status indicators
-            all_str_values = []
-            def extract_strings(obj):
-                if isinstance(obj, dict):
-                    for k, v in obj.items():
-                        if isinstance(v, (str, dict, list)):
-                            extract_strings(v)
-                elif isinstance(obj, list):
-                    for item in obj:
-                        extract_strings(item)
-                elif isinstance(obj, str):
-                    all_str_values.append(obj.lower())
-
-            extract_strings(res)
-            
-            # Log for debugging - what keys and values did we get?
-            if isinstance(res, dict):
-                print(f"   [Poll {i+1}] Keys: {list(res.keys())} | Values head: {all_str_values[:10]}")
+        deadline = time.time() + timeout
+        delay = initial_delay
+        attempt = 0
+        while time.time() < deadline:
+            attempt += 1
+            status, res = self.check_research_status(notebook_id, task_id)
+            print(f"   [Poll {attempt}] status={status} (próximo intento en {delay}s)")
             
-            # Check for completion
-            if "completed" in all_str_values:
+            if status == "completed":
                 print(f"✅ Research task {task_id} completed.")
                 return True
-                
-            # Some MCPs return status=success for completion if result is present
-            if "success" in all_str_values and ("sources" in all_str_values or "sources" in str(res).lower()):
-                print(f"✅ Research task {task_id} completed (detected via sources).")
-                return True
-
-            if any(v in all_str_values for v in ["error", "failed"]):
+            if status == "failed":
                 print(f"❌ Research task {task_id} failed: {res}")
                 return False
                 
-            time.sleep(10)
+            time.sleep(min(delay, max(0, deadline - time.time())))
+            delay = min(max_delay, delay * 2)
         return False
 
     def _import_research_sources(self, notebook_id, task_id):
@@ -290,6 +509,8 @@ class NotebookAdapter:
         })
         if res:
             print(f"✅ Import successful.")
+            if self.cache:
+                self.cache.bump_revision(notebook_id)
             return True
         print(f"❌ Import failed.")
         return False
@@ -330,10 +551,17 @@ class NotebookAdapter:
             "  \"glosario\": { \"LABA\": \"Long-Acting Beta Agonist...\", \"MART\": \"...\" }\n"
             "}"
         )
-        return self.query_notebook(notebook_id, prompt)
+        res = self.query_notebook(notebook_id, prompt)
+        question = question_bank.extract_notebook_json(res)
+        if question:
+            question_bank.record_question(question, topic, angle_name, q_format, 'notebooklm', variant_context)
+        return res
 
-    def distill_topic_to_atomic(self, notebook_id, topic_title, current_date=None):
-        """Distills a notebook content into an Atomic Notebook (20 points + 5 cases)."""
+    def distill_topic_to_atomic(self, notebook_id, topic_title, current_date=None, output_dir=None, use_cache=True):
+        """Distills a notebook content into an Atomic Notebook (20 points + 5 cases).
+
+        use_cache=False always asks NotebookLM again (atomic_pipeline --force).
+        """
         date_context = current_date if current_date else "febrero 2026"
         prompt = (
             f"Actúa como un Especialista en Síntesis Médica Axioma. Tu tarea es analizar todas las fuentes del cuaderno '{topic_title}' "
@@ -349,13 +577,16 @@ class NotebookAdapter:
             "Formato de salida: Markdown estructurado con ## para cada ángulo. "
             "Usa la Regla de los Porqués para explicar cada uno, conectando el síntoma con la causa de forma magistral."
         )
-        res = self.query_notebook(notebook_id, prompt)
+        res = self.query_notebook(notebook_id, prompt, use_cache=use_cache)
         
         if res and "content" in res:
             try:
                 content = res["content"][0]["text"]
-                # Save to locally
-                file_path = f"/Users/danielsuarezsucre/ANALISIS DE TEMAS A ESTUDIAR/StudyData/AtomicNotebooks/{topic_title.replace(' ', '_')}.md"
+                # Save locally (ATOMIC_NOTEBOOKS_DIR unless overridden)
+                directory = output_dir or ATOMIC_NOTEBOOKS_DIR
+                os.makedirs(directory, exist_ok=True)
+                safe_name = topic_title.replace(' ', '_').replace('/', '-')
+                file_path = os.path.join(directory, f"{safe_name}.md")
                 with open(file_path, "w") as f:
                     f.write(content)
                 return file_path
@@ -556,6 +787,8 @@ class NotebookAdapter:
         return {"full_title": topic, "context": f"Guía clínica sobre {topic}."}
 
 if __name__ == "__main__":
-    # Test
+    # Usage: python notebook_adapter.py cache-stats
     nb = NotebookAdapter()
+    if len(sys.argv) > 1 and sys.argv[1] == "cache-stats":
+        print(json.dumps(nb.cache_stats(), indent=2, ensure_ascii=False))
     # print(nb.list_notebooks())
@@ -0,0 +1,286 @@
+import re
+import sys
+import json
+import sqlite3
+import hashlib
+import datetime
+import threading
+import topic_index
+
+DB_PATH = 'temario.db'
+
+# Columnas extraídas del JSON (SQLite JSON1, VIRTUAL: no ocupan espacio y se indexan)
+EXTRACTED = {
+    "topic_key": "$.topic_key",
+    "angle": "$.angle",
+    "format": "$.format",
+    "source_model": "$.source_model",
+    "difficulty": "$.difficulty",
+}
+INDEXES = {
+    "idx_questions_topic_angle": "topic_key, angle",
+    "idx_questions_angle": "angle",
+    "idx_questions_format": "format",
+    "idx_questions_source_model": "source_model",
+    "idx_questions_difficulty": "difficulty",
+}
+
+_OPTION_PREFIX = re.compile(r'^\s*[A-Ea-e][\)\.\-:]\s*')
+
+def _clean(text):
+    return ' '.join(str(text or '').split())
+
+def normalize_question(payload, topic, angle=None, fmt='mcq', source_model=None, difficulty=None):
+    """Common document for every generator's JSON shape.
+
+    Understands the Gemini challenge (content/options/correct_answer/explanation),
+    the NotebookLM clinical case (enunciado/opciones/correcta/retroalimentacion)
+    and BattleCard/journal MCQs (question/options/answer/explanation). The
+    original payload is kept under "raw" so it can be served as-is.
+    """
+    stem = payload.get('content') or payload.get('enunciado') or payload.get('question') or ''
+    options = payload.get('options') or payload.get('opciones') or []
+    answer = payload.get('correct_answer') or payload.get('correcta') or payload.get('answer')
+    explanation = payload.get('explanation') or payload.get('retroalimentacion') or ''
+    return {
+        "topic": _clean(topic),
+        "topic_key": topic_index.normalize_key(topic),
+        "angle": angle or payload.get('angle'),
+        "format": fmt,
+        "source_model": source_model,
+        "difficulty": difficulty if difficulty is not None else payload.get('difficulty'),
+        "stem": stem,
+        "options": options,
+        "answer": answer,
+        "explanation": explanation,
+        "raw": payload
+    }
+
+def content_hash(doc):
+    """Same topic + same stem + same options (any order, any A)/B) prefix) -> same hash."""
+    options = sorted(topic_index.normalize_key(_OPTION_PREFIX.sub('', str(o))) for o in doc.get('options') or [])
+    key = json.dumps([doc.get('topic_key'), topic_index.normalize_key(doc.get('stem')), options], ensure_ascii=False)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def extract_notebook_json(res):
+    """JSON object from a NotebookAdapter.query_notebook() result (MCP content text)."""
+    if not res:
+        return None
+    if isinstance(res, dict) and 'content' in res and isinstance(res['content'], list):
+        text = res['content'][0].get('text', '')
+    elif isinstance(res, dict):
+        return res
+    else:
+        text = str(res)
+    text = text.replace("```json", "").replace("```", "").strip()
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end < start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    # notebook_query suele envolver la respuesta en {"answer": "..."}
+    if isinstance(data, dict) and 'answer' in data and isinstance(data['answer'], str) and '{' in data['answer']:
+        return extract_notebook_json({"content": [{"text": data['answer']}]}) or data
+    return data
+
+class QuestionBank:
+    """Deduplicated, queryable store of every generated question (table `questions`).
+
+    Rows keep the legacy (angle_id, content_json, created_at) columns; content_json
+    now holds the normalized document and the topic/angle/format/source/difficulty
+    columns are JSON1 generated columns with their own indexes.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.setup_db()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def setup_db(self):
+        conn = self._get_conn()
+        c = conn.cursor()
+        # Write lock first: the column checks and ALTERs below must not interleave
+        # with another thread/process doing the same migration
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('''CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            angle_id INTEGER,
+            content_json TEXT,
+            created_at TEXT
+        )''')
+        columns = [r[1] for r in c.execute('PRAGMA table_xinfo(questions)')]
+        if 'topic_id' not in columns:
+            c.execute('ALTER TABLE questions ADD COLUMN topic_id INTEGER')
+        if 'content_hash' not in columns:
+            c.execute('ALTER TABLE questions ADD COLUMN content_hash TEXT')
+        for column, path in EXTRACTED.items():
+            if column not in columns:
+                c.execute(f"ALTER TABLE questions ADD COLUMN {column} TEXT "
+                          f"GENERATED ALWAYS AS (json_extract(content_json, '{path}')) VIRTUAL")
+        self._backfill_hashes(c)
+        c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_hash ON questions(content_hash) WHERE content_hash IS NOT NULL')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_questions_topic_id ON questions(topic_id)')
+        for name, cols in INDEXES.items():
+            c.execute(f'CREATE INDEX IF NOT EXISTS {name} ON questions({cols})')
+        conn.commit()
+        conn.close()
+
+    def _backfill_hashes(self, c):
+        """Normalizes legacy journal rows; later copies of an existing question keep a NULL hash."""
+        rows = c.execute('''
+            SELECT q.id, q.content_json, a.topic_id, t.title FROM questions q
+            LEFT JOIN angles a ON a.id = q.angle_id
+            LEFT JOIN topics t ON t.id = a.topic_id
+            WHERE q.content_hash IS NULL AND json_extract(q.content_json, '$.raw') IS NULL
+            ORDER BY q.id
+        ''').fetchall() if self._has_tables(c, 'angles', 'topics') else []
+        seen = {r[0] for r in c.execute('SELECT content_hash FROM questions WHERE content_hash IS NOT NULL')}
+        updates = []
+        for row in rows:
+            try:
+                payload = json.loads(row['content_json'] or '{}')
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(payload, dict):
+                continue
+            doc = normalize_question(payload, row['title'] or '', 'Journal', source_model='journal')
+            h = content_hash(doc)
+            updates.append((None if h in seen else h, row['topic_id'], json.dumps(doc, ensure_ascii=False), row['id']))
+            seen.add(h)
+        c.executemany('UPDATE questions SET content_hash = ?, topic_id = ?, content_json = ? WHERE id = ?', updates)
+
+    @staticmethod
+    def _has_tables(c, *names):
+        found = {r[0] for r in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return all(n in found for n in names)
+
+    # --- ESCRITURA ---
+
+    def add_many(self, items):
+        """Bulk insert in one transaction. items: dicts with payload + topic and
+        optional angle/format/source_model/difficulty/angle_id.
+
+        Duplicates (same content_hash, already stored or repeated in the batch)
+        are skipped. Returns {"inserted": n, "duplicates": n, "ids": [...]}
+        with ids aligned to items (None for duplicates).
+        """
+        now = datetime.datetime.now().isoformat()
+        conn = self._get_conn()
+        c = conn.cursor()
+        # Resolución de temas antes de la transacción (ensure_index puede hacer commit)
+        can_resolve = self._has_tables(c, 'topics')
+        topic_ids = {}
+        rows = []
+        for item in items:
+            doc = normalize_question(item['payload'], item['topic'], item.get('angle'), item.get('format', 'mcq'),
+                                     item.get('source_model'), item.get('difficulty'))
+            if doc['topic_key'] not in topic_ids:
+                topic_ids[doc['topic_key']] = topic_index.resolve_topic_id(item['topic'], conn) if can_resolve else None
+            rows.append((item.get('angle_id'), topic_ids[doc['topic_key']], json.dumps(doc, ensure_ascii=False),
+                         content_hash(doc), now))
+
+        if conn.in_transaction:
+            conn.commit()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            ids = []
+            for row in rows:
+                c.execute('''
+                    INSERT OR IGNORE INTO questions (angle_id, topic_id, content_json, content_hash, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', row)
+                ids.append(c.lastrowid if c.rowcount == 1 else None)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        inserted = sum(1 for i in ids if i is not None)
+        return {"inserted": inserted, "duplicates": len(ids) - inserted, "ids": ids}
+
+    def add(self, payload, topic, angle=None, fmt='mcq', source_model=None, difficulty=None, angle_id=None):
+        """Stores one question. Returns its id, or None if it was a duplicate."""
+        return self.add_many([{"payload": payload, "topic": topic, "angle": angle, "format": fmt,
+                               "source_model": source_model, "difficulty": difficulty, "angle_id": angle_id}])["ids"][0]
+
+    # --- LECTURA (búsquedas por índice) ---
+
+    def find_id(self, payload, topic):
+        """id of the stored copy of a question (dedup hash lookup), or None."""
+        h = content_hash(normalize_question(payload, topic))
+        conn = self._get_conn()
+        row = conn.execute('SELECT id FROM questions WHERE content_hash = ?', (h,)).fetchone()
+        conn.close()
+        return row['id'] if row else None
+
+    def find(self, topic=None, angle=None, fmt=None, source_model=None, difficulty=None, limit=50):
+        """Questions matching every given filter, newest first."""
+        where, params = [], []
+        for column, value in (("topic_key", topic_index.normalize_key(topic) if topic else None), ("angle", angle),
+                              ("format", fmt), ("source_model", source_model), ("difficulty", difficulty)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        sql = 'SELECT id, topic_id, content_json, created_at FROM questions'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        conn = self._get_conn()
+        rows = conn.execute(sql + ' ORDER BY id DESC LIMIT ?', (*params, limit)).fetchall()
+        conn.close()
+        return [dict(json.loads(r['content_json']), id=r['id'], topic_id=r['topic_id'], created_at=r['created_at'])
+                for r in rows]
+
+    def stats(self):
+        conn = self._get_conn()
+        c = conn.cursor()
+        total = c.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
+        by_source = dict(c.execute("SELECT COALESCE(source_model, 'unknown'), COUNT(*) FROM questions GROUP BY 1").fetchall())
+        by_format = dict(c.execute("SELECT COALESCE(format, 'unknown'), COUNT(*) FROM questions GROUP BY 1").fetchall())
+        conn.close()
+        return {"total": total, "by_source_model": by_source, "by_format": by_format}
+
+_banks = {}
+_banks_lock = threading.Lock()
+
+def get_bank(db_path=None):
+    db_path = db_path or DB_PATH
+    if db_path not in _banks:
+        with _banks_lock:
+            if db_path not in _banks:
+                _banks[db_path] = QuestionBank(db_path)
+    return _banks[db_path]
+
+def record_question(payload, topic, angle=None, fmt='mcq', source_model=None, difficulty=None, angle_id=None):
+    """Best-effort write used by the generators: a bank error never breaks generation."""
+    if not payload or not isinstance(payload, dict):
+        return None
+    try:
+        return get_bank().add(payload, topic, angle, fmt, source_model, difficulty, angle_id)
+    except Exception as e:
+        print(f"⚠️ [QuestionBank] No se pudo guardar la pregunta de '{topic}': {e}")
+        return None
+
+if __name__ == "__main__":
+    # Usage:
+    #   python question_bank.py stats
+    #   python question_bank.py find [topic] [angle]
+    #   python question_bank.py import <file.json>   (list of {"payload", "topic", "angle", ...})
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    bank = get_bank()
+    if command == 'find':
+        topic = sys.argv[2] if len(sys.argv) > 2 else None
+        angle = sys.argv[3] if len(sys.argv) > 3 else None
+        print(json.dumps(bank.find(topic, angle), ensure_ascii=False, indent=2))
+    elif command == 'import' and len(sys.argv) > 2:
+        with open(sys.argv[2]) as f:
+            result = bank.add_many(json.load(f))
+        print(f"📥 {result['inserted']} insertadas, {result['duplicates']} duplicadas")
+    else:
+        print(json.dumps(bank.stats(), indent=2))
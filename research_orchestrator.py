@@ -0,0 +1,193 @@
+import asyncio
+import sqlite3
+import random
+import sys
+import json
+import time
+from datetime import datetime
+from notebook_adapter import NotebookAdapter
+
+DB_PATH = 'temario.db'
+
+# Estados persistidos en research_tasks
+ACTIVE_STATES = ('starting', 'running', 'completed')
+FINAL_STATES = ('imported', 'failed', 'timeout')
+
+class ResearchOrchestrator:
+    """Runs many NotebookLM research tasks in parallel.
+
+    Each task is polled with adaptive exponential backoff (with jitter) and its
+    sources are imported as soon as it completes. Task state lives in the
+    research_tasks table, so a restart resumes polling instead of losing the task.
+    """
+
+    def __init__(self, db_path=DB_PATH, nb=None, max_concurrency=4,
+                 initial_delay=5, max_delay=120, timeout=900):
+        self.db_path = db_path
+        self.nb = nb or NotebookAdapter()
+        self.max_concurrency = max_concurrency
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.setup_db()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def setup_db(self):
+        conn = self._get_conn()
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS research_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            notebook_id TEXT,
+            task_id TEXT,
+            status TEXT DEFAULT 'starting', -- starting, running, completed, imported, failed, timeout
+            attempts INTEGER DEFAULT 0,
+            delay REAL,
+            next_poll_at REAL,
+            deadline REAL,
+            created_at TEXT,
+            updated_at TEXT
+        )''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_research_tasks_status ON research_tasks(status)')
+        conn.commit()
+        conn.close()
+
+    def _save(self, task_row_id, **fields):
+        fields['updated_at'] = datetime.now().isoformat()
+        cols = ', '.join(f"{k} = ?" for k in fields)
+        conn = self._get_conn()
+        conn.execute(f'UPDATE research_tasks SET {cols} WHERE id = ?', (*fields.values(), task_row_id))
+        conn.commit()
+        conn.close()
+
+    def _load(self, task_row_id):
+        conn = self._get_conn()
+        row = conn.execute('SELECT * FROM research_tasks WHERE id = ?', (task_row_id,)).fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def enqueue(self, topic, notebook_id=None):
+        """Registers a topic for research (started on the next run)."""
+        now = datetime.now().isoformat()
+        conn = self._get_conn()
+        c = conn.cursor()
+        c.execute('''
+            INSERT INTO research_tasks (topic, notebook_id, status, attempts, delay, created_at, updated_at)
+            VALUES (?, ?, 'starting', 0, ?, ?, ?)
+        ''', (topic, notebook_id, self.initial_delay, now, now))
+        task_row_id = c.lastrowid
+        conn.commit()
+        conn.close()
+        return task_row_id
+
+    def active_tasks(self):
+        conn = self._get_conn()
+        placeholders = ','.join('?' * len(ACTIVE_STATES))
+        rows = conn.execute(f'SELECT id FROM research_tasks WHERE status IN ({placeholders}) ORDER BY id',
+                            ACTIVE_STATES).fetchall()
+        conn.close()
+        return [r['id'] for r in rows]
+
+    def summary(self):
+        conn = self._get_conn()
+        rows = conn.execute('SELECT status, COUNT(*) AS n FROM research_tasks GROUP BY status').fetchall()
+        conn.close()
+        return {r['status']: r['n'] for r in rows}
+
+    def _next_delay(self, delay):
+        """Exponential backoff with +-20% jitter, capped at max_delay."""
+        delay = min(self.max_delay, (delay or self.initial_delay) * 2)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _drive(self, task_row_id, sem):
+        """Drives one task to a final state (start -> poll -> import)."""
+        task = self._load(task_row_id)
+
+        if task['status'] == 'starting':
+            async with sem:
+                notebook_id = task['notebook_id'] or await asyncio.to_thread(self.nb.ensure_notebook, task['topic'])
+                task_id = await asyncio.to_thread(self.nb.start_research, notebook_id, task['topic'])
+            if not task_id:
+                self._save(task_row_id, notebook_id=notebook_id, status='failed')
+                return 'failed'
+            now = time.time()
+            self._save(task_row_id, notebook_id=notebook_id, task_id=task_id, status='running',
+                       delay=self.initial_delay, next_poll_at=now + self.initial_delay,
+                       deadline=now + self.timeout)
+            task = self._load(task_row_id)
+
+        polled = False
+        while task['status'] == 'running':
+            # A task resumed after its deadline is still polled once: it may have
+            # finished while the process was down
+            if polled and time.time() > (task['deadline'] or 0):
+                self._save(task_row_id, status='timeout')
+                print(f"⏰ [Research] Timeout para '{task['topic']}' ({task['attempts']} sondeos)")
+                return 'timeout'
+
+            wait = max(0, (task['next_poll_at'] or 0) - time.time())
+            await asyncio.sleep(wait)
+
+            async with sem:
+                status, _ = await asyncio.to_thread(self.nb.check_research_status, task['notebook_id'], task['task_id'])
+
+            polled = True
+            attempts = task['attempts'] + 1
+            if status == 'completed':
+                self._save(task_row_id, status='completed', attempts=attempts)
+            elif status == 'failed':
+                self._save(task_row_id, status='failed', attempts=attempts)
+                print(f"❌ [Research] Falló la tarea de '{task['topic']}'")
+                return 'failed'
+            else:
+                delay = self._next_delay(task['delay'])
+                self._save(task_row_id, attempts=attempts, delay=delay, next_poll_at=time.time() + delay)
+            task = self._load(task_row_id)
+
+        if task['status'] == 'completed':
+            async with sem:
+                ok = await asyncio.to_thread(self.nb._import_research_sources, task['notebook_id'], task['task_id'])
+            # If the import fails the task stays 'completed' and is retried on the next run
+            if ok:
+                self._save(task_row_id, status='imported')
+                print(f"📚 [Research] Fuentes importadas para '{task['topic']}'")
+                return 'imported'
+        return task['status']
+
+    async def run_async(self, topics=()):
+        """Enqueues topics and drives every active task (new and resumed) concurrently."""
+        for topic in topics:
+            self.enqueue(topic)
+        task_ids = self.active_tasks()
+        if not task_ids:
+            return self.summary()
+
+        print(f"🚀 [Research] {len(task_ids)} tareas activas (concurrencia {self.max_concurrency})")
+        sem = asyncio.Semaphore(self.max_concurrency)
+        start = time.time()
+        results = await asyncio.gather(*(self._drive(t, sem) for t in task_ids), return_exceptions=True)
+        for task_row_id, result in zip(task_ids, results):
+            if isinstance(result, Exception):
+                print(f"⚠️ [Research] Error en tarea {task_row_id}: {result}")
+        print(f"✅ [Research] Ciclo terminado en {time.time() - start:.1f}s")
+        return self.summary()
+
+    def run(self, topics=()):
+        return asyncio.run(self.run_async(topics))
+
+if __name__ == "__main__":
+    # Usage:
+    #   python research_orchestrator.py "Dengue" "Preeclampsia"   (investiga en paralelo)
+    #   python research_orchestrator.py --resume                   (retoma tareas pendientes)
+    #   python research_orchestrator.py --status
+    orchestrator = ResearchOrchestrator()
+    args = sys.argv[1:]
+    if "--status" in args:
+        print(json.dumps(orchestrator.summary(), ensure_ascii=False))
+    else:
+        topics = [a for a in args if not a.startswith("--")]
+        print(json.dumps(orchestrator.run(topics), ensure_ascii=False))
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import math
+import time
+import datetime
+import numpy as np
+
+# Única implementación de SM-2 del proyecto. agent_srs.update_progress, app.py
+# (/api/review), DiagnosticEngine y srs_forecast programan con estas tablas.
+
+AGAIN, HARD, GOOD, EASY = 1, 2, 3, 4
+RATINGS = (AGAIN, HARD, GOOD, EASY)
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+MAX_EASE = 3.0
+MAX_INTERVAL = 36500 # days; keeps next_review inside datetime's range
+
+# Modelo por despliegue: 'sm2' (por defecto) o 'fsrs' (fsrs.py, parámetros ajustados con review_log)
+SCHEDULER = os.getenv("SRS_SCHEDULER", "sm2").lower()
+
+# Tablas indexadas por rating (índice 0 sin usar)
+FIRST_INTERVALS = ((0, 0, 1, 1, 2),  # interval 0
+                   (0, 0, 1, 3, 4))  # interval 1
+GROWTH = (0.0, 0.0, 1.2, 1.0, 1.3)   # Hard: interval * 1.2 | Good/Easy: interval * ease * factor
+USES_EASE = (False, False, False, True, True)
+EASE_DELTA = (0.0, -0.2, -0.15, 0.0, 0.15)
+STATUS = (None, 'learning', 'review', 'review', 'review')
+
+def _check_rating(rating):
+    if rating not in RATINGS:
+        raise ValueError(f"rating must be one of {RATINGS}, got {rating!r}")
+
+def schedule(interval, ease, rating):
+    """New (interval, ease, status) after one review.
+
+    interval 0/1 use FIRST_INTERVALS; longer intervals grow by floor():
+    Hard x1.2, Good x ease, Easy x ease x 1.3. Ease moves by EASE_DELTA and is
+    kept >= MIN_EASE on lapses/Hard and <= MAX_EASE on Easy.
+    """
+    _check_rating(rating)
+    interval = max(interval or 0, 0)
+    ease = DEFAULT_EASE if ease is None else ease
+    if interval <= 1:
+        new_interval = FIRST_INTERVALS[interval][rating]
+    elif USES_EASE[rating]:
+        new_interval = math.floor(interval * ease * GROWTH[rating])
+    else:
+        new_interval = math.floor(interval * GROWTH[rating])
+    new_interval = min(new_interval, MAX_INTERVAL)
+
+    new_ease = ease + EASE_DELTA[rating]
+    if rating in (AGAIN, HARD):
+        new_ease = max(MIN_EASE, new_ease)
+    elif rating == EASY:
+        new_ease = min(MAX_EASE, new_ease)
+    else:
+        new_ease = ease
+    return new_interval, new_ease, STATUS[rating]
+
+def days_until_due(interval):
+    """A lapse (interval 0) comes back tomorrow."""
+    return max(interval, 1)
+
+def next_review_at(interval, now=None):
+    now = now or datetime.datetime.now()
+    return (now + datetime.timedelta(days=days_until_due(interval))).isoformat()
+
+def review(state, rating, now=None):
+    """Scheduler interface used by every writer of `progress`.
+
+    state: current progress row as a dict (or None for a new card). Returns the
+    columns to store: status, interval, ease_factor, next_review and, with
+    SRS_SCHEDULER=fsrs, stability/difficulty.
+    """
+    _check_rating(rating)
+    state = dict(state or {})
+    if SCHEDULER == 'fsrs':
+        import fsrs
+        return fsrs.review(state, rating, now)
+    now = now or datetime.datetime.now()
+    new_interval, new_ease, status = schedule(state.get('interval'), state.get('ease_factor'), rating)
+    return {
+        "status": status,
+        "interval": new_interval,
+        "ease_factor": new_ease,
+        "stability": state.get('stability'),
+        "difficulty": state.get('difficulty'),
+        "next_review": next_review_at(new_interval, now)
+    }
+
+def review_many(states, ratings, nows):
+    """review() for many cards at once (one review each, aligned lists).
+
+    SM-2 goes through schedule_many(); FSRS falls back to one review() per card.
+    """
+    for rating in ratings:
+        _check_rating(rating)
+    states = [dict(s or {}) for s in states]
+    if SCHEDULER == 'fsrs':
+        import fsrs
+        return [fsrs.review(s, r, now) for s, r, now in zip(states, ratings, nows)]
+    new_i, new_e = schedule_many([s.get('interval') or 0 for s in states],
+                                 [DEFAULT_EASE if s.get('ease_factor') is None else s['ease_factor'] for s in states],
+                                 ratings)
+    return [{
+        "status": STATUS[rating],
+        "interval": interval,
+        "ease_factor": ease,
+        "stability": s.get('stability'),
+        "difficulty": s.get('difficulty'),
+        "next_review": next_review_at(interval, now)
+    } for s, rating, interval, ease, now in zip(states, ratings, new_i.tolist(), new_e.tolist(), nows)]
+
+_FIRST = np.array(FIRST_INTERVALS, dtype=np.int64)
+_GROWTH = np.array(GROWTH)
+_USES_EASE = np.array(USES_EASE)
+_EASE_DELTA = np.array(EASE_DELTA)
+
+def schedule_many(intervals, eases, ratings):
+    """Batch version of schedule() over arrays. Returns (new_intervals, new_eases).
+
+    Same tables and the same order of float operations as the scalar path, so
+    floor() lands on the same integer. Status is 'learning' where ratings == AGAIN.
+    """
+    i = np.asarray(intervals, dtype=np.int64)
+    e = np.asarray(eases, dtype=np.float64)
+    r = np.asarray(ratings, dtype=np.int64)
+    if r.size and (r.min() < AGAIN or r.max() > EASY):
+        raise ValueError(f"ratings must be in {RATINGS}")
+
+    i = np.maximum(i, 0)
+    grown = np.where(_USES_EASE[r], i * e * _GROWTH[r], i * _GROWTH[r])
+    new_i = np.where(i <= 1, _FIRST[np.minimum(i, 1), r], np.floor(grown).astype(np.int64))
+    np.minimum(new_i, MAX_INTERVAL, out=new_i)
+
+    shifted = e + _EASE_DELTA[r]
+    new_e = np.where(r <= HARD, np.maximum(MIN_EASE, shifted), np.where(r == EASY, np.minimum(MAX_EASE, shifted), e))
+    return new_i, new_e
+
+def benchmark(n=1_000_000, seed=0):
+    """Bulk rescheduling throughput: schedule_many vs a Python loop over schedule()."""
+    rng = np.random.default_rng(seed)
+    intervals = rng.integers(0, 365, n)
+    eases = rng.uniform(MIN_EASE, MAX_EASE, n)
+    ratings = rng.integers(1, 5, n)
+
+    start = time.perf_counter()
+    schedule_many(intervals, eases, ratings)
+    batch_s = time.perf_counter() - start
+
+    sample = min(n, 100_000)
+    rows = list(zip(intervals[:sample].tolist(), eases[:sample].tolist(), ratings[:sample].tolist()))
+    start = time.perf_counter()
+    for i, e, r in rows:
+        schedule(i, e, r)
+    scalar_s = (time.perf_counter() - start) * n / sample
+
+    return {
+        "cards": n,
+        "batch_ms": round(batch_s * 1000, 1),
+        "batch_cards_per_s": round(n / batch_s),
+        "scalar_ms_estimated": round(scalar_s * 1000, 1),
+        "speedup": round(scalar_s / batch_s, 1)
+    }
+
+if __name__ == "__main__":
+    # Usage:
+    #   python scheduler.py <interval> <ease> <rating>
+    #   python scheduler.py bench [n]
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        print(json.dumps(benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000), indent=2))
+    elif len(sys.argv) == 4:
+        new_interval, new_ease, status = schedule(int(sys.argv[1]), float(sys.argv[2]), int(sys.argv[3]))
+        print(json.dumps({"interval": new_interval, "ease_factor": new_ease, "status": status,
+                          "next_review": next_review_at(new_interval)}))
+    else:
+        print("Usage: python scheduler.py <interval> <ease> <rating> | bench [n]")
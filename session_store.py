@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+DB_PATH = 'temario.db'
+CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024")) # hot sessions kept in memory
+
+class SessionStore:
+    """Current challenge + bot state per student (user_sessions in temario.db).
+
+    Replaces the single current_session.json for bot users: one row per user,
+    so students never see each other's challenge and the state survives a
+    restart. Recently used sessions stay in an in-memory LRU, so a button press
+    doesn't touch disk. The cache assumes one writer process per user (the bot);
+    the default user keeps its file for the dashboard (see study_core).
+    """
+
+    def __init__(self, db_path=DB_PATH, cache_size=CACHE_SIZE):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self._cache = OrderedDict() # user_id -> session dict (None = known empty)
+        self._lock = threading.Lock()
+        self.setup_db()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def setup_db(self):
+        conn = self._get_conn()
+        conn.execute('''CREATE TABLE IF NOT EXISTS user_sessions (
+            user_id TEXT PRIMARY KEY,
+            session_json TEXT NOT NULL,
+            updated_at TEXT
+        )''')
+        conn.commit()
+        conn.close()
+
+    def _remember(self, user_id, session):
+        with self._lock:
+            self._cache[user_id] = session
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get(self, user_id):
+        with self._lock:
+            if user_id in self._cache:
+                self._cache.move_to_end(user_id)
+                session = self._cache[user_id]
+                return dict(session) if session is not None else None
+        conn = self._get_conn()
+        row = conn.execute('SELECT session_json FROM user_sessions WHERE user_id = ?', (user_id,)).fetchone()
+        conn.close()
+        session = json.loads(row['session_json']) if row else None
+        self._remember(user_id, session)
+        return dict(session) if session is not None else None
+
+    def peek(self, user_id):
+        """(True, session) if the user is in the LRU, else (False, None): never touches disk."""
+        with self._lock:
+            if user_id not in self._cache:
+                return False, None
+            self._cache.move_to_end(user_id)
+            session = self._cache[user_id]
+            return True, (dict(session) if session is not None else None)
+
+    def put(self, user_id, session):
+        conn = self._get_conn()
+        conn.execute('''
+            INSERT INTO user_sessions (user_id, session_json, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET session_json = excluded.session_json, updated_at = excluded.updated_at
+        ''', (user_id, json.dumps(session, ensure_ascii=False), datetime.now().isoformat()))
+        conn.commit()
+        conn.close()
+        self._remember(user_id, dict(session))
+
+    def update(self, user_id, **fields):
+        """Merges fields into the stored session (json_patch: None removes a key).
+        Returns the new session, or None if the user has none."""
+        conn = self._get_conn()
+        conn.execute('UPDATE user_sessions SET session_json = json_patch(session_json, ?), updated_at = ? WHERE user_id = ?',
+                     (json.dumps(fields, ensure_ascii=False), datetime.now().isoformat(), user_id))
+        row = conn.execute('SELECT session_json FROM user_sessions WHERE user_id = ?', (user_id,)).fetchone()
+        conn.commit()
+        conn.close()
+        session = json.loads(row['session_json']) if row else None
+        self._remember(user_id, session)
+        return dict(session) if session is not None else None
+
+    def clear(self, user_id):
+        """Deletes the session. Returns True if it existed."""
+        conn = self._get_conn()
+        deleted = conn.execute('DELETE FROM user_sessions WHERE user_id = ?', (user_id,)).rowcount
+        conn.commit()
+        conn.close()
+        self._remember(user_id, None)
+        return bool(deleted)
+
+    def recent_users(self, since, limit=None):
+        """Users whose session changed after `since` (ISO timestamp), most recent first."""
+        conn = self._get_conn()
+        rows = conn.execute('SELECT user_id FROM user_sessions WHERE updated_at >= ? ORDER BY updated_at DESC LIMIT ?',
+                            (since, -1 if limit is None else limit)).fetchall()
+        conn.close()
+        return [r['user_id'] for r in rows]
+
+    def stats(self):
+        conn = self._get_conn()
+        total = conn.execute('SELECT COUNT(*) FROM user_sessions').fetchone()[0]
+        conn.close()
+        return {"sessions": total, "cached": len(self._cache), "cache_size": self.cache_size}
+
+_stores = {}
+
+def get_sessions(db_path=None):
+    db_path = db_path or DB_PATH
+    if db_path not in _stores:
+        _stores[db_path] = SessionStore(db_path)
+    return _stores[db_path]
+
+if __name__ == "__main__":
+    # Usage:
+    #   python session_store.py stats
+    #   python session_store.py show <user_id>
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    store = get_sessions()
+    if command == 'show' and len(sys.argv) > 2:
+        print(json.dumps(store.get(sys.argv[2]), ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(store.stats(), indent=2))
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import datetime
+import numpy as np
+import scheduler
+
+DB_PATH = 'temario.db'
+EXAM_DATE = os.getenv("EXAM_DATE", "2026-03-13")
+DEFAULT_HORIZON = 30 # días a proyectar si la fecha del examen ya pasó
+PRIOR_RATINGS = [0.10, 0.15, 0.60, 0.15] # Again, Hard, Good, Easy cuando no hay historial
+MIN_HISTORY = 30 # reviews mínimas para usar la distribución por tipo de tarjeta
+RATING_BINS = 4096 # resolución de la tabla de muestreo de ratings
+
+def get_conn(db_path=None):
+    return sqlite3.connect(db_path or DB_PATH, timeout=30)
+
+def load_cards(conn, today):
+    """interval, ease y día de vencimiento (offset desde hoy, vencidas -> 0) de cada ángulo programado."""
+    rows = conn.execute('''
+        SELECT interval, ease_factor, next_review FROM progress
+        WHERE status IN ('review', 'learning') AND next_review IS NOT NULL
+    ''').fetchall()
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+    interval = np.array([r[0] or 0 for r in rows], dtype=np.int64)
+    ease = np.array([r[1] or 2.5 for r in rows], dtype=np.float64)
+    due_dates = np.array([r[2][:10] for r in rows], dtype='datetime64[D]')
+    due = np.maximum((due_dates - np.datetime64(today, 'D')).astype(np.int64), 0)
+    return interval, ease, due
+
+def count_new_cards(conn):
+    """Topics whose primary angle was never reviewed (same rule as agent_srs.next_items)."""
+    return conn.execute('''
+        SELECT COUNT(*) FROM topics t
+        LEFT JOIN angles a ON a.id = (SELECT MIN(a2.id) FROM angles a2 WHERE a2.topic_id = t.id)
+        LEFT JOIN progress p ON p.angle_id = a.id
+        WHERE p.status IS NULL OR p.status = 'pending'
+    ''').fetchone()[0]
+
+def rating_distribution(conn):
+    """P(rating) for young (interval 0) and mature cards, taken from review_log.
+
+    The log doesn't store the interval at review time, so a topic's first
+    logged review is counted as 'young' and the rest as 'mature'. Add-one
+    smoothing; falls back to PRIOR_RATINGS when there is too little history.
+    """
+    has_log = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'review_log'").fetchone()
+    young = np.ones(4)
+    mature = np.ones(4)
+    if has_log:
+        rows = conn.execute('''
+            SELECT rating, reviewed_at = MIN(reviewed_at) OVER (PARTITION BY topic_id) AS first
+            FROM review_log WHERE rating BETWEEN 1 AND 4
+        ''').fetchall()
+        for rating, first in rows:
+            (young if first else mature)[rating - 1] += 1
+    prior = np.array(PRIOR_RATINGS)
+    young = young / young.sum() if young.sum() - 4 >= MIN_HISTORY else prior
+    mature = mature / mature.sum() if mature.sum() - 4 >= MIN_HISTORY else prior
+    return young, mature
+
+def _bucket(buckets, due_day, *columns):
+    """Appends each card's state (columns) to the bucket of its due day; drops those past the horizon."""
+    inside = due_day < len(buckets)
+    due_day = due_day[inside].astype(np.int16)
+    order = np.argsort(due_day, kind='stable') # radix sort para int16
+    due_day = due_day[order]
+    columns = [col[inside][order] for col in columns]
+    days, starts = np.unique(due_day, return_index=True)
+    bounds = list(starts[1:])
+    for day, *parts in zip(days, *(np.split(col, bounds) for col in columns)):
+        buckets[day].append(parts)
+
+def simulate(interval, ease, due, days, runs=32, new_per_day=0, n_new=0,
+             young_probs=PRIOR_RATINGS, mature_probs=PRIOR_RATINGS, seed=None):
+    """Monte Carlo of the daily review load.
+
+    Each (run, card) pair travels with its own state (interval, ease) in the
+    bucket of the day it is due, so a simulated day only touches that day's
+    reviews and never gathers from a runs x cards matrix. New cards enter
+    `new_per_day` at a time (interval 0, ease 2.5) until `n_new` are
+    exhausted. Returns a (runs x days) load matrix.
+    """
+    rng = np.random.default_rng(seed)
+    n_new = min(n_new, new_per_day * days)
+    intervals = np.concatenate([np.asarray(interval, dtype=np.int64), np.zeros(n_new, dtype=np.int64)])
+    eases = np.concatenate([np.asarray(ease, dtype=np.float64), np.full(n_new, 2.5)])
+    first_due = np.concatenate([np.asarray(due, dtype=np.int64), np.arange(n_new) // max(new_per_day, 1)])
+    n = len(intervals)
+
+    buckets = [[] for _ in range(days)]
+    _bucket(buckets, np.tile(first_due, runs), np.repeat(np.arange(runs), n), np.tile(intervals, runs), np.tile(eases, runs))
+
+    # Tabla de muestreo: rating = table[maduro, entero uniforme en RATING_BINS]
+    bins = (np.arange(RATING_BINS) + 0.5) / RATING_BINS
+    table = np.stack([np.searchsorted(np.cumsum(p)[:3], bins, side='right') + 1
+                      for p in (young_probs, mature_probs)]).astype(np.int64).ravel()
+    load = np.zeros((runs, days), dtype=np.int64)
+    for day in range(days):
+        if not buckets[day]:
+            continue
+        run_ids, cur_interval, cur_ease = (np.concatenate(col) for col in zip(*buckets[day]))
+        buckets[day] = None
+        load[:, day] = np.bincount(run_ids, minlength=runs)
+        draw = rng.integers(0, RATING_BINS, len(run_ids))
+        rating = table[draw + RATING_BINS * (cur_interval > 0)]
+        new_interval, new_ease = scheduler.schedule_many(cur_interval, cur_ease, rating)
+        _bucket(buckets, day + np.maximum(new_interval, 1), run_ids, new_interval, new_ease)
+    return load
+
+def forecast(days=None, runs=32, new_per_day=0, seed=None, today=None, db_path=None):
+    """Projected reviews per day from today (until EXAM_DATE by default)."""
+    start = time.perf_counter()
+    today = today or datetime.date.today()
+    if days is None:
+        days = (datetime.date.fromisoformat(EXAM_DATE) - today).days + 1
+        days = days if days > 0 else DEFAULT_HORIZON
+    conn = get_conn(db_path)
+    interval, ease, due = load_cards(conn, today)
+    n_new = count_new_cards(conn) if new_per_day else 0
+    young, mature = rating_distribution(conn)
+    conn.close()
+
+    load = simulate(interval, ease, due, days, runs, new_per_day, n_new, young, mature, seed)
+    mean = load.mean(axis=0)
+    p10, p90 = np.percentile(load, [10, 90], axis=0)
+    dates = [(today + datetime.timedelta(days=d)).isoformat() for d in range(days)]
+    peak = int(mean.argmax()) if days else 0
+    return {
+        "start": today.isoformat(),
+        "days": [
+            {"date": dates[d], "mean": round(float(mean[d]), 1), "p10": int(p10[d]), "p90": int(p90[d])}
+            for d in range(days)
+        ],
+        "total_mean": round(float(load.sum(axis=1).mean()), 1),
+        "peak": {"date": dates[peak], "mean": round(float(mean[peak]), 1)} if days else None,
+        "cards": int(len(interval)),
+        "new_cards": int(n_new),
+        "runs": runs,
+        "rating_probs": {"young": [round(float(p), 3) for p in young], "mature": [round(float(p), 3) for p in mature]},
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+
+def benchmark(n_cards=30000, days=120, runs=32):
+    """Synthetic mature deck: intervals 1..180 days, due dates spread over each interval."""
+    rng = np.random.default_rng(0)
+    interval = np.minimum(np.ceil(rng.lognormal(3.0, 1.0, n_cards)), 180).astype(np.int64)
+    ease = rng.uniform(1.3, 3.0, n_cards)
+    due = rng.integers(0, interval + 1)
+    start = time.perf_counter()
+    load = simulate(interval, ease, due, days, runs, seed=1)
+    elapsed = time.perf_counter() - start
+    reviews = int(load.sum())
+    return {
+        "cards": n_cards, "days": days, "runs": runs,
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "mean_reviews_per_run": round(reviews / runs, 1),
+        "simulated_reviews_per_s": round(reviews / elapsed)
+    }
+
+if __name__ == "__main__":
+    # Usage:
+    #   python srs_forecast.py [días] [runs] [nuevas_por_día]
+    #   python srs_forecast.py bench [n_cards] [runs]
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        n_cards = int(sys.argv[2]) if len(sys.argv) > 2 else 30000
+        runs = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+        print(json.dumps(benchmark(n_cards, runs=runs), indent=2))
+    else:
+        args = [int(a) for a in sys.argv[1:4]]
+        days = args[0] if len(args) > 0 else None
+        runs = args[1] if len(args) > 1 else 32
+        new_per_day = args[2] if len(args) > 2 else 0
+        result = forecast(days, runs, new_per_day)
+        for d in result["days"]:
+            print(f"{d['date']}  {d['mean']:7.1f}  [{d['p10']}-{d['p90']}]")
+        print(json.dumps({k: v for k, v in result.items() if k != "days"}, indent=2))
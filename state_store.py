@@ -0,0 +1,70 @@
+import fcntl
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Inter-process advisory lock on `path` (held on a sibling `.lock` file)."""
+    lock_path = path + '.lock'
+    directory = os.path.dirname(lock_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(lock_path, 'a+') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _write_atomic(path, data, **dump_kwargs):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        # rename is atomic: readers see either the old or the new file, never a truncated one
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _read(path, default):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except json.JSONDecodeError as e:
+        print(f"⚠️ [State] JSON inválido en {path}: {e}")
+        return default
+
+def read_json(path, default=None):
+    with file_lock(path, shared=True):
+        return _read(path, default)
+
+def write_json(path, data, **dump_kwargs):
+    """Write-to-temp-and-rename under the exclusive lock."""
+    with file_lock(path):
+        _write_atomic(path, data, **dump_kwargs)
+
+def update_json(path, fn, default=None, **dump_kwargs):
+    """Locked read-modify-write: fn(current) returns the new document, or None
+    to leave the file as it is (e.g. nothing to update)."""
+    with file_lock(path):
+        data = fn(_read(path, default))
+        if data is not None:
+            _write_atomic(path, data, **dump_kwargs)
+        return data
+
+def remove(path):
+    """Deletes the file under the lock. Returns True if it existed."""
+    with file_lock(path):
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
@@ -0,0 +1,74 @@
+import os
+import asyncio
+import weakref
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import study_core
+
+# Hilos para el trabajo bloqueante de study_core: SQLite y archivos (rápido) por
+# un lado y generación de retos (NotebookLM, Gemini: segundos) por otro, para que
+# un clic no espere detrás de las generaciones de otros chats
+CORE_WORKERS = int(os.getenv("STUDY_CORE_WORKERS", "4"))
+GEN_WORKERS = int(os.getenv("STUDY_GEN_WORKERS", "4"))
+
+_executors = {}
+_chat_locks = weakref.WeakValueDictionary()
+
+def get_executor(kind="core"):
+    """Bounded pool: 'core' (SQLite/files) or 'gen' (challenge generation)."""
+    if kind not in _executors:
+        workers = GEN_WORKERS if kind == "gen" else CORE_WORKERS
+        _executors[kind] = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=kind)
+    return _executors[kind]
+
+async def _run_in(kind, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(kind), functools.partial(fn, *args, **kwargs))
+
+async def run(fn, *args, **kwargs):
+    """Runs a blocking call in the bounded core executor without blocking the event loop."""
+    return await _run_in("core", fn, *args, **kwargs)
+
+async def run_generation(fn, *args, **kwargs):
+    """Like run(), in the generation executor (calls that may wait on the LLM)."""
+    return await _run_in("gen", fn, *args, **kwargs)
+
+def chat_lock(chat_id):
+    """asyncio.Lock for one chat: its updates run one at a time, other chats are unaffected.
+
+    Locks live only while some handler holds a reference (weak dict), so idle
+    chats don't accumulate.
+    """
+    lock = _chat_locks.get(chat_id)
+    if lock is None:
+        lock = _chat_locks[chat_id] = asyncio.Lock()
+    return lock
+
+# --- FACHADA ASYNC DE study_core ---
+
+async def get_daily_metrics(user_id=study_core.DEFAULT_USER):
+    return await run(study_core.get_daily_metrics, user_id)
+
+async def get_study_queue(n=20, filters=None, user_id=study_core.DEFAULT_USER):
+    return await run(study_core.get_study_queue, n, filters, user_id)
+
+async def get_or_generate_challenge(user_id=study_core.DEFAULT_USER):
+    return await run_generation(study_core.get_or_generate_challenge, user_id)
+
+async def process_review(topic_label, rating, latency_ms=None, client='dashboard', user_id=study_core.DEFAULT_USER):
+    return await run(study_core.process_review, topic_label, rating, latency_ms=latency_ms, client=client,
+                     user_id=user_id)
+
+async def read_session(user_id=study_core.DEFAULT_USER):
+    hit, session = study_core.peek_session(user_id) # LRU hit: answered on the loop, no thread hop
+    if hit:
+        return session
+    return await run(study_core.read_session, user_id)
+
+async def update_session(user_id, **fields):
+    return await run(study_core.update_session, user_id, **fields)
+
+def shutdown(wait=True):
+    while _executors:
+        _, executor = _executors.popitem()
+        executor.shutdown(wait=wait, cancel_futures=True)
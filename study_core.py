@@ -1,26 +1,151 @@
-import json
-import os
 import sqlite3
 import math
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import zip_longest
 import agent_srs
-from gemini_adapter import GeminiAdapter
+import challenge_provider
+import state_store
+import session_store
+import topic_index
 from notebook_adapter import NotebookAdapter
+from graph_store import GraphStore
+from challenge_pool import ChallengePool, ChallengePoolWorker, MASTERY_GOAL, target_topic_of
+
+ANGLES = ["Diagnosis", "Treatment", "Trap"]
 
 DB_PATH = 'temario.db'
 GRAPH_PATH = 'study_dashboard/graph_data.json'
 SESSION_PATH = 'current_session.json'
 
-def get_daily_metrics():
+DEFAULT_USER = challenge_provider.DEFAULT_USER
+POOL_ACTIVE_DAYS = 7 # estudiantes con sesión más reciente que esto tienen retos pre-generados
+POOL_MAX_USERS = 50
+
+def _partition(user_id):
+    """None para el usuario por defecto (tablas/archivos originales), si no el id del estudiante."""
+    return None if user_id in (None, DEFAULT_USER) else str(user_id)
+
+def get_graph_store(user_id=DEFAULT_USER):
+    """Grafo en SQLite (se siembra desde GRAPH_PATH la primera vez), con el estado del usuario."""
+    return GraphStore(DB_PATH, GRAPH_PATH, _partition(user_id))
+
+def setup_storage():
+    """Esquema, WAL y primera importación del grafo antes de atender updates en paralelo
+    (bot, webhook, arnés): así ningún handler migra la base mientras otro la usa."""
+    get_graph_store()
+    session_store.get_sessions(DB_PATH)
+    conn = agent_srs.get_conn()
+    has_syllabus = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name IN ('topics', 'angles')").fetchone()[0] == 2
+    if not has_syllabus: # sin temario todavía: solo las tablas por estudiante
+        c = conn.cursor()
+        agent_srs.create_user_progress(c)
+        agent_srs.create_review_log(c)
+        conn.commit()
+    conn.close()
+    if has_syllabus:
+        agent_srs.setup_db() # progress, review_log e índices de la cola (idx_topics_priority...)
+
+# --- SESIÓN ACTUAL POR USUARIO ---
+# El usuario por defecto sigue en SESSION_PATH (el dashboard lo lee); los
+# estudiantes del bot van a user_sessions con caché LRU (session_store).
+
+def read_session(user_id=DEFAULT_USER):
+    if _partition(user_id) is None:
+        return state_store.read_json(SESSION_PATH)
+    return session_store.get_sessions(DB_PATH).get(_partition(user_id))
+
+def peek_session(user_id=DEFAULT_USER):
+    """(hit, session) from the in-memory LRU only; the default user's file is never cached."""
+    if _partition(user_id) is None:
+        return False, None
+    return session_store.get_sessions(DB_PATH).peek(_partition(user_id))
+
+def write_session(user_id, session):
+    if _partition(user_id) is None:
+        state_store.write_json(SESSION_PATH, session)
+    else:
+        session_store.get_sessions(DB_PATH).put(_partition(user_id), session)
+
+def update_session(user_id, **fields):
+    """Merges fields (e.g. bot state like shown_at) into the current session; None if there is none."""
+    if _partition(user_id) is None:
+        return state_store.update_json(SESSION_PATH, lambda s: dict(s, **fields) if s else s)
+    return session_store.get_sessions(DB_PATH).update(_partition(user_id), **fields)
+
+def clear_session(user_id=DEFAULT_USER):
+    if _partition(user_id) is None:
+        return state_store.remove(SESSION_PATH)
+    return session_store.get_sessions(DB_PATH).clear(_partition(user_id))
+
+def get_challenge_pool():
+    return ChallengePool(DB_PATH)
+
+_pool_worker = None
+
+def _pool_slots():
+    """Union of the slots wanted by the default user and the recently active students.
+
+    The pool is shared (keyed by topic/level), so the worker also prunes
+    against this union. Users are interleaved: everyone's next challenge comes
+    before anyone's lookahead.
+    """
+    pool = get_challenge_pool()
+    since = (datetime.now() - timedelta(days=POOL_ACTIVE_DAYS)).isoformat()
+    users = [DEFAULT_USER] + session_store.get_sessions(DB_PATH).recent_users(since, POOL_MAX_USERS)
+    per_user = []
+    for user_id in users:
+        store = get_graph_store(user_id)
+        slots = pool.wanted_slots(store.first_node('active'), store.upcoming_nodes(10))
+        # El reto que ya está en sesión no necesita otra copia en el pool
+        session = read_session(user_id)
+        if session:
+            slots = [s for s in slots if s != (session.get('target_topic'), session.get('m_level'))]
+        per_user.append(slots)
+    out, seen = [], set()
+    for rank in zip_longest(*per_user):
+        for slot in rank:
+            if slot is not None and slot not in seen:
+                seen.add(slot)
+                out.append(slot)
+    return out
+
+def start_challenge_worker(lookahead=3, interval=120):
+    """Arranca (una vez por proceso) el worker que mantiene el pool de retos lleno."""
+    global _pool_worker
+    if _pool_worker is None:
+        pool = get_challenge_pool()
+        pool.lookahead = lookahead
+        _pool_worker = ChallengePoolWorker(pool, _pool_slots, generate_challenge, interval=interval)
+        _pool_worker.start()
+    return _pool_worker
+
+def _kick_pool_worker():
+    if _pool_worker is not None:
+        _pool_worker.kick()
+
+def load_graph():
+    """Grafo completo en el formato de graph_data.json (para el dashboard)."""
+    return get_graph_store().export_graph()
+
+def get_study_queue(n=20, filters=None, user_id=DEFAULT_USER):
+    """Próximos n ítems del SRS (repasos vencidos, learning, nuevos) en una sola consulta.
+
+    Misma cola que usan app.py (/api/queue) y agent_srs.py; cada ítem indica además
+    si es el nodo activo del grafo.
+    """
+    items = agent_srs.next_items(n, filters, user_id=_partition(user_id))
+    active = get_graph_store(user_id).first_node('active')
+    active_topic = topic_index.normalize_key(target_topic_of(active)) if active else None
+    for item in items:
+        item['graph_active'] = active_topic is not None and topic_index.normalize_key(item['title']) == active_topic
+    return items
+
+def get_daily_metrics(user_id=DEFAULT_USER):
     """Calcula las métricas de progreso para el dashboard y Telegram."""
-    if not os.path.exists(GRAPH_PATH):
-        return None
-    
-    with open(GRAPH_PATH, 'r') as f:
-        graph = json.load(f)
+    store = get_graph_store(user_id)
     
-    total_possible = 126 * 3
-    current_mastery = sum(n.get('mastery_level', 0) for n in graph.get('nodes', []))
+    total_possible = store.count_nodes() * MASTERY_GOAL
+    current_mastery = store.total_mastery()
     pending = total_possible - current_mastery
     
     today = datetime.now()
@@ -30,136 +155,123 @@ def get_daily_metrics():
     
     daily_goal = math.ceil(pending / days_left)
     
-    done_today = 0
+    review_metrics = {"done_today": 0, "done_week": 0, "streak_days": 0}
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT count(*) FROM progress WHERE last_reviewed LIKE ?", (f"{today.strftime('%Y-%m-%d')}%",))
-        done_today = c.fetchone()[0]
-        conn.close()
+        review_metrics = agent_srs.get_review_metrics(today.date(), user_id=_partition(user_id))
     except Exception as e:
         print(f"⚠️ Error SQLite Metrics: {e}")
     
     return {
         "daily_goal": daily_goal,
-        "done_today": done_today,
+        "done_today": review_metrics["done_today"],
+        "done_week": review_metrics["done_week"],
+        "streak_days": review_metrics["streak_days"],
         "pending_total": pending,
         "days_left": days_left,
         "current_mastery": current_mastery,
-        "total_possible": total_possible
+        "total_possible": total_possible,
+        "challenge_pool": get_challenge_pool().stats()
     }
 
-def process_review(topic_label, rating):
-    """Procesa una respuesta (EASY/HARD) y actualiza Grafo + SQLite."""
+def process_review(topic_label, rating, latency_ms=None, client='dashboard', user_id=DEFAULT_USER):
+    """Procesa una respuesta (EASY/HARD) y actualiza Grafo + SQLite del usuario."""
     print(f"⚙️ [CORE] Procesando Review: {topic_label} | {rating}")
     
-    # 1. Actualizar Grafo JSON
-    if os.path.exists(GRAPH_PATH):
-        with open(GRAPH_PATH, 'r') as f:
-            graph = json.load(f)
-        
-        active_node = None
-        for node in graph['nodes']:
-            cleaned_label = node['label'].replace('\n', ' ').strip()
-            if node['group'] == 'active' and (cleaned_label == topic_label or node['label'].strip() == topic_label):
-                active_node = node
-                break
-        
-        if active_node:
-            current_m = active_node.get('mastery_level', 0)
-            if rating == 'EASY':
-                active_node['mastery_level'] = current_m + 1
-            
-            with open(GRAPH_PATH, 'w') as f:
-                json.dump(graph, f, indent=4)
-        else:
-            print(f"  ⚠️ No se encontró el nodo activo en el grafo para: {topic_label}")
+    # 1. Actualizar Grafo (una sola fila)
+    store = get_graph_store(user_id)
+    active_node = store.find_node(topic_label, group='active')
+    
+    if active_node:
+        if rating == 'EASY':
+            store.increment_mastery(active_node['id'])
+    else:
+        print(f"  ⚠️ No se encontró el nodo activo en el grafo para: {topic_label}")
 
     # 2. Actualizar SQLite SRS
     try:
         srs_rating = 4 if rating == 'EASY' else 2
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        search_title = topic_label.replace('\n', ' ').strip()
-        c.execute('SELECT id FROM topics WHERE title = ? OR title LIKE ?', (search_title, f"%{search_title}%"))
-        row = c.fetchone()
-        if row:
-            agent_srs.update_progress(row[0], srs_rating)
-            print(f"  💾 SQLite Sync OK para ID: {row[0]}")
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        topic = topic_index.resolve_topic(topic_label, conn)
         conn.close()
+        if topic:
+            agent_srs.update_progress(topic['id'], srs_rating, latency_ms=latency_ms, client=client,
+                                      user_id=_partition(user_id))
+            print(f"  💾 SQLite Sync OK para ID: {topic['id']}")
     except Exception as e:
         print(f"  ⚠️ Error SQLite Sync: {e}")
     
     # 3. Invalidar Sesión Actual (Forzar nuevo reto)
-    if os.path.exists(SESSION_PATH):
-        try:
-            os.remove(SESSION_PATH)
+    try:
+        if clear_session(user_id):
             print("  🗑️ [CORE] Sesión previa eliminada.")
-        except Exception as e:
-            print(f"  ⚠️ Error eliminando sesión: {e}")
+    except Exception as e:
+        print(f"  ⚠️ Error eliminando sesión: {e}")
+    
+    # El siguiente reto probablemente cambió de nivel/nodo: despertar al worker
+    _kick_pool_worker()
             
     return True
 
-def get_or_generate_challenge():
-    """Obtiene el reto actual o genera el siguiente si es necesario."""
+def get_or_generate_challenge(user_id=DEFAULT_USER):
+    """Obtiene el reto actual o el siguiente (banco de preguntas -> pool -> LLM)."""
     # 1. Cargar Grafo
-    if not os.path.exists(GRAPH_PATH):
-        return None
-        
-    with open(GRAPH_PATH, 'r') as f:
-        graph = json.load(f)
-    
-    # 2. Buscar nodo activo o activar siguiente
-    current_node = next((n for n in graph['nodes'] if n['group'] == 'active'), None)
-    
-    if current_node:
-        mastery = current_node.get('mastery_level', 0)
-        if mastery >= 3:
-            current_node['group'] = 'mastered'
-            current_node['title'] = "🏆 DOMINADO"
-            current_node = None
-            
-    if not current_node:
-        current_node = next((n for n in graph['nodes'] if n['group'] == 'locked'), None)
-        if current_node:
-            current_node['group'] = 'active'
-            current_node['title'] = "⚠️ OBJETIVO ACTUAL"
-            current_node['mastery_level'] = 0
-            with open(GRAPH_PATH, 'w') as f:
-                json.dump(graph, f, indent=4)
+    store = get_graph_store(user_id)
+    
+    # 2. Buscar nodo activo o activar siguiente (atómico entre procesos)
+    current_node = store.advance_active(MASTERY_GOAL)
     
     if not current_node:
         return {"status": "completed", "message": "¡Felicidades! Todo el calendario está dominado."}
     
-    target_topic = current_node['label'].replace('\n', ' ').strip()
+    target_topic = target_topic_of(current_node)
     m_level = current_node.get('mastery_level', 0)
     
     # 3. Generar Desafío si no hay sesión actual válida para este tema/nivel
-    if os.path.exists(SESSION_PATH):
-        with open(SESSION_PATH, 'r') as f:
-            session = json.load(f)
-            # Si el reto en disco coincide con el actual, devolverlo
-            if session.get('target_topic') == target_topic and session.get('m_level') == m_level:
-                return session
+    session = read_session(user_id)
+    # Si el reto en disco coincide con el actual, devolverlo
+    if session and session.get('target_topic') == target_topic and session.get('m_level') == m_level:
+        return session
     
-    # De lo contrario, generar nuevo
-    angles = ["Diagnosis", "Treatment", "Trap"]
-    current_angle = angles[min(m_level, 2)]
+    # De lo contrario, tomarlo del pool (pre-generado y compartido: solo si este
+    # usuario no lo vio hace poco) o buscarlo/generarlo para él
+    provider = challenge_provider.get_provider(DB_PATH)
+    session_data = get_challenge_pool().pop(
+        target_topic, m_level, accept=lambda c: not provider.seen_recently(c.get('question_id'), user_id))
+    if session_data:
+        print(f"⚡ [CORE] Reto servido desde el pool: {target_topic} (nivel {m_level})")
+    else:
+        session_data = generate_challenge(target_topic, m_level, user_id)
+    _kick_pool_worker()
     
-    nb = NotebookAdapter()
-    res = nb.resolve_topic_acronym(target_topic)
-    full_t = res.get('full_title', target_topic)
-    ctx = res.get('context', f'Guía clínica sobre {target_topic}.')
+    if session_data:
+        # La exposición cuenta cuando el reto se muestra, no cuando el pool lo prepara
+        provider.mark_seen(session_data.get('question_id'), user_id)
+        write_session(user_id, session_data)
+        return session_data
     
-    gemini = GeminiAdapter()
-    session_data = gemini.generate_clinical_challenge(target_topic, full_t, ctx, angle=current_angle)
+    return None
+
+def generate_challenge(target_topic, m_level, user_id=DEFAULT_USER):
+    """Reto de un tema para un nivel de maestría: primero una pregunta del banco
+    que user_id no vio, si no hay, NotebookLM + Gemini. (El worker del pool usa el
+    usuario por defecto; al servir se vuelve a comprobar la exposición.)"""
+    current_angle = ANGLES[min(m_level, len(ANGLES) - 1)]
+
+    def generate():
+        nb = NotebookAdapter()
+        res = nb.resolve_topic_acronym(target_topic)
+        full_t = res.get('full_title', target_topic)
+        ctx = res.get('context', f'Guía clínica sobre {target_topic}.')
+
+        from gemini_adapter import GeminiAdapter  # solo el camino de generación necesita el SDK
+        gemini = GeminiAdapter()
+        return gemini.generate_clinical_challenge(target_topic, full_t, ctx, angle=current_angle)
+
+    session_data = challenge_provider.get_provider(DB_PATH).get_challenge(target_topic, current_angle, generate, user_id,
+                                                                           mark=False)
     
     if session_data:
         session_data['target_topic'] = target_topic
         session_data['m_level'] = m_level
-        session_data['mode'] = f"Dr. Epi | MAESTRÍA {m_level+1}/3"
-        with open(SESSION_PATH, 'w') as f:
-            json.dump(session_data, f)
-        return session_data
-    
-    return None
+        session_data['mode'] = f"Dr. Epi | MAESTRÍA {m_level+1}/{MASTERY_GOAL}"
+    return session_data
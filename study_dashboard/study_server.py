@@ -2,6 +2,7 @@ import sys
 import os
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 import json
+from urllib.parse import urlparse, parse_qs
 from datetime import datetime
 
 # Agregar el directorio raíz al path para importar herramientas locales
@@ -27,9 +28,10 @@ class StudyHandler(SimpleHTTPRequestHandler):
                 data = json.loads(post_data)
                 topic_label = data.get('topic', '').strip()
                 rating = data.get('rating', 'HARD')
+                latency_ms = data.get('latency_ms')
                 
                 # Usar el CORE para procesar la respuesta
-                study_core.process_review(topic_label, rating)
+                study_core.process_review(topic_label, rating, latency_ms=latency_ms, client='dashboard')
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
@@ -59,13 +61,8 @@ class StudyHandler(SimpleHTTPRequestHandler):
     def do_GET(self):
         if self.path == '/graph_data':
             try:
-                # Usar el CORE para obtener métricas y cargar el grafo
-                graph_path = study_core.GRAPH_PATH
-                if not os.path.exists(graph_path):
-                    graph = {"nodes": [], "edges": []}
-                else:
-                    with open(graph_path, 'r') as f:
-                        graph = json.load(f)
+                # Usar el CORE para obtener métricas y cargar el grafo (SQLite)
+                graph = study_core.load_graph()
                 
                 # Inyectar métricas desde el CORE
                 graph['metrics'] = study_core.get_daily_metrics()
@@ -79,6 +76,23 @@ class StudyHandler(SimpleHTTPRequestHandler):
                 print(f"❌ Error graph_data: {e}")
                 self.send_error(500)
 
+        elif self.path.startswith('/queue'):
+            try:
+                # /queue?n=20&types=review,new -> cola SRS compartida (agent_srs.next_items)
+                query = parse_qs(urlparse(self.path).query)
+                n = int(query.get('n', ['20'])[0])
+                filters = {"types": query['types'][0].split(',')} if 'types' in query else None
+                items = study_core.get_study_queue(n, filters)
+                
+                self.send_response(200)
+                self.send_header('Content-type', 'application/json')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                self.wfile.write(json.dumps({"items": items}).encode())
+            except Exception as e:
+                print(f"❌ Error /queue: {e}")
+                self.send_error(500)
+
         elif self.path in ['/current_session', '/current_session.json']:
             try:
                 # Intentar obtener el reto actual del CORE (lo carga de disco o lo genera)
@@ -102,6 +116,7 @@ class StudyHandler(SimpleHTTPRequestHandler):
 if __name__ == '__main__':
     # Configurar directorio de trabajo
     os.chdir(os.path.dirname(os.path.abspath(__file__)) + '/..')
+    study_core.start_challenge_worker()
     server = HTTPServer(('', PORT), StudyHandler)
     print(f"✅ Servidor iniciado en puerto {PORT}")
     server.serve_forever()
@@ -1,18 +1,28 @@
 import os
 import json
 import asyncio
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes
 from dotenv import load_dotenv
 import study_core
+import study_async
 
 # Cargar variables de entorno
 load_dotenv()
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Chat que conserva el progreso original (grafo/progress/current_session.json del usuario por defecto)
+OWNER_CHAT_ID = os.getenv("BOT_OWNER_CHAT_ID")
+
+def user_of(chat_id):
+    """Estudiante (partición de grafo, SRS y sesión) de un chat."""
+    if OWNER_CHAT_ID and str(chat_id) == OWNER_CHAT_ID:
+        return study_core.DEFAULT_USER
+    return f"tg:{chat_id}"
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /start: Bienvenida y estado actual."""
-    metrics = study_core.get_daily_metrics()
+    metrics = await study_async.get_daily_metrics(user_of(update.effective_chat.id))
     msg = (
         "🚀 **Bienvenido al Sistema CORTEX Mobile**\n\n"
         f"📊 **Misión de Hoy**: {metrics['done_today']} / {metrics['daily_goal']}\n"
@@ -24,16 +34,29 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def mision(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /mision: Ver métricas detalladas."""
-    metrics = study_core.get_daily_metrics()
+    metrics = await study_async.get_daily_metrics(user_of(update.effective_chat.id))
     msg = (
         "📊 **ESTADO DE LA MISIÓN**\n"
         f"✅ Hechas hoy: {metrics['done_today']}\n"
         f"🎯 Meta diaria: {metrics['daily_goal']}\n"
+        f"📅 Últimos 7 días: {metrics['done_week']}\n"
+        f"🔥 Racha: {metrics['streak_days']} días\n"
         f"📚 Pendientes totales: {metrics['pending_total']}\n"
         f"🗓️ Días restantes: {metrics['days_left']}"
     )
     await update.message.reply_text(msg, parse_mode="Markdown")
 
+async def cola(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /cola [n]: Próximos temas del SRS (misma cola que la web y el dashboard)."""
+    n = int(context.args[0]) if context.args and context.args[0].isdigit() else 10
+    items = await study_async.get_study_queue(min(n, 30), user_id=user_of(update.effective_chat.id))
+    if not items:
+        await update.message.reply_text("🎉 No hay temas pendientes.")
+        return
+    icons = {"review": "🔁", "learning": "📖", "new": "🆕"}
+    lines = [f"{icons.get(i['type'], '•')} {i['title']}" + (" ⚠️" if i['graph_active'] else "") for i in items]
+    await update.message.reply_text("🗂️ PRÓXIMOS TEMAS\n" + "\n".join(lines))
+
 def escape_markdown(text):
     """Escapa caracteres que rompen el Markdown de Telegram (V2)."""
     # Para MarkdownV2, la lista es larga. 
@@ -54,7 +77,10 @@ async def execute_reto_flow(update_or_query, context: ContextTypes.DEFAULT_TYPE)
 
         await messenger.reply_text("🧠 Dr. Epi está analizando las guías... espera un momento.")
         
-        challenge = study_core.get_or_generate_challenge()
+        # Generación en el executor; un clic repetido en el mismo chat espera al anterior
+        user_id = user_of(messenger.chat_id)
+        async with study_async.chat_lock(messenger.chat_id):
+            challenge = await study_async.get_or_generate_challenge(user_id)
         
         if not challenge:
             await messenger.reply_text("❌ No se pudo generar el reto. Intenta de nuevo.")
@@ -81,9 +107,8 @@ async def execute_reto_flow(update_or_query, context: ContextTypes.DEFAULT_TYPE)
         
         reply_markup = InlineKeyboardMarkup([keyboard_row])
         
-        context.user_data['correct_answer'] = challenge['correct_answer']
-        context.user_data['explanation'] = challenge['explanation']
-        context.user_data['topic'] = challenge['target_topic']
+        # Respuesta/explicación ya están en la sesión del usuario (persistente); solo falta el instante
+        await study_async.update_session(user_id, shown_at=time.time())
         
         # Intentar enviar con Markdown, si falla, enviar texto plano para no bloquear
         try:
@@ -114,24 +139,22 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if data.startswith("ans_"):
         user_ans = data.split("_")[1]
         
-        # Intentar obtener del user_data
-        correct_ans = context.user_data.get('correct_answer')
-        explanation = context.user_data.get('explanation')
-        topic = context.user_data.get('topic')
-        
-        # Fallback: Si se reinició el bot, intentar cargar de current_session.json
-        if not correct_ans and os.path.exists(study_core.SESSION_PATH):
-            print("  🔄 [BOT] Re-sincronizando estado desde JSON (bot restart detected)")
-            with open(study_core.SESSION_PATH, 'r') as f:
-                session = json.load(f)
-                correct_ans = session.get('correct_answer')
-                explanation = session.get('explanation')
-                topic = session.get('target_topic')
+        # Sesión del usuario (caché LRU en memoria; sobrevive a reinicios del bot)
+        user_id = user_of(query.message.chat_id)
+        session = await study_async.read_session(user_id) or {}
+        correct_ans = session.get('correct_answer')
+        explanation = session.get('explanation')
+        topic = session.get('target_topic')
         
         if not correct_ans:
             await query.message.reply_text("⚠️ Sesión expirada. Por favor usa /reto de nuevo.")
             return
 
+        # Latencia de respuesta (reto mostrado -> respuesta) para review_log
+        shown_at = session.get('shown_at')
+        await study_async.update_session(user_id, shown_at=None,
+                                         latency_ms=int((time.time() - shown_at) * 1000) if shown_at else None)
+
         if user_ans == correct_ans:
             result = f"✅ **¡CORRECTO!** (Opción {user_ans})\n\n{explanation}"
         else:
@@ -180,10 +203,14 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             rating = parts[1]
             topic = parts[2]
             
-            print(f"  💾 [BOT] Registrando SRS: {topic} | {rating}")
-            study_core.process_review(topic, rating)
+            user_id = user_of(query.message.chat_id)
             
-            metrics = study_core.get_daily_metrics()
+            print(f"  💾 [BOT] Registrando SRS: {topic} | {rating} ({user_id})")
+            async with study_async.chat_lock(query.message.chat_id):
+                session = await study_async.read_session(user_id) or {}
+                await study_async.process_review(topic, rating, latency_ms=session.get('latency_ms'), client='telegram',
+                                                 user_id=user_id)
+                metrics = await study_async.get_daily_metrics(user_id)
             
             # Notificar éxito y disparar el siguiente reto automáticamente
             await query.edit_message_text(text=f"✅ **SRS Actualizado ({rating})**\nSiguiente meta diaria: {metrics['done_today']}/{metrics['daily_goal']}")
@@ -195,16 +222,51 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             print(f"  ❌ Error SRS Handler: {e}")
 
+def build_application(token=None, request=None):
+    """Application con todos los handlers (polling, webhook o el arnés local).
+
+    request: BaseRequest alternativo (telegram_harness usa uno falso, sin red).
+    """
+    # concurrent_updates: a slow generation in one chat no longer holds the
+    # update queue for the others (per-chat order comes from study_async.chat_lock)
+    builder = ApplicationBuilder().token(token or TOKEN).concurrent_updates(True)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    app = builder.build()
+    
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("mision", mision))
+    app.add_handler(CommandHandler("reto", reto))
+    app.add_handler(CommandHandler("cola", cola))
+    app.add_handler(CallbackQueryHandler(button_handler))
+    return app
+
 if __name__ == "__main__":
+    # Usage:
+    #   python telegram_bot.py                         (long polling)
+    #   python telegram_bot.py --webhook [--port 8443] (ASGI; TELEGRAM_WEBHOOK_URL para registrarlo)
+    #   o dentro de app.py si TELEGRAM_WEBHOOK_URL está definido
+    import argparse
+    parser = argparse.ArgumentParser(description="Bot de Telegram CORTEX")
+    parser.add_argument("--webhook", action="store_true", help="servir un webhook ASGI en vez de polling")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8443)
+    args = parser.parse_args()
     if not TOKEN:
         print("❌ Error: TELEGRAM_BOT_TOKEN no configurado en el entorno.")
     else:
-        app = ApplicationBuilder().token(TOKEN).build()
+        app = build_application()
+        study_core.setup_storage()
         
-        app.add_handler(CommandHandler("start", start))
-        app.add_handler(CommandHandler("mision", mision))
-        app.add_handler(CommandHandler("reto", reto))
-        app.add_handler(CallbackQueryHandler(button_handler))
+        # Pre-generación de retos en segundo plano
+        study_core.start_challenge_worker()
         
-        print("🤖 Bot de Telegram en marcha...")
-        app.run_polling()
+        if args.webhook:
+            import uvicorn
+            import telegram_webhook
+            print(f"🤖 Bot de Telegram (webhook) en {args.host}:{args.port}{telegram_webhook.WEBHOOK_PATH}")
+            uvicorn.run(telegram_webhook.create_app(app), host=args.host, port=args.port)
+        else:
+            print("🤖 Bot de Telegram en marcha...")
+            app.run_polling()
+        study_async.shutdown(wait=False)
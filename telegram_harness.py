@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import shutil
+import random
+import asyncio
+import argparse
+import tempfile
+import telegram
+from telegram.request import BaseRequest
+import agent_srs
+import study_core
+import study_async
+import telegram_bot
+import telegram_webhook
+
+# Arnés local: un "Telegram" falso (sin red) + el WebhookDispatcher real, para
+# medir la latencia de punta a punta de los handlers con updates grabados o
+# con conversaciones simuladas (/reto -> respuesta -> EASY/HARD).
+# Requiere python-telegram-bot==22.8: FakeTelegram implementa los miembros
+# abstractos de BaseRequest de esa versión (cambian entre releases).
+
+PTB_VERSION = "22.8"
+TEST_TOKEN = "123456:HARNESS"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "CORTEX", "username": "cortex_harness_bot"}
+
+class FakeTelegram(BaseRequest):
+    """BaseRequest that answers Bot API calls locally and records them.
+
+    api_delay_ms simulates the round trip to api.telegram.org.
+    """
+
+    def __init__(self, api_delay_ms=0):
+        self.api_delay_ms = api_delay_ms
+        self.calls = [] # (perf_counter, endpoint, params)
+        self._message_id = 1000
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None # no network: the default read timeout never applies
+
+    def _message(self, params, **extra):
+        self._message_id += 1
+        message = {"message_id": params.get('message_id') or self._message_id, "date": int(time.time()),
+                   "chat": {"id": int(params.get('chat_id') or 0), "type": "private"}, "from": BOT_USER}
+        if params.get('text'):
+            message['text'] = params['text']
+        if params.get('reply_markup'):
+            markup = params['reply_markup']
+            message['reply_markup'] = json.loads(markup) if isinstance(markup, str) else markup
+        message.update(extra)
+        return message
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if self.api_delay_ms:
+            await asyncio.sleep(self.api_delay_ms / 1000)
+        self.calls.append((time.perf_counter(), endpoint, params))
+        if endpoint == 'getMe':
+            result = BOT_USER
+        elif endpoint in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup'):
+            result = self._message(params)
+        else: # answerCallbackQuery, setWebhook, deleteWebhook, ...
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def keyboards(self, chat_id):
+        """callback_data of the inline buttons the bot sent to a chat, newest first."""
+        out = []
+        for _, endpoint, params in reversed(self.calls):
+            if endpoint == 'sendMessage' and int(params.get('chat_id') or 0) == chat_id and params.get('reply_markup'):
+                markup = params['reply_markup']
+                markup = json.loads(markup) if isinstance(markup, str) else markup
+                out.append([b.get('callback_data') for row in markup.get('inline_keyboard', []) for b in row])
+        return out
+
+class UpdateFactory:
+    """Minimal Bot API update payloads (private chats)."""
+
+    def __init__(self, start_id=1):
+        self.update_id = start_id
+        self.message_id = 1
+
+    def _next(self):
+        self.update_id += 1
+        self.message_id += 1
+        return self.update_id
+
+    @staticmethod
+    def _user(chat_id):
+        return {"id": chat_id, "is_bot": False, "first_name": f"Estudiante {chat_id}"}
+
+    def command(self, chat_id, text):
+        command = text.split()[0]
+        return {"update_id": self._next(), "message": {
+            "message_id": self.message_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "private"}, "from": self._user(chat_id),
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}]}}
+
+    def click(self, chat_id, data):
+        update_id = self._next()
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "chat_instance": str(chat_id), "data": data, "from": self._user(chat_id),
+            "message": {"message_id": self.message_id, "date": int(time.time()),
+                        "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER, "text": "reto"}}}
+
+def kind_of(payload):
+    if 'callback_query' in payload:
+        return (payload['callback_query'].get('data') or '').split('_')[0] + '_*'
+    return ((payload.get('message') or {}).get('text') or '?').split()[0]
+
+def load_recorded(path):
+    """Updates from a TELEGRAM_RECORD_UPDATES file (or a plain JSONL of updates): [(t, update)]."""
+    out = []
+    with open(path) as f:
+        for i, line in enumerate(f):
+            if line.strip():
+                row = json.loads(line)
+                out.append((row['received_at'], row['update']) if 'update' in row else (float(i), row))
+    return out
+
+def isolate(db_path, workdir, gen_ms=None):
+    """Points study_core at a copy of the database (the replay writes progress).
+
+    gen_ms: replace the LLM with a fixed challenge that takes gen_ms (None = real generation).
+    """
+    study_core.DB_PATH = os.path.join(workdir, 'temario.db')
+    study_core.SESSION_PATH = os.path.join(workdir, 'current_session.json')
+    agent_srs.DB_PATH = study_core.DB_PATH
+    if os.path.exists(db_path):
+        shutil.copy(db_path, study_core.DB_PATH)
+    study_core.setup_storage()
+    if gen_ms is not None:
+        def fake_generate(target_topic, m_level, user_id=None):
+            time.sleep(gen_ms / 1000)
+            return {"type": "selection", "content": f"Caso clínico de prueba sobre {target_topic}",
+                    "options": ["A) Opción uno", "B) Opción dos", "C) Opción tres", "D) Opción cuatro"],
+                    "correct_answer": "A", "explanation": "Explicación de prueba.", "question_id": None,
+                    "target_topic": target_topic, "m_level": m_level,
+                    "mode": f"Dr. Epi | MAESTRÍA {m_level+1}/{study_core.MASTERY_GOAL}"}
+        study_core.generate_challenge = fake_generate
+
+class Harness:
+    def __init__(self, workers=telegram_webhook.UPDATE_WORKERS, queue_size=telegram_webhook.QUEUE_SIZE, api_delay_ms=0):
+        self.fake = FakeTelegram(api_delay_ms)
+        self.application = telegram_bot.build_application(TEST_TOKEN, request=self.fake)
+        deduper = telegram_webhook.UpdateDeduper(study_core.DB_PATH)
+        self.dispatcher = telegram_webhook.WebhookDispatcher(self.application, workers, queue_size, deduper, record_path=None)
+        self.samples = [] # (kind, end_to_end_ms)
+        self._pending = {}
+        self.dispatcher.on_done = self._done
+
+    def _done(self, payload, wait_ms, handler_ms):
+        self.samples.append((kind_of(payload), wait_ms + handler_ms))
+        event = self._pending.pop(payload['update_id'], None)
+        if event:
+            event.set()
+
+    async def send(self, payload, wait=False):
+        """Submits like the webhook route would; with wait, returns once the handler finished."""
+        event = asyncio.Event() if wait else None
+        if event:
+            self._pending[payload['update_id']] = event
+        status = await self.dispatcher.submit(payload)
+        if event and status == 'queued':
+            await event.wait()
+        else:
+            self._pending.pop(payload['update_id'], None)
+        return status
+
+    async def conversation(self, factory, chat_id, rounds, think_ms=0):
+        """/reto, then clicks the first answer and EASY, like a student would."""
+        await self.send(factory.command(chat_id, "/reto"), wait=True)
+        for _ in range(rounds):
+            answer = next((d for kb in self.fake.keyboards(chat_id) for d in kb if d and d.startswith('ans_')), None)
+            if not answer:
+                return
+            await asyncio.sleep(think_ms / 1000)
+            await self.send(factory.click(chat_id, answer), wait=True)
+            rate = next((d for kb in self.fake.keyboards(chat_id) for d in kb if d and d.startswith('srs_EASY')), None)
+            if not rate:
+                return
+            await self.send(factory.click(chat_id, rate), wait=True) # also sends the next /reto flow
+
+    async def replay(self, recorded, speed=0.0):
+        """Submits recorded updates keeping their relative timing divided by speed (0 = no waits)."""
+        start, first = time.perf_counter(), recorded[0][0] if recorded else 0
+        for t, payload in recorded:
+            if speed:
+                delay = (t - first) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await self.send(payload)
+
+    def report(self, elapsed):
+        by_kind = {}
+        for kind, ms in self.samples:
+            by_kind.setdefault(kind, []).append(ms)
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "dispatcher": self.dispatcher.stats(),
+            "api_calls": len(self.fake.calls),
+            "end_to_end_ms": {k: {"n": len(v), "p50": telegram_webhook.percentile(v, 0.5),
+                                  "p95": telegram_webhook.percentile(v, 0.95), "max": telegram_webhook.percentile(v, 1.0)}
+                              for k, v in sorted(by_kind.items())}
+        }
+
+async def run(args):
+    harness = Harness(args.workers, args.queue, args.api_ms)
+    await harness.dispatcher.start()
+    start = time.perf_counter()
+    try:
+        if args.replay:
+            recorded = load_recorded(args.replay)
+            if args.duplicates:
+                rng = random.Random(0)
+                recorded += [r for r in recorded if rng.random() < args.duplicates] # Telegram re-deliveries
+            await harness.replay(recorded, args.speed)
+        else:
+            factory = UpdateFactory(start_id=int(time.time()))
+            await asyncio.gather(*(harness.conversation(factory, 900000 + i, args.rounds, args.think_ms)
+                                   for i in range(args.chats)))
+        await harness.dispatcher.queue.join()
+    finally:
+        elapsed = time.perf_counter() - start
+        await harness.dispatcher.stop()
+        study_async.shutdown()
+    return harness.report(elapsed)
+
+if __name__ == "__main__":
+    # Usage:
+    #   python telegram_harness.py --chats 20 --rounds 3 --gen-ms 1500    (conversaciones simuladas)
+    #   python telegram_harness.py --replay updates.jsonl --speed 10       (updates grabados con TELEGRAM_RECORD_UPDATES)
+    parser = argparse.ArgumentParser(description="Arnés local del bot (Telegram falso + webhook dispatcher)")
+    parser.add_argument("--replay", help="JSONL de updates grabados")
+    parser.add_argument("--speed", type=float, default=0.0, help="factor de tiempo del replay (0 = sin esperas)")
+    parser.add_argument("--duplicates", type=float, default=0.0, help="fracción de updates re-enviados (prueba de dedup)")
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--think-ms", type=int, default=0, help="pausa del estudiante antes de cada clic")
+    parser.add_argument("--workers", type=int, default=telegram_webhook.UPDATE_WORKERS)
+    parser.add_argument("--queue", type=int, default=telegram_webhook.QUEUE_SIZE)
+    parser.add_argument("--api-ms", type=int, default=0, help="latencia simulada de la Bot API")
+    parser.add_argument("--gen-ms", type=int, default=800, help="duración del LLM simulado (-1 = generación real)")
+    parser.add_argument("--db", default=study_core.DB_PATH, help="base copiada a un directorio temporal")
+    args = parser.parse_args()
+    if telegram.__version__ != PTB_VERSION:
+        print(f"⚠️ telegram_harness está probado con python-telegram-bot=={PTB_VERSION} (instalado: {telegram.__version__})")
+    with tempfile.TemporaryDirectory() as workdir:
+        isolate(args.db, workdir, None if args.gen_ms < 0 else args.gen_ms)
+        print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from collections import OrderedDict, deque
+from fastapi import FastAPI, HTTPException, Request
+from telegram import Update
+
+DB_PATH = 'temario.db'
+
+WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")        # public https URL (without the path)
+WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")  # checked against X-Telegram-Bot-Api-Secret-Token
+UPDATE_WORKERS = int(os.getenv("TELEGRAM_UPDATE_WORKERS", "32")) # asyncio tasks; blocking work is bounded by study_async
+QUEUE_SIZE = int(os.getenv("TELEGRAM_QUEUE_SIZE", "256")) # full queue -> 503, Telegram retries later
+DEDUP_MEMORY = 4096      # update_ids remembered in process
+DEDUP_KEEP_DAYS = 2      # Telegram stops retrying long before this
+RECORD_PATH = os.getenv("TELEGRAM_RECORD_UPDATES") # optional JSONL of raw updates (replayed by telegram_harness)
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 1)
+
+class UpdateDeduper:
+    """Drops updates Telegram re-delivers (timeouts, restarts, several instances).
+
+    Recent update_ids are checked in memory first; telegram_updates in
+    temario.db (INSERT OR IGNORE on the primary key) makes the check hold
+    across processes behind the same webhook.
+    """
+
+    def __init__(self, db_path=DB_PATH, memory=DEDUP_MEMORY):
+        self.db_path = db_path
+        self.memory = memory
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self.setup_db()
+
+    def setup_db(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('''CREATE TABLE IF NOT EXISTS telegram_updates (
+            update_id INTEGER PRIMARY KEY,
+            received_at TEXT NOT NULL
+        )''')
+        cutoff = (datetime.now() - timedelta(days=DEDUP_KEEP_DAYS)).isoformat()
+        conn.execute('DELETE FROM telegram_updates WHERE received_at < ?', (cutoff,))
+        conn.commit()
+        conn.close()
+
+    def seen(self, update_id):
+        with self._lock:
+            return update_id in self._recent
+
+    def claim(self, update_id):
+        """Records the update; False if it was already claimed (here or by another instance)."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        claimed = conn.execute('INSERT OR IGNORE INTO telegram_updates (update_id, received_at) VALUES (?, ?)',
+                               (update_id, datetime.now().isoformat())).rowcount == 1
+        conn.commit()
+        conn.close()
+        with self._lock:
+            self._recent[update_id] = True
+            while len(self._recent) > self.memory:
+                self._recent.popitem(last=False)
+        return claimed
+
+class WebhookDispatcher:
+    """Bounded queue + fixed worker tasks between the webhook and the bot handlers.
+
+    submit() answers immediately ('queued' / 'duplicate' / 'full'), so Telegram
+    never waits on a Gemini call; the workers run application.process_update().
+    Per-chat ordering is kept by study_async.chat_lock inside the handlers.
+    """
+
+    def __init__(self, application, workers=UPDATE_WORKERS, queue_size=QUEUE_SIZE, deduper=None, record_path=RECORD_PATH):
+        self.application = application
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.deduper = deduper or UpdateDeduper()
+        self.record_path = record_path
+        self._tasks = []
+        self._reserved = 0 # slots held by submits waiting on the dedup claim
+        self.counts = {"queued": 0, "duplicate": 0, "full": 0, "failed": 0, "done": 0}
+        self.latency = deque(maxlen=2000) # (queue_wait_ms, handler_ms)
+        self.on_done = None # optional fn(payload, queue_wait_ms, handler_ms), used by telegram_harness
+
+    async def start(self):
+        await self.application.initialize()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"tg-update-{i}") for i in range(max(1, self.workers))]
+
+    async def stop(self):
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.application.shutdown()
+
+    async def submit(self, payload):
+        update_id = payload.get('update_id')
+        if update_id is None or self.deduper.seen(update_id):
+            self.counts['duplicate'] += 1
+            return 'duplicate'
+        if self.queue.qsize() + self._reserved >= self.queue.maxsize:
+            self.counts['full'] += 1
+            return 'full' # not claimed: Telegram's retry will be accepted
+        self._reserved += 1
+        try:
+            if not await asyncio.to_thread(self.deduper.claim, update_id):
+                self.counts['duplicate'] += 1
+                return 'duplicate'
+            if self.record_path:
+                await asyncio.to_thread(self._record, payload)
+        finally:
+            self._reserved -= 1
+        self.queue.put_nowait((time.perf_counter(), payload))
+        self.counts['queued'] += 1
+        return 'queued'
+
+    def _record(self, payload):
+        with open(self.record_path, 'a') as f:
+            f.write(json.dumps({"received_at": time.time(), "update": payload}, ensure_ascii=False) + "\n")
+
+    async def _worker(self):
+        while True:
+            queued_at, payload = await self.queue.get()
+            started = time.perf_counter()
+            try:
+                update = Update.de_json(payload, self.application.bot)
+                await self.application.process_update(update)
+                self.counts['done'] += 1
+            except Exception as e:
+                self.counts['failed'] += 1
+                print(f"  ❌ [WEBHOOK] Error procesando update {payload.get('update_id')}: {e}")
+            finally:
+                wait_ms, handler_ms = (started - queued_at) * 1000, (time.perf_counter() - started) * 1000
+                self.latency.append((wait_ms, handler_ms))
+                if self.on_done:
+                    self.on_done(payload, wait_ms, handler_ms)
+                self.queue.task_done()
+
+    def stats(self):
+        waits = [w for w, _ in self.latency]
+        handlers = [h for _, h in self.latency]
+        return dict(self.counts, queue_depth=self.queue.qsize(), workers=self.workers,
+                    wait_p50_ms=percentile(waits, 0.5), wait_p95_ms=percentile(waits, 0.95),
+                    handler_p50_ms=percentile(handlers, 0.5), handler_p95_ms=percentile(handlers, 0.95),
+                    handler_max_ms=percentile(handlers, 1.0))
+
+def attach(app, application, path=WEBHOOK_PATH, url=WEBHOOK_URL, secret=WEBHOOK_SECRET, **dispatcher_kwargs):
+    """Adds the webhook route (+ startup/shutdown hooks) to a FastAPI app.
+
+    Call it before mounting catch-all routes (app.py mounts static files at '/').
+    With url set, the webhook is registered with Telegram on startup.
+    """
+    dispatcher = WebhookDispatcher(application, **dispatcher_kwargs)
+
+    @app.post(path)
+    async def telegram_webhook(request: Request):
+        if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            raise HTTPException(status_code=403, detail="bad secret token")
+        status = await dispatcher.submit(await request.json())
+        if status == 'full':
+            raise HTTPException(status_code=503, detail="update queue full")
+        return {"ok": True, "status": status}
+
+    @app.get(path + "/stats")
+    def telegram_webhook_stats():
+        return dispatcher.stats()
+
+    async def startup():
+        await dispatcher.start()
+        if url:
+            await application.bot.set_webhook(url.rstrip('/') + path, secret_token=secret,
+                                              allowed_updates=["message", "callback_query"])
+            print(f"🔗 [WEBHOOK] Registrado en Telegram: {url.rstrip('/') + path}")
+
+    app.add_event_handler("startup", startup)
+    app.add_event_handler("shutdown", dispatcher.stop)
+    return dispatcher
+
+def create_app(application, **kwargs):
+    """Standalone ASGI app with only the webhook (python telegram_bot.py --webhook)."""
+    app = FastAPI()
+    attach(app, application, **kwargs)
+    return app
@@ -0,0 +1,127 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+
+import agent_srs
+import challenge_provider
+import state_store
+import study_core
+from graph_store import GraphStore
+
+PROCESSES = 6
+REVIEWS_PER_PROCESS = 25
+TOPIC = "Dengue Grave"
+
+def _configure(workdir):
+    study_core.DB_PATH = os.path.join(workdir, 'temario.db')
+    study_core.GRAPH_PATH = os.path.join(workdir, 'graph_data.json')
+    study_core.SESSION_PATH = os.path.join(workdir, 'current_session.json')
+    agent_srs.DB_PATH = study_core.DB_PATH
+
+def _seed(workdir):
+    _configure(workdir)
+    conn = sqlite3.connect(study_core.DB_PATH)
+    conn.execute('CREATE TABLE topics (id INTEGER PRIMARY KEY, title TEXT UNIQUE, priority INTEGER)')
+    conn.execute('CREATE TABLE angles (id INTEGER PRIMARY KEY, topic_id INTEGER, angle_name TEXT, variant TEXT)')
+    conn.execute('INSERT INTO topics (title, priority) VALUES (?, 90)', (TOPIC,))
+    conn.commit()
+    conn.close()
+    agent_srs.setup_db()
+    graph = {
+        "nodes": [
+            {"id": 1, "label": "Dengue\nGrave", "group": "active", "title": "⚠️ OBJETIVO ACTUAL", "mastery_level": 0},
+            {"id": 2, "label": "Asma (MART)", "group": "locked", "title": "Bloqueado"}
+        ],
+        "edges": [{"from": 1, "to": 2}]
+    }
+    with open(study_core.GRAPH_PATH, 'w') as f:
+        json.dump(graph, f)
+    GraphStore(study_core.DB_PATH, study_core.GRAPH_PATH)
+
+def _hammer(workdir):
+    """One client process: alternates session writes/reads with EASY reviews."""
+    _configure(workdir)
+    for i in range(REVIEWS_PER_PROCESS):
+        state_store.write_json(study_core.SESSION_PATH, {"target_topic": TOPIC, "m_level": i, "content": "x" * 4096})
+        session = state_store.read_json(study_core.SESSION_PATH, default={})
+        assert isinstance(session, dict)
+        study_core.process_review(TOPIC, 'EASY')
+    return REVIEWS_PER_PROCESS
+
+def run_stress(workdir):
+    _seed(workdir)
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(PROCESSES) as pool:
+        done = sum(pool.map(_hammer, [workdir] * PROCESSES))
+
+    _configure(workdir)
+    node = GraphStore(study_core.DB_PATH, study_core.GRAPH_PATH).get_node(1)
+    return done, node['mastery_level']
+
+def test_concurrent_reviews_keep_every_mastery_increment():
+    with tempfile.TemporaryDirectory() as workdir:
+        done, mastery = run_stress(workdir)
+        assert done == PROCESSES * REVIEWS_PER_PROCESS
+        assert mastery == done
+
+def test_users_keep_separate_graph_progress_and_session():
+    with tempfile.TemporaryDirectory() as workdir:
+        _seed(workdir)
+        assert study_core.get_graph_store('tg:1').advance_active()['id'] == 1 # new students start at the root
+        study_core.write_session('tg:1', {"target_topic": TOPIC, "m_level": 0})
+        for _ in range(2):
+            study_core.process_review(TOPIC, 'EASY', user_id='tg:1')
+        assert study_core.get_graph_store('tg:1').find_node(TOPIC)['mastery_level'] == 2
+        assert study_core.get_graph_store().get_node(1)['mastery_level'] == 0
+        assert study_core.read_session('tg:1') is None
+        assert study_core.get_daily_metrics('tg:2')['done_today'] == 0
+        conn = sqlite3.connect(study_core.DB_PATH)
+        assert conn.execute('SELECT COUNT(*) FROM progress').fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM user_progress WHERE user_id = 'tg:1'").fetchone()[0] == 1
+        conn.execute("UPDATE graph_nodes SET grp = 'mastered' WHERE id = 2") # default user's frontier only
+        conn.commit()
+        assert study_core.get_graph_store().leaves() == []
+        assert [n['id'] for n in study_core.get_graph_store('tg:1').leaves()] == [2]
+        conn.close()
+
+def test_pool_keeps_slots_of_every_active_user():
+    with tempfile.TemporaryDirectory() as workdir:
+        _seed(workdir)
+        study_core.get_graph_store().advance_active()
+        for _ in range(3):
+            study_core.process_review(TOPIC, 'EASY')
+        study_core.get_graph_store().advance_active() # default user moves on to Asma
+        study_core.get_graph_store('tg:1').advance_active()
+        study_core.write_session('tg:1', {"target_topic": TOPIC, "m_level": 0})
+        slots = study_core._pool_slots()
+        assert ("Asma (MART)", 0) in slots and (TOPIC, 1) in slots
+        assert (TOPIC, 0) not in slots # already in tg:1's session
+        pool = study_core.get_challenge_pool()
+        assert pool.claim(TOPIC, 1)
+        pool.fulfil(TOPIC, 1, {"content": "x"})
+        assert pool.prune(slots) == 0
+        assert pool.pop(TOPIC, 1) == {"content": "x"}
+
+def test_pool_never_serves_a_question_the_student_just_saw(monkeypatch):
+    with tempfile.TemporaryDirectory() as workdir:
+        _seed(workdir)
+        generated = []
+        monkeypatch.setattr(study_core, 'generate_challenge',
+                            lambda topic, level, user_id: generated.append(user_id) or {"question_id": None})
+        pool = study_core.get_challenge_pool()
+        assert pool.claim(TOPIC, 0)
+        pool.fulfil(TOPIC, 0, {"question_id": 7, "target_topic": TOPIC, "m_level": 0})
+        challenge_provider.get_provider(study_core.DB_PATH).mark_seen(7, 'tg:1')
+        for user_id in ('tg:1', 'tg:2'):
+            study_core.get_graph_store(user_id).advance_active()
+        assert study_core.get_or_generate_challenge('tg:1')['question_id'] is None # pool copy skipped
+        assert generated == ['tg:1']
+        assert study_core.get_or_generate_challenge('tg:2')['question_id'] == 7
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as workdir:
+        done, mastery = run_stress(workdir)
+        print(f"Reviews enviadas: {done} | Maestría registrada: {mastery}")
+        print("✅ Sin incrementos perdidos" if done == mastery else "❌ Se perdieron incrementos")
@@ -0,0 +1,149 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+import scheduler
+from scheduler import AGAIN, HARD, GOOD, EASY, MIN_EASE, MAX_EASE, MAX_INTERVAL
+
+CASES = 20000
+
+def _legacy_agent_srs(interval, ease, rating):
+    """SM-2 as agent_srs.update_progress implemented it before scheduler.py."""
+    if rating == 1:
+        return 0, max(1.3, ease - 0.2), 'learning'
+    if rating == 2:
+        return (1 if interval == 0 else math.floor(interval * 1.2)), max(1.3, ease - 0.15), 'review'
+    if rating == 3:
+        return (1 if interval == 0 else 3 if interval == 1 else math.floor(interval * ease)), ease, 'review'
+    return (2 if interval == 0 else 4 if interval == 1 else math.floor(interval * ease * 1.3)), min(3.0, ease + 0.15), 'review'
+
+def _random_states(n, seed=7):
+    rng = random.Random(seed)
+    return [(rng.choice([0, 1, rng.randint(2, 30), rng.randint(2, 5000)]),
+             round(rng.uniform(MIN_EASE, MAX_EASE), 2),
+             rng.choice(scheduler.RATINGS)) for _ in range(n)]
+
+def test_matches_legacy_agent_srs():
+    for interval, ease, rating in _random_states(CASES):
+        new_interval, new_ease, status = scheduler.schedule(interval, ease, rating)
+        old_interval, old_ease, old_status = _legacy_agent_srs(interval, ease, rating)
+        assert (min(old_interval, MAX_INTERVAL), old_ease, old_status) == (new_interval, new_ease, status)
+
+def test_batch_equals_scalar():
+    states = _random_states(CASES, seed=11)
+    intervals, eases, ratings = (list(col) for col in zip(*states))
+    batch_i, batch_e = scheduler.schedule_many(intervals, eases, ratings)
+    for k, (interval, ease, rating) in enumerate(states):
+        new_interval, new_ease, _ = scheduler.schedule(interval, ease, rating)
+        assert batch_i[k] == new_interval
+        assert batch_e[k] == new_ease
+
+def test_ease_stays_in_bounds_over_long_histories():
+    rng = random.Random(3)
+    for _ in range(200):
+        interval, ease = 0, scheduler.DEFAULT_EASE
+        for _ in range(60):
+            interval, ease, _ = scheduler.schedule(interval, ease, rng.choice(scheduler.RATINGS))
+            assert MIN_EASE <= ease <= MAX_EASE
+            assert 0 <= interval <= MAX_INTERVAL
+
+def test_better_rating_never_gives_shorter_interval():
+    for interval, ease, _ in _random_states(CASES, seed=5):
+        got = [scheduler.schedule(interval, ease, r)[0] for r in (AGAIN, HARD, GOOD, EASY)]
+        assert got == sorted(got)
+
+def test_success_never_shrinks_interval():
+    for interval, ease, rating in _random_states(CASES, seed=9):
+        if rating != AGAIN:
+            assert scheduler.schedule(interval, ease, rating)[0] >= min(interval, MAX_INTERVAL)
+
+def test_lapse_resets_to_learning():
+    for interval, ease, _ in _random_states(1000, seed=13):
+        new_interval, _, status = scheduler.schedule(interval, ease, AGAIN)
+        assert (new_interval, status) == (0, 'learning')
+        assert scheduler.days_until_due(new_interval) == 1
+
+def test_interval_is_capped():
+    new_interval, _, _ = scheduler.schedule(MAX_INTERVAL, MAX_EASE, EASY)
+    assert new_interval == MAX_INTERVAL
+    batch_i, _ = scheduler.schedule_many([MAX_INTERVAL], [MAX_EASE], [EASY])
+    assert batch_i[0] == MAX_INTERVAL
+
+def test_missing_state_defaults_to_new_card():
+    assert scheduler.schedule(None, None, GOOD) == (1, scheduler.DEFAULT_EASE, 'review')
+
+def test_invalid_rating_rejected():
+    with pytest.raises(ValueError):
+        scheduler.schedule(3, 2.5, 5)
+    with pytest.raises(ValueError):
+        scheduler.schedule_many(np.array([3]), np.array([2.5]), np.array([0]))
+
+def test_sm2_review_interface_matches_schedule():
+    state = {"interval": 10, "ease_factor": 2.5, "stability": None, "difficulty": None}
+    out = scheduler.review(state, GOOD)
+    assert (out["interval"], out["ease_factor"], out["status"]) == scheduler.schedule(10, 2.5, GOOD)
+    assert scheduler.review(None, AGAIN)["interval"] == 0
+
+def test_fsrs_successive_recalls_grow_stability():
+    import datetime
+    import fsrs
+    now = datetime.datetime(2026, 1, 1)
+    state = fsrs.review({}, GOOD, now, w=fsrs.DEFAULT_W)
+    intervals = [state["interval"]]
+    for _ in range(5):
+        now += datetime.timedelta(days=state["interval"])
+        state = fsrs.review(dict(state, last_reviewed=(now - datetime.timedelta(days=state["interval"])).isoformat()),
+                            GOOD, now, w=fsrs.DEFAULT_W)
+        intervals.append(state["interval"])
+    assert intervals == sorted(intervals) and intervals[-1] > intervals[0]
+    lapse = fsrs.review(dict(state, last_reviewed=now.isoformat()), AGAIN, now, w=fsrs.DEFAULT_W)
+    assert lapse["stability"] < state["stability"] and lapse["status"] == 'learning'
+    assert 1 <= lapse["difficulty"] <= 10
+
+def test_fsrs_fit_improves_log_loss_on_synthetic_history():
+    import fsrs
+    data, _ = fsrs.synthetic_history(200, seed=1)
+    w, loss = fsrs.fit(data, steps=10)
+    assert loss <= fsrs.log_loss(fsrs.DEFAULT_W, data)
+    assert np.all(w >= fsrs.W_LOWER) and np.all(w <= fsrs.W_UPPER)
+
+def test_fsrs_histories_are_kept_per_student():
+    import sqlite3
+    import fsrs
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE review_log (angle_id INTEGER, reviewed_at TEXT, rating INTEGER, user_id TEXT)')
+    conn.executemany('INSERT INTO review_log VALUES (1, ?, ?, ?)', [
+        ('2026-01-01T10:00:00', GOOD, None), ('2026-01-02T10:00:00', AGAIN, 'tg:1'),
+        ('2026-01-05T10:00:00', GOOD, None), ('2026-01-06T10:00:00', GOOD, 'tg:1')])
+    ratings, elapsed, mask, keys = fsrs.load_histories(conn)
+    assert set(keys) == {(None, 1), ('tg:1', 1)}
+    row = keys.index(('tg:1', 1))
+    assert list(ratings[row]) == [AGAIN, GOOD] and elapsed[row, 1] == 4
+
+def test_update_progress_many_matches_sequential_updates(tmp_path, monkeypatch):
+    import sqlite3
+    import agent_srs
+    rng = random.Random(1)
+    ratings = [(rng.randint(1, 30), rng.choice(scheduler.RATINGS)) for _ in range(300)]
+    outcomes = []
+    for mode in ('single', 'many'):
+        monkeypatch.setattr(agent_srs, 'DB_PATH', str(tmp_path / f'{mode}.db'))
+        conn = sqlite3.connect(agent_srs.DB_PATH)
+        conn.execute('CREATE TABLE topics (id INTEGER PRIMARY KEY, title TEXT UNIQUE, priority INTEGER)')
+        conn.execute('CREATE TABLE angles (id INTEGER PRIMARY KEY, topic_id INTEGER, angle_name TEXT, variant TEXT)')
+        conn.executemany('INSERT INTO topics VALUES (?, ?, 50)', [(i, f'T{i}') for i in range(1, 31)])
+        conn.commit()
+        conn.close()
+        agent_srs.setup_db()
+        if mode == 'single':
+            intervals = [agent_srs.update_progress(t, r)['new_interval'] for t, r in ratings]
+        else:
+            intervals = [res['new_interval'] for res in agent_srs.update_progress_many(ratings)]
+        conn = agent_srs.get_conn()
+        rows = [tuple(r) for r in conn.execute('SELECT angle_id, status, interval, ease_factor FROM progress ORDER BY angle_id')]
+        logged = conn.execute('SELECT COUNT(*), SUM(rating) FROM review_log').fetchone()
+        conn.close()
+        outcomes.append((intervals, rows, tuple(logged)))
+    assert outcomes[0] == outcomes[1]
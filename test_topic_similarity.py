@@ -0,0 +1,20 @@
+from topic_similarity import SimilarityIndex, markers
+
+SYLLABUS = [(1, "Diabetes tipo 1"), (2, "Hepatitis B"), (3, "Insuficiencia cardíaca con FEVI reducida"),
+            (4, "Clasificación TNM del cáncer de pulmón"), (5, "Hepatitis A")]
+
+def test_numbers_and_letters_are_markers():
+    assert markers("Diabetes tipo 2") == {"2"}
+    assert markers("Hepatitis A") == {"a"}
+    assert markers("Estadio III de la ERC") == {"iii"}
+    assert markers("Sepsis y shock séptico") == set()
+
+def test_variants_that_differ_in_a_number_or_letter_are_not_merged():
+    index = SimilarityIndex(SYLLABUS)
+    for title in ["Diabetes tipo 2", "Hepatitis C", "Hepatitis E"]:
+        assert index.check(title)[0] == 'near'
+
+def test_rewordings_still_merge():
+    index = SimilarityIndex(SYLLABUS)
+    assert index.check("Diabetes Tipo 1")[0] == 'merged'
+    assert index.check("Insuficiencia cardiaca con FEVI reducida")[0] == 'merged'
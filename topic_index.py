@@ -0,0 +1,183 @@
+import os
+import re
+import sqlite3
+import sys
+import json
+import random
+import tempfile
+import threading
+import time
+import unicodedata
+
+DB_PATH = 'temario.db'
+
+_ready = set()
+_ready_lock = threading.Lock() # first calls can come from several threads (simulacro prefetch)
+
+def normalize_key(text):
+    """Lookup key for topic titles: accent-stripped, lowercased, whitespace-collapsed.
+
+    'Falla Cardíaca\\n(4 Fantásticos)' -> 'falla cardiaca (4 fantasticos)'
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.lower().split())
+
+def base_key(key):
+    """Key without parenthesized suffixes: 'asma (mart)' -> 'asma'."""
+    return ' '.join(re.sub(r'\([^)]*\)?', ' ', key).split())
+
+def get_conn(db_path=None):
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def ensure_index(conn):
+    """Adds topics.norm_title (+ index), the FTS5 trigram table and backfills new rows.
+
+    Rows inserted by code that doesn't know about norm_title (NULL) are filled
+    lazily here; the sync triggers keep topics_fts aligned with topics.
+    """
+    db_key = conn.execute('PRAGMA database_list').fetchone()[2]
+    c = conn.cursor()
+    if db_key not in _ready:
+        with _ready_lock:
+            if db_key not in _ready:
+                _create_index(c)
+                conn.commit()
+                _ready.add(db_key)
+
+    if _backfill(c):
+        conn.commit()
+
+def _create_index(c):
+    columns = [r[1] for r in c.execute('PRAGMA table_info(topics)')]
+    if 'norm_title' not in columns:
+        c.execute('ALTER TABLE topics ADD COLUMN norm_title TEXT')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_topics_norm_title ON topics(norm_title)')
+    _backfill(c)
+    fts_exists = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'topics_fts'").fetchone()
+    if not fts_exists:
+        c.execute('''CREATE VIRTUAL TABLE topics_fts USING fts5(
+            norm_title, content='topics', content_rowid='id', tokenize='trigram'
+        )''')
+        c.execute("INSERT INTO topics_fts(topics_fts) VALUES ('rebuild')")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS topics_fts_ai AFTER INSERT ON topics BEGIN
+        INSERT INTO topics_fts(rowid, norm_title) VALUES (new.id, new.norm_title);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS topics_fts_ad AFTER DELETE ON topics BEGIN
+        INSERT INTO topics_fts(topics_fts, rowid, norm_title) VALUES ('delete', old.id, old.norm_title);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS topics_fts_au AFTER UPDATE OF norm_title ON topics BEGIN
+        INSERT INTO topics_fts(topics_fts, rowid, norm_title) VALUES ('delete', old.id, old.norm_title);
+        INSERT INTO topics_fts(rowid, norm_title) VALUES (new.id, new.norm_title);
+    END''')
+
+def _backfill(c):
+    pending = c.execute('SELECT id, title FROM topics WHERE norm_title IS NULL').fetchall()
+    c.executemany('UPDATE topics SET norm_title = ? WHERE id = ?',
+                  [(normalize_key(title), topic_id) for topic_id, title in pending])
+    return len(pending)
+
+def resolve_topic(text, conn=None):
+    """Single entry point to map any label/title/user input to a topics row.
+
+    1. exact normalized key (index seek)
+    2. key without parenthesized suffix ('Asma\\n(MART)' -> 'asma')
+    3. FTS5 trigram match, best bm25 then closest length
+    Returns {"id", "title"} or None.
+    """
+    own_conn = conn is None
+    conn = conn or get_conn()
+    try:
+        ensure_index(conn)
+        key = normalize_key(text)
+        if not key:
+            return None
+        c = conn.cursor()
+
+        for candidate in dict.fromkeys([key, base_key(key)]):
+            if not candidate:
+                continue
+            row = c.execute('SELECT id, title FROM topics WHERE norm_title = ? ORDER BY id LIMIT 1', (candidate,)).fetchone()
+            if row:
+                return {"id": row[0], "title": row[1]}
+
+        for candidate in dict.fromkeys([key, base_key(key)]):
+            if len(candidate) < 3:
+                continue
+            phrase = '"' + candidate.replace('"', '""') + '"'
+            row = c.execute('''
+                SELECT t.id, t.title FROM topics_fts f
+                JOIN topics t ON t.id = f.rowid
+                WHERE topics_fts MATCH ?
+                ORDER BY bm25(topics_fts), abs(length(t.norm_title) - ?)
+                LIMIT 1
+            ''', (phrase, len(candidate))).fetchone()
+            if row:
+                return {"id": row[0], "title": row[1]}
+        return None
+    finally:
+        if own_conn:
+            conn.close()
+
+def resolve_topic_id(text, conn=None):
+    row = resolve_topic(text, conn)
+    return row['id'] if row else None
+
+def benchmark(n_topics=10000, n_queries=2000):
+    """Compares resolve_topic against the legacy 'title = ? OR title LIKE %x%' lookup."""
+    words = ["Síndrome", "Falla", "Cardíaca", "Neumonía", "Dengue", "Crónica", "Aguda", "Pediátrica",
+             "Hemorragia", "Obstétrica", "Diabetes", "Renal", "Hepática", "Tóxica", "Séptica", "Úlcera"]
+    rng = random.Random(42)
+    titles = list(dict.fromkeys(
+        f"{' '.join(rng.sample(words, 3))} {i}" + (f" ({rng.choice(words)})" if i % 3 == 0 else "")
+        for i in range(n_topics)
+    ))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = get_conn(os.path.join(tmp, 'bench.db'))
+        conn.execute('CREATE TABLE topics (id INTEGER PRIMARY KEY, title TEXT UNIQUE, priority INTEGER)')
+        conn.executemany('INSERT INTO topics (title, priority) VALUES (?, 50)', [(t,) for t in titles])
+        conn.commit()
+        start = time.perf_counter()
+        ensure_index(conn)
+        build_s = time.perf_counter() - start
+
+        sample = rng.sample(titles, min(n_queries, len(titles)))
+        # Graph-style labels: accents dropped, upper-case, newline before the suffix
+        queries = [normalize_key(t).upper().replace(' (', '\n(') for t in sample]
+
+        start = time.perf_counter()
+        hits = sum(1 for q, t in zip(queries, sample) if (resolve_topic(q, conn) or {}).get('title') == t)
+        resolve_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        legacy_hits = 0
+        for q, t in zip(queries, sample):
+            search = q.replace('\n', ' ').strip()
+            row = conn.execute('SELECT title FROM topics WHERE title = ? OR title LIKE ?', (search, f"%{search}%")).fetchone()
+            legacy_hits += 1 if row and row['title'] == t else 0
+        legacy_s = time.perf_counter() - start
+        conn.close()
+
+    return {
+        "topics": len(titles),
+        "queries": len(queries),
+        "index_build_ms": round(build_s * 1000, 1),
+        "resolve_us_per_query": round(resolve_s / len(queries) * 1e6, 1),
+        "resolve_accuracy": round(hits / len(queries), 3),
+        "legacy_like_us_per_query": round(legacy_s / len(queries) * 1e6, 1),
+        "legacy_like_accuracy": round(legacy_hits / len(queries), 3)
+    }
+
+if __name__ == "__main__":
+    # Usage:
+    #   python topic_index.py resolve "Falla Cardíaca (4 Fantásticos)"
+    #   python topic_index.py bench [n_topics]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'bench'
+    if command == 'resolve':
+        print(json.dumps(resolve_topic(sys.argv[2]), ensure_ascii=False))
+    elif command == 'bench':
+        n = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+        print(json.dumps(benchmark(n), indent=2))
@@ -0,0 +1,206 @@
+import os
+import re
+import sys
+import json
+import math
+import time
+import sqlite3
+import datetime
+from collections import Counter
+import topic_index
+
+DB_PATH = 'temario.db'
+
+# Coseno TF-IDF sobre trigramas de caracteres (por palabra, sin orden): local, sin red
+DUPLICATE_THRESHOLD = float(os.getenv("TOPIC_DUP_THRESHOLD", "0.82")) # >= : same topic, merged into the existing one
+REVIEW_THRESHOLD = 0.6 # >= : kept, but listed in the audit as a near-duplicate
+STOPWORDS = {"de", "del", "la", "las", "el", "los", "en", "y", "e", "o", "u", "con", "por", "para", "a", "al", "un", "una"}
+ROMAN = {"i", "ii", "iii", "iv", "v", "vi", "vii", "viii", "ix", "x"}
+
+def tokens(title):
+    """Normalized words without stopwords/punctuation: 'Clasificación TNM' -> ['clasificacion', 'tnm']."""
+    words = re.sub(r'[^a-z0-9ñ ]+', ' ', topic_index.normalize_key(title)).split()
+    return [w for w in words if w not in STOPWORDS]
+
+def markers(title):
+    """Numbers, roman numerals and single letters: 'Diabetes tipo 2' -> {'2'}, 'Hepatitis A' -> {'a'}.
+
+    They carry almost no n-gram weight but name different entities (tipo 1/2,
+    hepatitis B/C, estadio II/III), so titles that differ in them never merge.
+    A stopword letter (a, e, o, y, u) only counts as the last word.
+    """
+    words = re.sub(r'[^a-z0-9ñ ]+', ' ', topic_index.normalize_key(title)).split()
+    return {w for i, w in enumerate(words)
+            if any(ch.isdigit() for ch in w) or w in ROMAN
+            or (len(w) == 1 and (w not in STOPWORDS or i == len(words) - 1))}
+
+def grams(title, n=3):
+    """Bag of character n-grams of each word (padded), so word order doesn't matter."""
+    out = Counter()
+    for word in tokens(title):
+        padded = f" {word} "
+        if len(padded) <= n:
+            out[padded] += 1
+        else:
+            out.update(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return out
+
+class SimilarityIndex:
+    """In-memory TF-IDF index over topic titles with an inverted n-gram index.
+
+    Candidates come from the postings of the query's rarer half of n-grams
+    (a title similar enough to matter always shares some of them), then the
+    exact cosine is computed only for those, instead of comparing against the
+    whole syllabus. IDF is computed when the index is built; titles added
+    later reuse it (unknown n-grams get the maximum IDF).
+    """
+
+    def __init__(self, titles=()):
+        self.titles = {}   # id -> title
+        self.vectors = {}  # id -> {gram: weight}
+        self.postings = {} # gram -> [id]
+        titles = list(titles)
+        df = Counter()
+        for _, title in titles:
+            df.update(set(grams(title)))
+        n = max(len(titles), 1)
+        self.idf = {g: math.log((1 + n) / (1 + d)) + 1 for g, d in df.items()}
+        self.max_idf = math.log(1 + n) + 1
+        for topic_id, title in titles:
+            self.add(topic_id, title)
+
+    def _vector(self, title):
+        vec = {g: (1 + math.log(tf)) * self.idf.get(g, self.max_idf) for g, tf in grams(title).items()}
+        norm = math.sqrt(sum(w * w for w in vec.values())) or 1.0
+        return {g: w / norm for g, w in vec.items()}
+
+    def add(self, topic_id, title):
+        self.titles[topic_id] = title
+        self.vectors[topic_id] = vec = self._vector(title)
+        for g in vec:
+            self.postings.setdefault(g, []).append(topic_id)
+
+    def query(self, title, k=1):
+        """Top-k (id, title, cosine) among indexed titles."""
+        qvec = self._vector(title)
+        present = sorted((g for g in qvec if g in self.postings), key=lambda g: len(self.postings[g]))
+        candidates = set()
+        for g in present[:max(3, (len(present) + 1) // 2)]:
+            candidates.update(self.postings[g])
+        scores = Counter()
+        for topic_id in candidates:
+            vec = self.vectors[topic_id]
+            scores[topic_id] = sum(w * vec.get(g, 0.0) for g, w in qvec.items())
+        return [(topic_id, self.titles[topic_id], round(score, 4)) for topic_id, score in scores.most_common(k)]
+
+    def check(self, title, threshold=DUPLICATE_THRESHOLD):
+        """('new' | 'near' | 'merged', best match or None).
+
+        A match above threshold whose markers() differ is only 'near'.
+        """
+        best = self.query(title, 1)
+        if not best:
+            return 'new', None
+        score = best[0][2]
+        if score >= threshold and markers(title) == markers(best[0][1]):
+            return 'merged', best[0]
+        return ('near' if score >= REVIEW_THRESHOLD else 'new'), best[0]
+
+def load_index(db_path=DB_PATH, conn=None):
+    """Index over every title in topics."""
+    own = conn is None
+    conn = conn or sqlite3.connect(db_path, timeout=30)
+    rows = conn.execute('SELECT id, title FROM topics').fetchall()
+    if own:
+        conn.close()
+    return SimilarityIndex(rows)
+
+def setup_audit(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS topic_dedup_audit (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT NOT NULL,
+        suggested TEXT NOT NULL,
+        parent TEXT,
+        matched_topic_id INTEGER,
+        matched_title TEXT,
+        score REAL,
+        action TEXT NOT NULL -- merged, near
+    )''')
+
+def log_decisions(decisions, db_path=DB_PATH):
+    """Stores merged/near decisions [{"suggested", "parent", "action", "match"}] in one batch."""
+    rows = [(datetime.datetime.now().isoformat(), d['suggested'], d.get('parent'),
+             d['match'][0], d['match'][1], d['match'][2], d['action'])
+            for d in decisions if d['action'] in ('merged', 'near')]
+    if not rows:
+        return 0
+    conn = sqlite3.connect(db_path, timeout=30)
+    setup_audit(conn)
+    conn.executemany('''
+        INSERT INTO topic_dedup_audit (created_at, suggested, parent, matched_topic_id, matched_title, score, action)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+def audit_report(db_path=DB_PATH, limit=50):
+    """Recent dedup decisions plus totals per action."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    setup_audit(conn)
+    totals = dict(conn.execute('SELECT action, COUNT(*) FROM topic_dedup_audit GROUP BY action').fetchall())
+    recent = [dict(r) for r in conn.execute('SELECT * FROM topic_dedup_audit ORDER BY id DESC LIMIT ?', (limit,))]
+    conn.close()
+    return {"totals": totals, "recent": recent}
+
+def scan_syllabus(db_path=DB_PATH, threshold=DUPLICATE_THRESHOLD):
+    """Near-duplicate pairs already in topics (each title against the ones before it)."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    rows = conn.execute('SELECT id, title FROM topics ORDER BY id').fetchall()
+    conn.close()
+    full = SimilarityIndex(rows)
+    index = SimilarityIndex()
+    index.idf, index.max_idf = full.idf, full.max_idf
+    pairs = []
+    for topic_id, title in rows:
+        for other_id, other_title, score in index.query(title, 3):
+            if score >= threshold:
+                pairs.append({"id": topic_id, "title": title, "duplicate_of": other_id,
+                              "duplicate_title": other_title, "score": score})
+        index.add(topic_id, title)
+    return pairs
+
+def benchmark(n_topics=5000, n_queries=1000):
+    """Index build time and lookup latency on synthetic titles."""
+    import random
+    rng = random.Random(0)
+    words = [''.join(rng.choice("abcdefghilmnoprstuv") for _ in range(rng.randint(4, 11))) for _ in range(3000)]
+    titles = [(i, ' '.join(rng.choice(words) for _ in range(rng.randint(2, 4)))) for i in range(n_topics)]
+    start = time.perf_counter()
+    index = SimilarityIndex(titles)
+    build_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for i in range(n_queries):
+        index.query(titles[i % n_topics][1])
+    query_us = (time.perf_counter() - start) / n_queries * 1e6
+    return {"topics": n_topics, "build_ms": round(build_ms, 1), "query_us": round(query_us, 1)}
+
+if __name__ == "__main__":
+    # Usage:
+    #   python topic_similarity.py check "<título>"
+    #   python topic_similarity.py scan [threshold]   (near-duplicados ya presentes en topics)
+    #   python topic_similarity.py audit               (decisiones de expand_graph)
+    #   python topic_similarity.py bench
+    command = sys.argv[1] if len(sys.argv) > 1 else 'audit'
+    if command == 'check' and len(sys.argv) > 2:
+        action, match = load_index().check(sys.argv[2])
+        print(json.dumps({"action": action, "match": match}, ensure_ascii=False))
+    elif command == 'scan':
+        pairs = scan_syllabus(threshold=float(sys.argv[2]) if len(sys.argv) > 2 else DUPLICATE_THRESHOLD)
+        print(json.dumps(pairs, ensure_ascii=False, indent=2))
+        print(f"🔁 {len(pairs)} posibles duplicados en topics")
+    elif command == 'bench':
+        print(json.dumps(benchmark(), indent=2))
+    else:
+        print(json.dumps(audit_report(), ensure_ascii=False, indent=2))